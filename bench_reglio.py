@@ -0,0 +1,380 @@
+"""Benchmarks for reglio's hot paths
+
+Synthetic payee databases, batches and virement ledgers are generated at each
+requested size (1k to 1M rows), every benchmark reports per-item timings, and
+results are written as JSON so two runs can be compared:
+
+    python bench_reglio.py -o before.json
+    python bench_reglio.py -o after.json
+    python bench_reglio.py --compare before.json after.json
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import reglio
+
+DEFAULT_SIZES = "1000,10000,100000"
+
+# Syllables for payee names, with accents so normalization is exercised
+PREFIXES = ("Société", "Ets", "Cabinet", "Atelier", "Groupe", "Comptoir", "Garage", "Pharmacie")
+WORDS = ("Atlas", "Andalous", "Oasis", "Médina", "Kasbah", "Zénith", "Cèdre", "Sahara",
+         "Océan", "Rif", "Souss", "Tafilalet", "Jardins", "Étoile", "Horizon", "Palmier")
+SUFFIXES = ("SARL", "SA", "& Fils", "Frères", "Maroc", "Services", "Distribution", "")
+CITIES = ("Casablanca", "Rabat", "Fès", "Marrakech", "Tanger", "Agadir", "Meknès", "Oujda")
+BANKS = ("BMCE", "Attijariwafa", "BCP", "CIH", "Société Générale", "Crédit Agricole")
+BANK_CODES = {"BMCE": "011", "Attijariwafa": "007", "BCP": "145", "CIH": "230", "Société Générale": "022",
+              "Crédit Agricole": "225"}
+
+
+def make_rib(rng, bank):
+    """Synthetic RIB with the bank's code and a valid mod-97 key"""
+    digits = f"{BANK_CODES[bank]}{rng.randrange(10**3):03d}{rng.randrange(10**16):016d}"
+    return f"{digits}{97 - int(digits) * 100 % 97:02d}"
+
+
+def make_payees(n, seed=1):
+    """Synthetic payee table: (name, rib, bank, city) rows with unique names"""
+    rng = random.Random(seed)
+    payees = []
+    for i in range(n):
+        bank = rng.choice(BANKS)
+        payees.append((f"{rng.choice(PREFIXES)} {rng.choice(WORDS)} {rng.choice(WORDS)} {i} {rng.choice(SUFFIXES)}".strip(),
+                       make_rib(rng, bank), bank, rng.choice(CITIES)))
+    return payees
+
+
+def make_amounts(n, seed=2):
+    """Synthetic amounts as the GUI receives them ("1234.56")"""
+    rng = random.Random(seed)
+    return [f"{rng.randrange(1, 10**9) / 100:.2f}" for _ in range(n)]
+
+
+def make_rows(n, seed=3):
+    """Synthetic batch rows (engine row dicts) for rendering"""
+    payees = make_payees(n, seed)
+    amounts = make_amounts(n, seed)
+    return [{"payee": name, "amount": amount, "city": city, "date": "18/10/2026", "rib": rib, "bank": bank,
+             "type": "Ordinaire", "motif": f"Facture {i}", "due_date": "30/11/2026", "edition_date": "18/10/2026"}
+            for i, ((name, rib, bank, city), amount) in enumerate(zip(payees, amounts))]
+
+
+def make_ledger(directory, n, chunk=50000):
+    """Synthetic virement ledger holding n virements numbered 2026/001..."""
+    ledger = reglio.VirementLedger(os.path.join(directory, f"virements_{n}.xlsx"))
+    payees = make_payees(min(n, 10000))
+    for start in range(0, n, chunk):
+        ledger.append([{"virement_num": f"2026/{i + 1:03d}", "payee": payees[i % len(payees)][0],
+                        "amount": "1 234,56", "type": "Ordinaire"}
+                       for i in range(start, min(n, start + chunk))])
+    return ledger
+
+
+def measure(func, items=1, samples=5, min_time=0.2):
+    """Time func: calls are batched until a sample lasts min_time, then samples are repeated
+
+    Returns a result dict with per-call and per-item seconds (median and best).
+    """
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or number >= 1 << 20:
+            break
+        number *= 2 if elapsed <= 0 else max(2, min(10, int(min_time / elapsed) + 1))
+
+    timings = [elapsed / number]
+    for _ in range(samples - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        timings.append((time.perf_counter() - start) / number)
+    median = statistics.median(timings)
+    return {"items": items, "calls": number, "samples": samples, "median_s": median, "best_s": min(timings),
+            "per_item_s": median / items, "items_per_s": items / median if median else None}
+
+
+def cycle(values):
+    """Return a function yielding values round-robin (defeats per-value caches less than random)"""
+    state = {"i": -1}
+
+    def next_value():
+        state["i"] = (state["i"] + 1) % len(values)
+        return values[state["i"]]
+    return next_value
+
+
+def bench_amounts(results, sizes, quick):
+    """Amount parsing, formatting and conversion to words"""
+    amounts = make_amounts(10000)
+    next_amount = cycle(amounts)
+
+    def words_uncached():
+        reglio.centimes_to_words.cache_clear()
+        reglio.amount_to_words(next_amount())
+    results["amount_to_words"] = measure(words_uncached)
+    results["amount_to_words_cached"] = measure(lambda: reglio.amount_to_words(next_amount()))
+    results["format_amount"] = measure(lambda: reglio.format_amount(next_amount()))
+    words = [reglio.amount_to_words(amount) for amount in amounts[:1000]]
+    next_words = cycle(words)
+    engine = reglio.DocumentEngine()
+    engine.refresh_layouts()
+    plans = engine.plans["letter"]
+    slots = tuple((plan.font, plan.size, plan.width) for name, plan in sorted(plans.items())
+                  if name.startswith(reglio.AMOUNT_WORDS_FIELD))
+
+    def fit_uncached():
+        reglio.fit_text.cache_clear()
+        reglio.fit_text(next_words(), slots)
+    results["fit_text"] = measure(fit_uncached)
+    results["fit_text_cached"] = measure(lambda: reglio.fit_text(next_words(), slots))
+    results["text_width"] = measure(lambda: reglio.text_width(next_words(), slots[0][0], 10))
+
+    for n in sizes:
+        column = make_amounts(n)
+        results[f"amounts_to_words[{n}]"] = measure(lambda: reglio.amounts_to_words(column), items=n,
+                                                    samples=3 if quick or n >= 100000 else 5)
+
+
+def bench_render(results, sizes, quick):
+    """Field drawing and headless document rendering"""
+    engine = reglio.DocumentEngine()
+    engine.refresh_layouts()
+    canvas = reglio.canvas.Canvas(io.BytesIO(), pagesize=reglio.PAGE_SIZES["cheque"])
+
+    def draw(text):
+        if len(canvas._code) > 10000:
+            canvas._code = []
+        engine.draw_field(canvas, text, "payee", "cheque")
+    results["draw_field_single_line"] = measure(lambda: draw("Société Atlas Médina SARL"))
+    results["draw_field_wrapped"] = measure(lambda: draw("Société Atlas Médina Cèdre Horizon Distribution "
+                                                         "et Services Généraux du Grand Casablanca SARL"))
+
+    pages = 50 if quick else 200
+    rows = [engine.prepare_row(row) for row in make_rows(pages)]
+    for doc_type in reglio.DOC_TYPES:
+        if doc_type == "virement":
+            rows = [dict(row, virement_num=f"2026/{i + 1:03d}") for i, row in enumerate(rows)]
+        next_row = cycle(rows)
+
+        def fit_page():
+            reglio.fit_text.cache_clear()
+            engine.fit_fields(doc_type, next_row())
+        results[f"fit_fields_{doc_type}"] = measure(fit_page)
+        results[f"render_{doc_type}"] = measure(lambda: engine.render_bytes(doc_type, rows), items=pages,
+                                                samples=3, min_time=0.5)
+
+    with tempfile.TemporaryDirectory() as directory:
+        cache = reglio.DocumentCache(directory)
+        cache.render(engine, "cheque", rows[0])
+        results["document_cache_key"] = measure(lambda: cache.key(engine, "cheque", rows[0]))
+        results["document_cache_hit"] = measure(lambda: cache.render(engine, "cheque", rows[0]))
+        cache.close()
+
+    import pandas as pd
+
+    batch = pd.DataFrame(make_rows(min(max(sizes), 2000 if quick else 10000)))
+    with tempfile.TemporaryDirectory() as out:
+        ledger = reglio.VirementLedger(os.path.join(out, "virements.xlsx"))  # Virement numbers are reserved in it
+        for doc_type in reglio.DOC_TYPES:
+            results[f"generate_batch_{doc_type}[{len(batch)}]"] = measure(
+                lambda: reglio.generate_batch(batch, out, doc_type, engine=engine, ledger=ledger),
+                items=len(batch), samples=1 if quick else 3, min_time=0)
+        ledger.close()
+
+
+def bench_validate(results, sizes, quick):
+    """Pre-flight batch validation (amounts, dates, RIB keys, duplicates)"""
+    row = make_rows(1)[0]
+    results["validate_row"] = measure(lambda: reglio.validate_batch([row], "virement"))
+    for n in sizes:
+        rows = make_rows(n)
+        results[f"validate_batch[{n}]"] = measure(lambda: reglio.validate_batch(rows, "virement"), items=n,
+                                                  samples=1 if quick or n >= 1000000 else 3, min_time=0)
+
+
+def bench_payees(results, sizes, quick):
+    """Payee index build, autocomplete search and detail lookup"""
+    import pandas as pd
+
+    queries = ("soc", "atlas med", "cedre", "1234", "horizon sarl", "étoile", "zz", "ets oasis 9")
+    for n in sizes:
+        payees = make_payees(n)
+        names = [name for name, rib, bank, city in payees]
+        samples = 1 if quick or n >= 1000000 else 3
+        results[f"payee_index_build[{n}]"] = measure(lambda: reglio.PayeeIndex(names), items=n,
+                                                     samples=samples, min_time=0)
+        index = reglio.PayeeIndex(names)
+        next_query = cycle(queries)
+        results[f"payee_search[{n}]"] = measure(lambda: index.search(next_query(), reglio.PAYEE_SUGGESTIONS))
+
+        df = pd.DataFrame(payees, columns=["Nom", "RIB", "Banque", "Ville"])
+        results[f"payee_records_build[{n}]"] = measure(lambda: reglio.PayeeRecords(df), items=n,
+                                                       samples=samples, min_time=0)
+        records = reglio.PayeeRecords(df)
+        lookups = [names[i].upper() for i in range(0, n, max(1, n // 1000))]
+        next_name = cycle(lookups)
+        results[f"payee_lookup[{n}]"] = measure(lambda: records.lookup(next_name()))
+
+
+def bench_ledger(results, sizes, quick):
+    """Virement numbering and journal appends on ledgers of every size"""
+    with tempfile.TemporaryDirectory() as directory:
+        for n in sizes:
+            ledger = make_ledger(directory, n)
+
+            def number_and_append():
+                number, = ledger.reserve(year=2026)
+                ledger.append([{"virement_num": number, "payee": "Bench", "amount": "1 000,00"}])
+            results[f"ledger_last_number[{n}]"] = measure(ledger.last_number)
+            results[f"ledger_reserve[{n}]"] = measure(lambda: ledger.reserve(year=2026), samples=3)
+            results[f"ledger_reserve_block[{n}]"] = measure(lambda: ledger.reserve(100, year=2026), items=100,
+                                                            samples=3)
+            results[f"ledger_number_and_append[{n}]"] = measure(number_and_append, samples=3)
+            ledger.close()
+
+
+def bench_service(results, sizes, quick):
+    """Document service round trips through the local HTTP client"""
+    import concurrent.futures
+    import threading
+
+    service = reglio.DocumentService(workers=min(4, os.cpu_count() or 1))
+    server = service.serve("127.0.0.1", 0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        service.warm_up()
+        client = reglio.ServiceClient(f"http://127.0.0.1:{server.server_address[1]}")
+        rows = make_rows(1000)
+        next_row = cycle(rows)
+        results["service_render_cheque"] = measure(lambda: client.render("cheque", [next_row()]))
+
+        requests = 100 if quick else 500
+        with concurrent.futures.ThreadPoolExecutor(16) as clients:
+            results[f"service_render_concurrent[{requests}]"] = measure(
+                lambda: list(clients.map(lambda row: client.render("cheque", [row]), rows[:requests])),
+                items=requests, samples=3, min_time=0)
+    finally:
+        service.close()
+
+
+BENCHMARKS = {
+    "amounts": bench_amounts,
+    "render": bench_render,
+    "validate": bench_validate,
+    "payees": bench_payees,
+    "ledger": bench_ledger,
+    "service": bench_service,
+}
+
+
+def git_revision():
+    """Current commit (with a + when the tree is dirty), None outside a git checkout"""
+    try:
+        here = os.path.dirname(os.path.abspath(__file__))
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=here,
+                             capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=here,
+                               capture_output=True, text=True).stdout.strip()
+        return rev + ("+" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(sizes, groups, quick):
+    """Run the selected benchmark groups and return the JSON document"""
+    results = {}
+    for group in groups:
+        start = time.perf_counter()
+        BENCHMARKS[group](results, sizes, quick)
+        print(f"{group}: {time.perf_counter() - start:.1f} s", file=sys.stderr)
+    return {
+        "meta": {"revision": git_revision(), "date": datetime.now().isoformat(timespec="seconds"),
+                 "python": platform.python_version(), "platform": platform.platform(),
+                 "cpus": os.cpu_count(), "sizes": sizes, "quick": quick},
+        "results": results,
+    }
+
+
+def format_seconds(seconds):
+    """Human-readable duration"""
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("µs", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.2f} {unit}"
+    return f"{seconds / 1e-9:.0f} ns"
+
+
+def print_table(document):
+    """Print per-item medians"""
+    for name, result in document["results"].items():
+        print(f"{name:45s} {format_seconds(result['per_item_s']):>12s}/item  ({result['items']} item(s)/call)",
+              file=sys.stderr)
+
+
+def compare(before_path, after_path, threshold):
+    """Print per-benchmark ratios; return the names that slowed down by more than threshold"""
+    with open(before_path, encoding="utf-8") as f:
+        before = json.load(f)
+    with open(after_path, encoding="utf-8") as f:
+        after = json.load(f)
+    print(f"{before['meta'].get('revision')} -> {after['meta'].get('revision')}")
+    regressions = []
+    for name, result in after["results"].items():
+        if name not in before["results"]:
+            print(f"{name:45s} {'(new)':>10s}")
+            continue
+        old, new = before["results"][name]["per_item_s"], result["per_item_s"]
+        ratio = new / old if old else float("inf")
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        elif ratio < 1 / (1 + threshold):
+            flag = "  faster"
+        print(f"{name:45s} {format_seconds(old):>12s} -> {format_seconds(new):>12s}  x{ratio:.2f}{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks reglio")
+    parser.add_argument("-o", "--output", help="write JSON results to this file (default: stdout)")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES,
+                        help=f"row counts for sized benchmarks (default {DEFAULT_SIZES}, e.g. add 1000000)")
+    parser.add_argument("--only", default="", help="regex selecting benchmark groups: " + ", ".join(BENCHMARKS))
+    parser.add_argument("--quick", action="store_true", help="fewer samples and pages (smoke run)")
+    parser.add_argument("--compare", nargs=2, metavar=("AVANT", "APRES"), help="compare two JSON result files")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="slowdown ratio reported as a regression by --compare (default 0.25)")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        regressions = compare(*args.compare, args.threshold)
+        return 1 if regressions else 0
+
+    sizes = [int(size) for size in args.sizes.split(",") if size]
+    groups = [group for group in BENCHMARKS if re.search(args.only, group)]
+    document = run(sizes, groups, args.quick)
+    print_table(document)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(document, f, indent=2)
+    else:
+        json.dump(document, sys.stdout, indent=2)
+        print()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
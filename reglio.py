@@ -1,24 +1,3136 @@
+import time
+
+STARTUP_MARKS = [("début", time.perf_counter())]
+
+import argparse
+import io
 import os
+import pickle
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
-from reportlab.lib import colors
+from reportlab import rl_config
 from reportlab.lib.pagesizes import letter, A4
-from reportlab.lib.styles import ParagraphStyle
 from reportlab.lib.units import mm
 from reportlab.pdfgen import canvas
-from reportlab.platypus import Paragraph
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
-import pandas as pd
 from datetime import datetime
-from PIL import Image, ImageTk
 import tempfile
 import subprocess
 import locale
+import platform
+import sqlite3
+import threading
+import queue
+import concurrent.futures
+import contextlib
+import csv
+import bisect
+import heapq
+import collections
+import functools
+import hashlib
+import importlib
+import itertools
+import json
+import re
+import shlex
+import shutil
+import sys
+import unicodedata
+import types
+
+try:
+    import tomllib  # Python 3.11+
+except ImportError:
+    tomllib = None
+
+# pandas, numpy and PIL are imported where they are first
+# needed (or by the GUI's background warm-up) so the window shows first
+
+DOC_TYPES = ("cheque", "virement", "letter")
+
+# Loaded by the GUI in the background once the window is up
+WARM_UP_MODULES = ("pandas", "openpyxl", "PIL.Image", "PIL.ImageTk")
+
+# Keep compressed page streams binary: the pure-Python ASCII85 encoder
+# otherwise dominates per-page save time, and output is ~20% smaller
+rl_config.useA85 = 0
+
+# Characters given fixed codes in every TrueType subset before rendering, so
+# page streams rendered in worker processes can be replayed in another canvas
+FONT_REPERTOIRE = "".join(map(chr, range(32, 127))) + "".join(map(chr, range(0xa1, 0x100))) + "€’‘“”–—…œŒ"
+
+# ReportLab releases (from, up to excluded) whose canvas internals the page merge relies on
+# (page code list, TrueType subset state) and tests/test_render.py checks; others render sequentially
+REPORTLAB_MERGE_VERSIONS = ((4, 0), (5, 1))
+
+# Per-user settings and caches
+REGLIO_HOME = os.environ.get("REGLIO_HOME") or os.path.join(os.path.expanduser("~"), ".reglio")
+PAYEE_CACHE_VERSION = 2
+
+# Stage timings (metrics.jsonl, rotated) and opt-in profiles
+METRICS_MAX_BYTES = 1 << 20
+METRICS_BACKUPS = 3
+
+# Per-bank layout files (<bank>.json or <bank>.toml), see LayoutCache
+LAYOUT_DIR = os.environ.get("REGLIO_LAYOUTS") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "layouts")
+LAYOUT_KEYS = ("x", "y", "max_width", "font", "size", "align")
+
+# Preview images: resolution of the generate preview and of the live tab preview
+PREVIEW_DPI = 100
+LIVE_PREVIEW_DPI = 50
+LIVE_PREVIEW_DELAY_MS = 120
+
+# TrueType files used for preview text when a PDF font is one of the built-in
+# Type 1 fonts (which have no font file): first one found wins
+PREVIEW_FONT_FILES = {
+    "regular": ("arial.ttf", "Arial.ttf", "DejaVuSans.ttf", "LiberationSans-Regular.ttf"),
+    "bold": ("arialbd.ttf", "Arial Bold.ttf", "DejaVuSans-Bold.ttf", "LiberationSans-Bold.ttf"),
+}
+
+# Page backgrounds: Word templates are converted to PDF once per content and cached here;
+# images (and PDF pages when pdfrw is not installed) are encoded once as JPEG at TEMPLATE_DPI
+TEMPLATE_DIR = os.path.join(REGLIO_HOME, "templates")
+TEMPLATE_DPI = 200
+TEMPLATE_JPEG_QUALITY = 90
+WORD_EXTENSIONS = (".docx", ".docm", ".doc", ".odt")
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff")
+
+# Generated documents kept for reprints (see DocumentCache), least recently used evicted first;
+# bump the version when a drawing change makes cached PDFs stale
+DOCUMENT_CACHE_DIR = os.path.join(REGLIO_HOME, "documents")
+DOCUMENT_CACHE_MAX_BYTES = 200 << 20
+DOCUMENT_CACHE_VERSION = 3
+
+# Batches smaller than this are rendered in-process: pool start-up costs more than it saves
+PARALLEL_MIN_ROWS = 200
+
+# Document service (--serve): default address, largest accepted request body, batch states
+SERVICE_ADDRESS = ("127.0.0.1", 8765)
+SERVICE_MAX_BODY = 32 << 20
+BATCH_QUEUED = "queued"
+BATCH_RUNNING = "running"
+BATCH_DONE = "done"
+BATCH_FAILED = "failed"
+# Finished batches (and their PDFs) are dropped after this many seconds, or oldest first beyond this count
+SERVICE_BATCH_TTL = 3600
+SERVICE_MAX_BATCHES = 200
+
+# Virement numbers are reserved in the ledger under a lock file shared by every workstation;
+# reservations end up used (journalled) or void (render failed, cancelled)
+NUMBER_LOCK_TIMEOUT = 10.0
+NUMBER_RESERVED = "reserved"
+NUMBER_USED = "used"
+NUMBER_VOID = "void"
+
+# Page geometry per document type: (page size in points, page height in mm)
+PAGE_SIZES = {
+    "cheque": (210*mm, 99*mm),
+    "virement": A4,
+    "letter": A4
+}
+DOC_HEIGHTS_MM = {"cheque": 99, "virement": 297, "letter": 297}
+
+# Text fitting: a field is one line unless its layout sets "lines" (FIELD_MAX_LINES for the
+# built-in name and motif fields), and wraps at spaces over that many lines; the amount in words
+# spreads over the layout's AMOUNT_WORDS_FIELD line N fields. Text that still does not fit is
+# shrunk in FIT_SCALE_STEP steps down to FIT_MIN_SCALE of the layout size
+FIELD_MAX_LINES = 3
+AMOUNT_WORDS_FIELD = "amount in letters"
+FIT_SCALE_STEP = 0.05
+FIT_MIN_SCALE = 0.7
+LINE_LEADING = 1.2
+
+# Layout "align" values ("justify" lines are drawn left-aligned)
+ALIGNMENTS = ("left", "center", "right", "justify")
+
+# Built-in PDF fonts used when the TTF files are not available
+FONT_FALLBACKS = {"Arial": "Helvetica", "Arial-Bold": "Helvetica-Bold"}
+
+# Payee autocomplete: debounce delay, number of suggestions, keys that do not refilter
+PAYEE_FILTER_DELAY_MS = 150
+PAYEE_SUGGESTIONS = 50
+PAYEE_NAVIGATION_KEYS = {"Up", "Down", "Return", "Escape", "Tab", "Left", "Right"}
+
+# Batch file headers (upper-cased) mapped to engine row keys
+BATCH_COLUMNS = {
+    "DOCUMENT": "document",
+    "BENEFICIAIRE": "payee",
+    "FOURNISSEUR": "payee",
+    "MONTANT": "amount",
+    "MONTANT_EN_LETTRES": "amount_words",
+    "VILLE": "city",
+    "DATE": "date",
+    "TYPE_VIR": "type",
+    "MOTIF": "motif",
+    "RIB": "rib",
+    "BANQUE": "bank",
+    "ORDER_DE_VIR": "virement_num",
+    "ECHEANCE": "due_date",
+    "DATE_EDITION": "edition_date",
+    "LIBELLE": "label"
+}
+
+# Batch index (volumes): one line per page, source line numbers counting the header as line 1
+BATCH_INDEX_COLUMNS = ("LIGNE", "DOCUMENT", "FICHIER", "PAGE", "ORDER_DE_VIR", "BENEFICIAIRE", "MONTANT")
+
+# Pre-flight validation: fields each document needs, dates to check, labels for the report
+REQUIRED_FIELDS = {"cheque": ("payee", "amount", "date"), "virement": ("payee", "amount"),
+                   "letter": ("payee", "amount", "due_date")}
+DATE_FIELDS = ("date", "due_date", "edition_date")
+DATE_FORMATS = ("%d/%m/%Y", "%Y-%m-%d")
+FIELD_LABELS = {"document": "Document", "payee": "Bénéficiaire", "amount": "Montant", "date": "Date",
+                "due_date": "Échéance", "edition_date": "Date d'édition", "rib": "RIB", "bank": "Banque"}
+ISSUE_ERROR = "erreur"
+ISSUE_WARNING = "avertissement"
+
+# Moroccan RIB: bank (3) + city (3) + account (16) + key (2) digits, the whole number being 0 mod 97
+RIB_LENGTH = 24
+RIB_SEPARATORS = re.compile(r"[\s.-]")
+
+# BANQUE names (normalized fragments, first match wins) and the RIB bank codes they may carry
+RIB_BANK_CODES = {
+    "attijari": ("007",),
+    "bmce": ("011",),
+    "bank of africa": ("011",),
+    "bmci": ("013",),
+    "credit du maroc": ("021",),
+    "societe generale": ("022",),
+    "credit agricole": ("225",),
+    "cih": ("230",),
+    "barid": ("350",),
+    # Banque Centrale Populaire and the regional Banques Populaires
+    "populaire": tuple(f"{code}" for code in range(101, 191)),
+    "bcp": tuple(f"{code}" for code in range(101, 191)),
+}
+
+_fonts_registered = False
+_fonts_lock = threading.Lock()
+
+
+def startup_mark(label):
+    """Record a startup milestone for startup_report"""
+    STARTUP_MARKS.append((label, time.perf_counter()))
+
+
+def startup_report():
+    """Format startup milestones as elapsed / delta milliseconds since reglio was imported"""
+    start = previous = STARTUP_MARKS[0][1]
+    lines = ["Démarrage (ms depuis l'import de reglio; python -X importtime pour le détail des modules):"]
+    for label, moment in sorted(STARTUP_MARKS[1:], key=lambda mark: mark[1]):
+        lines.append(f"{(moment - start) * 1000:9.1f} {(moment - previous) * 1000:+9.1f}  {label}")
+        previous = moment
+    return "\n".join(lines)
+
+
+def register_fonts():
+    """Register required fonts (once per process, on first render)"""
+    global _fonts_registered
+    if _fonts_registered:
+        return
+    with _fonts_lock:
+        if _fonts_registered:
+            return
+        try:
+            pdfmetrics.registerFont(TTFont('Arial', 'arial.ttf'))
+            pdfmetrics.registerFont(TTFont('Arial-Bold', 'arialbd.ttf'))
+        except:
+            print("Warning: Arial fonts not found - using defaults")
+        _fonts_registered = True
+
+
+def resolve_font(font_name):
+    """Return a registered font name, falling back to the built-in PDF fonts"""
+    register_fonts()
+    if font_name in pdfmetrics.getRegisteredFontNames() or font_name in pdfmetrics.standardFonts:
+        return font_name
+    return FONT_FALLBACKS.get(font_name, "Helvetica")
+
+
+# Amount parsing: formatting noise removed before matching "1234.5" / "1234,50"
+AMOUNT_NOISE = re.compile(r"[#\s]")
+AMOUNT_PATTERN = re.compile(r"^(\d+)(?:\.(\d*))?$")
+
+# French number words
+UNITS = ("", "un", "deux", "trois", "quatre", "cinq", "six", "sept", "huit", "neuf")
+TEENS = ("dix", "onze", "douze", "treize", "quatorze", "quinze", "seize", "dix-sept", "dix-huit", "dix-neuf")
+TENS = ("", "dix", "vingt", "trente", "quarante", "cinquante", "soixante", "soixante", "quatre-vingt", "quatre-vingt")
+
+# Largest amount accepted by amount_to_words (exclusive), in dirhams
+MAX_WORDS_AMOUNT = 10**12
+
+
+def _below_hundred(n):
+    """0-99 in words ("et un" for 21-71, "quatre-vingts" when nothing follows)"""
+    if n < 10:
+        return UNITS[n]
+    if n < 20:
+        return TEENS[n - 10]
+    ten, unit = divmod(n, 10)
+    if ten in (7, 9):
+        # soixante-dix..., quatre-vingt-dix...: tens of 60/80 plus a teen
+        if ten == 7 and unit == 1:
+            return "soixante et onze"
+        return TENS[ten] + "-" + TEENS[unit]
+    if unit == 0:
+        return "quatre-vingts" if ten == 8 else TENS[ten]
+    if unit == 1 and ten != 8:
+        return TENS[ten] + " et un"
+    return TENS[ten] + "-" + UNITS[unit]
+
+
+def _below_thousand(n, final):
+    """0-999 in words; final=False gives the invariable form used before mille"""
+    hundred, rest = divmod(n, 100)
+    words = _below_hundred(rest)
+    if not final and words.endswith("quatre-vingts"):
+        words = words[:-1]
+    if hundred == 0:
+        return words
+    prefix = "cent" if hundred == 1 else UNITS[hundred] + " cent"
+    if rest:
+        return prefix + " " + words
+    return prefix + "s" if hundred > 1 and final else prefix
+
+
+# Precomputed 0-999 tables: plural forms, and the invariable forms used before "mille"
+BELOW_THOUSAND = tuple(_below_thousand(n, True) for n in range(1000))
+BELOW_THOUSAND_BEFORE_MILLE = tuple(_below_thousand(n, False) for n in range(1000))
+
+
+def number_to_words(n):
+    """Convert a whole number below one thousand billion to French words"""
+    if n == 0:
+        return "zéro"
+    if not 0 < n < MAX_WORDS_AMOUNT:
+        raise ValueError(f"Montant hors limites: {n}")
+
+    billions, rest = divmod(n, 10**9)
+    millions, rest = divmod(rest, 10**6)
+    thousands, units = divmod(rest, 1000)
+    words = []
+    if billions:
+        words.append(BELOW_THOUSAND[billions] + (" milliards" if billions > 1 else " milliard"))
+    if millions:
+        words.append(BELOW_THOUSAND[millions] + (" millions" if millions > 1 else " million"))
+    if thousands:
+        words.append("mille" if thousands == 1 else BELOW_THOUSAND_BEFORE_MILLE[thousands] + " mille")
+    if units:
+        words.append(BELOW_THOUSAND[units])
+    return " ".join(words)
+
+
+def parse_amount(amount):
+    """Parse "#1 234,56", "1234.5" or a number into integer centimes
+
+    Fractions are rounded half up on the third decimal. Raises ValueError.
+    """
+    text = AMOUNT_NOISE.sub("", str(amount)).replace(",", ".")
+    match = AMOUNT_PATTERN.match(text)
+    if not match:
+        raise ValueError(f"Montant invalide: {amount!r}")
+    fraction = (match.group(2) or "").ljust(3, "0")
+    return int(match.group(1)) * 100 + int(fraction[:2]) + (fraction[2] >= "5")
+
+
+def parse_amounts(values):
+    """Column version of parse_amount: return an Int64 Series of centimes (<NA> where invalid)
+
+    Numeric columns are converted with array arithmetic (rounded half up like
+    parse_amount); text columns are factorized so each distinct value is
+    parsed only once.
+    """
+    import numpy as np
+    import pandas as pd
+
+    series = values if isinstance(values, pd.Series) else pd.Series(values)
+    if pd.api.types.is_integer_dtype(series.dtype):
+        return series.astype("Int64") * 100
+    if pd.api.types.is_float_dtype(series.dtype):
+        # Round to 4 decimals first so 1.005 (stored as 1.00499...) still rounds up
+        centimes = np.floor(np.round(series.to_numpy(dtype=float) * 100, 4) + 0.5)
+        centimes[~(centimes >= 0)] = np.nan
+        return pd.Series(centimes, index=series.index).astype("Int64")
+
+    codes, uniques = pd.factorize(series)
+    parsed = []
+    for value in uniques:
+        try:
+            parsed.append(parse_amount(value))
+        except ValueError:
+            parsed.append(None)
+    parsed.append(None)  # code -1: missing input
+    return pd.Series(pd.array(parsed, dtype="Int64")[codes], index=series.index)
+
+
+def format_centimes(centimes):
+    """Format integer centimes as 000 000,00"""
+    return f"{centimes // 100:,}".replace(",", " ") + f",{centimes % 100:02d}"
+
+
+def format_amount(amount_str):
+    """Format amount as #000 000,00"""
+    try:
+        return "#" + format_centimes(parse_amount(amount_str))
+    except ValueError:
+        return amount_str
+
+
+@functools.lru_cache(maxsize=65536)
+def centimes_to_words(centimes):
+    """Convert integer centimes to French words ("Mille cinq cents dirhams et dix centimes")"""
+    dirhams, cents = divmod(centimes, 100)
+    if dirhams == 0 and cents == 0:
+        return "Zéro dirham"
+
+    words = ""
+    if dirhams:
+        words = number_to_words(dirhams)
+        if dirhams == 1:
+            words += " dirham"
+        elif dirhams % 10**6 == 0:
+            # "un million de dirhams", "deux milliards de dirhams"
+            words += " de dirhams"
+        else:
+            words += " dirhams"
+
+    if cents:
+        cents_words = number_to_words(cents) + (" centime" if cents == 1 else " centimes")
+        words = f"{words} et {cents_words}" if words else cents_words
+
+    # Capitalize first letter
+    return words[0].upper() + words[1:]
+
+
+def amount_to_words(amount_str):
+    """Convert numeric amount to French words (raises ValueError on invalid amounts)"""
+    return centimes_to_words(parse_amount(amount_str))
+
+
+@functools.lru_cache(maxsize=None)
+def words_tables():
+    """Column tables for amounts_to_words: words per 0-999 group, with trailing space, "" for 0
+
+    Returns (billions, millions, thousands, units, centimes) object arrays.
+    """
+    import numpy as np
+
+    return (
+        np.array([""] + [BELOW_THOUSAND[n] + (" milliards " if n > 1 else " milliard ")
+                         for n in range(1, 1000)], dtype=object),
+        np.array([""] + [BELOW_THOUSAND[n] + (" millions " if n > 1 else " million ")
+                         for n in range(1, 1000)], dtype=object),
+        np.array(["", "mille "] + [BELOW_THOUSAND_BEFORE_MILLE[n] + " mille "
+                                   for n in range(2, 1000)], dtype=object),
+        np.array([""] + [BELOW_THOUSAND[n] + " " for n in range(1, 1000)], dtype=object),
+        np.array([""] + [number_to_words(n) + (" centime" if n == 1 else " centimes")
+                         for n in range(1, 100)], dtype=object),
+    )
+
+
+def amounts_to_words(values):
+    """Convert a whole amount column to French words at once
+
+    Accepts a pandas Series, NumPy array or list; returns a Series aligned on
+    the input with missing values for invalid amounts. Digit groups are split
+    with array arithmetic and mapped through precomputed word tables, giving
+    the same text as amount_to_words.
+    """
+    import numpy as np
+    import pandas as pd
+
+    words_billions, words_millions, words_thousands, words_units, words_centimes = words_tables()
+    centimes = parse_amounts(values)
+    valid = (centimes.notna() & (centimes < MAX_WORDS_AMOUNT * 100)).to_numpy(dtype=bool)
+    dirhams, cents = np.divmod(centimes.to_numpy(dtype="int64", na_value=0)[valid], 100)
+    billions, rest = np.divmod(dirhams, 10**9)
+    millions, rest = np.divmod(rest, 10**6)
+    thousands, units = np.divmod(rest, 1000)
+
+    suffix = np.select([dirhams == 0, dirhams == 1, dirhams % 10**6 == 0],
+                       ["", "dirham", "de dirhams"], "dirhams").astype(object)
+    joiner = np.where((dirhams > 0) & (cents > 0), " et ", "").astype(object)
+    words = (words_billions[billions] + words_millions[millions] + words_thousands[thousands]
+             + words_units[units] + suffix + joiner + words_centimes[cents])
+    words[(dirhams == 0) & (cents == 0)] = "zéro dirham"
+
+    result = pd.Series(np.nan, index=centimes.index, dtype=object)
+    result[valid] = [text[0].upper() + text[1:] for text in words]
+    return result
+
+
+def load_layout_config(doc_type):
+    """Load layout configuration for document type"""
+    if doc_type == "cheque":
+        return {
+            "payee": {"x": 35, "y": 45, "max_width": 130, "font": "Arial", "size": 10, "align": "left", "lines": FIELD_MAX_LINES},
+            "amount": {"x": 130, "y": 73, "max_width": 31, "font": "Arial", "size": 10, "align": "left"},
+            "amount in letters line 1": {"x": 40, "y": 56, "max_width": 100, "font": "Arial", "size": 10, "align": "center"},
+            "amount in letters line 2": {"x": 10, "y": 51, "max_width": 160, "font": "Arial", "size": 10, "align": "center"},
+            "ville": {"x": 75, "y": 38, "max_width": 35, "font": "Arial", "size": 10, "align": "left"},
+            "date": {"x": 130, "y": 38, "max_width": 30, "font": "Arial", "size": 10, "align": "left"}
+        }
+    elif doc_type == "letter":
+        return {
+            "amount": {"x": 155, "y": 84, "max_width": 40, "font": "Arial", "size": 10, "align": "center"},
+            "amount in letters line 1": {"x": 148, "y": 62, "max_width": 48, "font": "Arial", "size": 10, "align": "left"},
+            "amount in letters line 2": {"x": 148, "y": 58, "max_width": 48, "font": "Arial", "size": 10, "align": "left"},
+            "amount in letters line 3": {"x": 148, "y": 54, "max_width": 48, "font": "Arial", "size": 10, "align": "left"},
+            "payee 1": {"x": 85, "y": 71, "max_width": 110, "font": "Arial", "size": 10, "align": "left", "lines": FIELD_MAX_LINES},
+            "payee 2": {"x": 7, "y": 69, "max_width": 55, "font": "Arial", "size": 10, "align": "left"},
+            "due date": {"x": 155, "y": 94, "max_width": 40, "font": "Arial", "size": 10, "align": "center"},
+            "motif": {"x": 85, "y": 56, "max_width": 55, "font": "Arial", "size": 10, "align": "left", "lines": FIELD_MAX_LINES},
+            "city and edition date": {"x": 85, "y": 62, "max_width": 55, "font": "Arial", "size": 10, "align": "left"}
+        }
+    elif doc_type == "virement":
+        return {
+            "virement_num": {"x": 50, "y": 250, "max_width": 80, "font": "Arial-Bold", "size": 12, "align": "left"},
+            "amount": {"x": 50, "y": 230, "max_width": 60, "font": "Arial", "size": 12, "align": "left"},
+            "amount in letters line 1": {"x": 50, "y": 210, "max_width": 140, "font": "Arial", "size": 10, "align": "left"},
+            "amount in letters line 2": {"x": 50, "y": 200, "max_width": 140, "font": "Arial", "size": 10, "align": "left"},
+            "payee": {"x": 50, "y": 180, "max_width": 120, "font": "Arial", "size": 10, "align": "left", "lines": FIELD_MAX_LINES},
+            "type": {"x": 50, "y": 160, "max_width": 60, "font": "Arial", "size": 10, "align": "left"},
+            "motif": {"x": 50, "y": 140, "max_width": 120, "font": "Arial", "size": 10, "align": "left", "lines": FIELD_MAX_LINES},
+            "rib": {"x": 50, "y": 120, "max_width": 100, "font": "Arial", "size": 10, "align": "left"},
+            "bank": {"x": 50, "y": 100, "max_width": 100, "font": "Arial", "size": 10, "align": "left"},
+            "city": {"x": 50, "y": 80, "max_width": 80, "font": "Arial", "size": 10, "align": "left"}
+        }
+    return {}
+
+
+def read_layout_file(path):
+    """Parse a JSON or TOML layout file into {doc_type: {field_name: config}}"""
+    with open(path, "rb") as f:
+        data = f.read()
+    if path.endswith(".toml"):
+        if tomllib is None:
+            raise ValueError(f"{path}: lecture TOML indisponible (Python 3.11+ requis)")
+        layout = tomllib.loads(data.decode("utf-8"))
+    else:
+        layout = json.loads(data)
+    return layout, hashlib.sha1(data).hexdigest()
+
+
+def merge_layout(overrides, source):
+    """Overlay a bank's fields on the built-in layouts and validate the result
+
+    Files only need the fields (and keys) that differ from the defaults.
+    """
+    unknown = set(overrides) - set(DOC_TYPES)
+    if unknown:
+        raise ValueError(f"{source}: type de document inconnu: {', '.join(sorted(unknown))}")
+
+    merged = {}
+    for doc_type in DOC_TYPES:
+        fields = {name: dict(config) for name, config in load_layout_config(doc_type).items()}
+        for name, config in overrides.get(doc_type, {}).items():
+            fields.setdefault(name, {}).update(config)
+        for name, config in fields.items():
+            missing = [key for key in LAYOUT_KEYS if key not in config]
+            if missing:
+                raise ValueError(f"{source}: {doc_type}.{name}: clé(s) manquante(s): {', '.join(missing)}")
+            if config["align"] not in ALIGNMENTS:
+                raise ValueError(f"{source}: {doc_type}.{name}: alignement inconnu: {config['align']}")
+            for key in ("x", "y", "max_width", "size"):
+                if not isinstance(config[key], (int, float)) or isinstance(config[key], bool):
+                    raise ValueError(f"{source}: {doc_type}.{name}.{key}: nombre attendu")
+            lines = config.get("lines", 1)
+            if not isinstance(lines, int) or isinstance(lines, bool) or lines < 1:
+                raise ValueError(f"{source}: {doc_type}.{name}.lines: entier positif attendu")
+        merged[doc_type] = fields
+    return merged
+
+
+CompiledLayout = collections.namedtuple("CompiledLayout", "bank layouts plans digest")
+
+
+class LayoutCache:
+    """Compiled layouts per bank, reloaded only when the bank's file changes
+
+    A bank's layout lives in <directory>/<bank>.json (or .toml) as
+    {"cheque": {"payee": {"x": 36, ...}, ...}, "virement": ..., "letter": ...},
+    overriding the built-in layouts field by field. get() costs one stat when
+    nothing changed; a changed mtime/size triggers a read, and the layout is
+    recompiled only if the content hash differs. A file that fails to parse
+    keeps the last good layout so a half-saved edit does not break rendering.
+    """
+
+    EXTENSIONS = (".json", ".toml")
+
+    def __init__(self, directory=LAYOUT_DIR):
+        self.directory = directory
+        self.entries = {}  # bank -> (stat signature, CompiledLayout)
+        self.lock = threading.Lock()
+        self.default = None
+
+    def banks(self):
+        """List the banks that have a layout file"""
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return []
+        return sorted({os.path.splitext(name)[0] for name in names
+                       if os.path.splitext(name)[1] in self.EXTENSIONS})
+
+    def path_for(self, bank):
+        """Return the layout file for bank, or None"""
+        if os.path.basename(bank) != bank:
+            raise ValueError(f"Nom de banque invalide: {bank}")
+        for ext in self.EXTENSIONS:
+            path = os.path.join(self.directory, bank + ext)
+            if os.path.exists(path):
+                return path
+        return None
+
+    def compile(self, bank, layouts, digest):
+        """Freeze layouts and compile their render plans"""
+        layouts = types.MappingProxyType({doc_type: types.MappingProxyType(fields)
+                                          for doc_type, fields in layouts.items()})
+        plans = types.MappingProxyType({doc_type: types.MappingProxyType(
+                                            compile_render_plan(layouts[doc_type], DOC_HEIGHTS_MM[doc_type]))
+                                        for doc_type in DOC_TYPES})
+        return CompiledLayout(bank, layouts, plans, digest)
+
+    def get(self, bank=None):
+        """Return the CompiledLayout for bank (built-in layouts when bank is empty)"""
+        if not bank:
+            if self.default is None:
+                self.default = self.compile(None, {doc_type: load_layout_config(doc_type)
+                                                   for doc_type in DOC_TYPES}, None)
+            return self.default
+        path = self.path_for(bank)
+        if path is None:
+            raise ValueError(f"Aucun modèle pour la banque: {bank}")
+
+        st = os.stat(path)
+        signature = (path, st.st_mtime_ns, st.st_size)
+        with self.lock:
+            cached = self.entries.get(bank)
+            if cached and cached[0] == signature:
+                return cached[1]
+            try:
+                overrides, digest = read_layout_file(path)
+                if cached and cached[1].digest == digest:  # Touched but unchanged
+                    layout = cached[1]
+                else:
+                    layout = self.compile(bank, merge_layout(overrides, path), digest)
+            except (ValueError, TypeError, AttributeError) as e:
+                if not cached:
+                    raise ValueError(f"Modèle invalide: {e}") from e
+                print(f"Warning: invalid layout {path}, keeping previous version: {e}")
+                return cached[1]
+            self.entries[bank] = (signature, layout)
+            return layout
+
+
+# Process-local locks for file_lock: POSIX record locks do not exclude threads of the same process
+_FILE_LOCKS = collections.defaultdict(threading.Lock)
+
+
+@contextlib.contextmanager
+def file_lock(path, timeout=NUMBER_LOCK_TIMEOUT):
+    """Hold an exclusive lock on path (created if needed) across processes and machines
+
+    Uses fcntl record locks on POSIX and msvcrt byte locks on Windows, which both
+    work on network shares. Raises TimeoutError if the lock is not free in time.
+    """
+    deadline = time.monotonic() + timeout
+    local = _FILE_LOCKS[os.path.abspath(path)]
+    if not local.acquire(timeout=timeout):
+        raise TimeoutError(f"Verrou occupé: {path}")
+    try:
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o666)
+        try:
+            if os.name == 'nt':
+                import msvcrt
+                lock = functools.partial(msvcrt.locking, fd, msvcrt.LK_NBLCK, 1)
+                unlock = functools.partial(msvcrt.locking, fd, msvcrt.LK_UNLCK, 1)
+            else:
+                import fcntl
+                lock = functools.partial(fcntl.lockf, fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                unlock = functools.partial(fcntl.lockf, fd, fcntl.LOCK_UN)
+            delay = 0.001
+            while True:
+                try:
+                    lock()
+                    break
+                except OSError:
+                    if time.monotonic() >= deadline:
+                        raise TimeoutError(f"Verrou occupé: {path}") from None
+                    time.sleep(delay)
+                    delay = min(delay * 2, 0.05)
+            try:
+                yield
+            finally:
+                unlock()
+        finally:
+            os.close(fd)
+    finally:
+        local.release()
+
+
+# Unicode combining diacritical mark blocks, removed after NFKD decomposition
+COMBINING_MARKS = re.compile("[\u0300-\u036f\u1ab0-\u1aff\u1dc0-\u1dff\u20d0-\u20ff\ufe20-\ufe2f]")
+
+
+def normalize_text(text):
+    """Casefold and strip accents ("Témara" -> "temara")"""
+    text = str(text)
+    if text.isascii():
+        return text.casefold()
+    return COMBINING_MARKS.sub("", unicodedata.normalize("NFKD", text)).casefold()
+
+
+class PayeeIndex:
+    """Accent-insensitive payee search index built once per imported database
+
+    Supports exact, prefix, word-prefix and substring lookups. Names are
+    numbered in normalized alphabetical order, so prefixes are contiguous
+    ranges found by bisection and "best first" is simply "smallest id first".
+    Word prefixes merge the ascending id lists of the matching words, and
+    substrings walk the shortest trigram posting list of the query in id
+    order; both stop as soon as enough matches are found.
+    """
+
+    def __init__(self, names):
+        pairs = sorted((normalize_text(name), str(name)) for name in names)
+        self.keys = [key for key, _ in pairs]
+        self.names = [name for _, name in pairs]
+
+        # Sorted distinct words and, for each, the ascending ids of the names containing it
+        postings = {}
+        for i, key in enumerate(self.keys):
+            for word in set(key.split()):
+                postings.setdefault(word, []).append(i)
+        self.words = sorted(postings)
+        self.word_ids = [postings[word] for word in self.words]
+
+        # Trigram -> ascending list of ids for substring lookups
+        self.trigrams = {}
+        for i, key in enumerate(self.keys):
+            for gram in {key[j:j+3] for j in range(len(key) - 2)}:
+                self.trigrams.setdefault(gram, []).append(i)
+
+    def __len__(self):
+        return len(self.names)
+
+    def _word_prefix_ids(self, query, exclude, limit):
+        """Return up to limit smallest ids (not in exclude) with a word starting with query"""
+        start = bisect.bisect_left(self.words, query)
+        end = bisect.bisect_left(self.words, query + "\uffff", start)
+        found = []
+        for i in heapq.merge(*self.word_ids[start:end]):
+            # A name with several matching words comes out once per word, consecutively
+            if i not in exclude and (not found or found[-1] != i):
+                found.append(i)
+                if len(found) == limit:
+                    break
+        return found
+
+    def _substring_ids(self, query, exclude, limit):
+        """Return up to limit smallest ids (not in any of the exclude collections) whose key contains query"""
+        postings = [self.trigrams.get(query[j:j+3], ()) for j in range(len(query) - 2)]
+        found = []
+        for i in min(postings, key=len):
+            if query in self.keys[i] and not any(i in ids for ids in exclude):
+                found.append(i)
+                if len(found) == limit:
+                    break
+        return found
+
+    def search(self, query, limit=50):
+        """Return up to limit payee names matching query, best matches first
+
+        Ranking: exact match, prefix, word prefix, then any substring; ties are
+        broken alphabetically.
+        """
+        query = normalize_text(query).strip()
+        if not query:
+            return self.names[:limit]
+
+        # Exact and prefix matches are one contiguous range of ids
+        start = bisect.bisect_left(self.keys, query)
+        end = bisect.bisect_left(self.keys, query + "\uffff", start)
+        found = list(range(start, min(end, start + limit)))
+
+        if len(found) < limit:
+            prefixed = range(start, end)  # Constant-time membership
+            word_ids = self._word_prefix_ids(query, prefixed, limit - len(found))
+            found += word_ids
+
+            if len(found) < limit and len(query) >= 3:
+                # Fewer than limit word-prefix matches: word_ids holds all of them
+                found += self._substring_ids(query, (prefixed, set(word_ids)), limit - len(found))
+
+        return [self.names[i] for i in found]
+
+
+class PayeeRecords:
+    """Payee details (RIB, bank, city) keyed by normalized payee name
+
+    Built once at import so a combobox selection is a single dict lookup.
+    Names carrying more than one distinct record are kept in duplicates, to
+    be reported rather than silently resolved to the first row.
+    """
+
+    def __init__(self, df):
+        # Assuming columns are: Payee, RIB, Bank, City
+        columns = [df.iloc[:, k].fillna("").astype(str).str.strip().tolist() if k < df.shape[1]
+                   else [""] * len(df) for k in range(4)]
+        self.records = {}
+        names = {}
+        for name, rib, bank, city in zip(*columns):
+            if not name:
+                continue
+            key = normalize_text(name)
+            names.setdefault(key, name)
+            found = self.records.setdefault(key, [])
+            if (rib, bank, city) not in found:
+                found.append((rib, bank, city))
+
+        # Display name -> conflicting records
+        self.duplicates = {names[key]: found for key, found in self.records.items() if len(found) > 1}
+
+    def lookup(self, name):
+        """Return the list of (rib, bank, city) records for name"""
+        return self.records.get(normalize_text(name), [])
+
+
+def load_settings():
+    """Read the user settings (last databases used...), {} if none"""
+    try:
+        with open(os.path.join(REGLIO_HOME, "settings.json"), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_settings(**changes):
+    """Update the user settings file"""
+    settings = load_settings()
+    settings.update(changes)
+    os.makedirs(REGLIO_HOME, exist_ok=True)
+    path = os.path.join(REGLIO_HOME, "settings.json")
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(settings, f, ensure_ascii=False, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def file_digest(path):
+    """SHA-1 of a file's content"""
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def read_payee_db(path):
+    """Parse a payee workbook into (payee_db, payee_list, PayeeIndex, PayeeRecords)"""
+    import pandas as pd
+
+    payee_db = pd.read_excel(path, dtype=str)  # Keep RIBs as text
+    payee_list = payee_db.iloc[:, 0].dropna().astype(str).tolist()  # First column as payee names
+    return payee_db, payee_list, PayeeIndex(dict.fromkeys(payee_list)), PayeeRecords(payee_db)
+
+
+def load_payee_db(path, cache_dir=None):
+    """Load a payee workbook through a pickle cache of the parsed table and its indexes
+
+    The cache entry is keyed by the workbook's absolute path and validated by
+    size and mtime, then by content hash when those moved (a copied or
+    touched file is not re-parsed). Returns read_payee_db's tuple plus a flag
+    telling whether it came from the cache.
+    """
+    cache_dir = cache_dir or os.path.join(REGLIO_HOME, "cache")
+    path = os.path.abspath(path)
+    cache_path = os.path.join(cache_dir, f"payees_{hashlib.sha1(path.encode('utf-8')).hexdigest()[:16]}.pickle")
+    st = os.stat(path)
+
+    cached = None
+    try:
+        with open(cache_path, "rb") as f:
+            cached = pickle.load(f)
+        if cached.get("version") != PAYEE_CACHE_VERSION or cached.get("path") != path:
+            cached = None
+    except Exception:
+        cached = None
+
+    if cached and cached["size"] == st.st_size and cached["mtime_ns"] == st.st_mtime_ns:
+        return cached["data"] + (True,)
+
+    digest = file_digest(path)
+    if cached and cached["size"] == st.st_size and cached["digest"] == digest:
+        data, from_cache = cached["data"], True
+    else:
+        data, from_cache = read_payee_db(path), False
+
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(cache_path + ".tmp", "wb") as f:
+            pickle.dump({"version": PAYEE_CACHE_VERSION, "path": path, "size": st.st_size,
+                         "mtime_ns": st.st_mtime_ns, "digest": digest, "data": data},
+                        f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(cache_path + ".tmp", cache_path)
+    except OSError as e:
+        print(f"Warning: payee cache not written: {e}")
+    return data + (from_cache,)
+
+
+LEDGER_DATE = re.compile(r"(\d{1,2})/(\d{1,2})/(\d{4})|(\d{4})-(\d{2})-(\d{2})")
+
+
+def ledger_month(date):
+    """Return "2026-10" for "18/10/2026" or "2026-10-18...", "" if unrecognized"""
+    match = LEDGER_DATE.search(str(date))
+    if not match:
+        return ""
+    if match.group(3):
+        return f"{match.group(3)}-{int(match.group(2)):02d}"
+    return f"{match.group(4)}-{match.group(5)}"
+
+
+class VirementLedger:
+    """Append-only virement journal stored in SQLite next to the Excel workbook
+
+    Numbering and logging only touch the SQLite file, so they cost the same at
+    row 50 000 as at row 5. The workbook's VIREMENTS sheet is kept as an export:
+    pending rows are appended to it in one write by export_to_excel().
+
+    Amounts are also stored as integer centimes, and every insert updates a
+    totals table (supplier x month x type), so reports read a few hundred
+    aggregate rows whatever the size of the history.
+
+    Virement numbers are handed out by reserve(), which advances the per-year
+    sequence under a lock file next to the database, so workstations sharing the
+    journal on a network drive never issue the same number. Every reserved number
+    is kept in the reservations table until it is journalled (used) or voided.
+    """
+
+    SCHEMA_VERSION = 2
+    REPORT_COLUMNS = {"fournisseur": "fournisseur", "mois": "month", "type": "type_vir"}
+
+    COLUMNS = ("DATE", "ORDER_DE_VIR", "FOURNISSEUR", "MONTANT", "MONTANT_EN_LETTRES",
+               "TYPE_VIR", "RIB", "BANQUE", "VILLE")
+    ROW_KEYS = ("date", "virement_num", "payee", "amount", "amount_words",
+                "type", "rib", "bank", "city")
+
+    def __init__(self, workbook_path):
+        self.workbook_path = workbook_path
+        self.db_path = os.path.splitext(workbook_path)[0] + ".ledger.sqlite"
+        self.lock_path = self.db_path + ".lock"
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        # Other workstations may open the same journal now: set it up (and seed it) only once
+        with file_lock(self.lock_path):
+            self.setup()
+
+    def setup(self):
+        """Create the tables, then seed a new journal from the workbook or upgrade an old one"""
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS virements (
+                id INTEGER PRIMARY KEY,
+                date TEXT, order_de_vir TEXT, fournisseur TEXT, montant TEXT,
+                montant_en_lettres TEXT, type_vir TEXT, rib TEXT, banque TEXT, ville TEXT, centimes INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS virements_order ON virements (order_de_vir);
+            CREATE TABLE IF NOT EXISTS sequence (year INTEGER PRIMARY KEY, last INTEGER NOT NULL);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+            CREATE TABLE IF NOT EXISTS totals (
+                fournisseur TEXT NOT NULL, month TEXT NOT NULL, type_vir TEXT NOT NULL,
+                count INTEGER NOT NULL, invalid INTEGER NOT NULL, centimes INTEGER NOT NULL,
+                PRIMARY KEY (fournisseur, month, type_vir)
+            );
+            CREATE TABLE IF NOT EXISTS reservations (
+                year INTEGER NOT NULL, number INTEGER NOT NULL, status TEXT NOT NULL,
+                reserved_at TEXT NOT NULL, owner TEXT NOT NULL, reason TEXT,
+                PRIMARY KEY (year, number)
+            );
+        """)
+        is_new = (self.conn.execute("SELECT 1 FROM meta WHERE key = 'schema'").fetchone() is None
+                  and self.conn.execute("SELECT 1 FROM virements LIMIT 1").fetchone() is None)
+        if is_new:
+            with self.conn:
+                self.conn.execute("INSERT INTO meta VALUES ('schema', ?)", (self.SCHEMA_VERSION,))
+            if os.path.exists(self.workbook_path):
+                self.import_workbook()
+        else:
+            self.migrate()
+
+    def migrate(self, chunk_size=10000):
+        """Upgrade a journal created before amounts were stored as centimes
+
+        Existing rows are streamed in chunks to fill the centimes column and
+        build the totals table, so memory does not grow with the history.
+        """
+        found = self.conn.execute("SELECT value FROM meta WHERE key = 'schema'").fetchone()
+        if found and found[0] >= self.SCHEMA_VERSION:
+            return
+        with self.lock, self.conn:
+            columns = [row[1] for row in self.conn.execute("PRAGMA table_info(virements)")]
+            if "centimes" not in columns:
+                self.conn.execute("ALTER TABLE virements ADD COLUMN centimes INTEGER")
+            self.conn.execute("DELETE FROM totals")
+            last_id = 0
+            while True:
+                rows = self.conn.execute(
+                    "SELECT id, date, fournisseur, montant, type_vir FROM virements WHERE id > ? ORDER BY id LIMIT ?",
+                    (last_id, chunk_size)).fetchall()
+                if not rows:
+                    break
+                last_id = rows[-1][0]
+                amounts = [self.parse_centimes(montant) for _, _, _, montant, _ in rows]
+                self.conn.executemany("UPDATE virements SET centimes = ? WHERE id = ?",
+                                      [(centimes, row[0]) for centimes, row in zip(amounts, rows)])
+                self._add_totals([(date, fournisseur, type_vir) for _, date, fournisseur, _, type_vir in rows],
+                                 amounts)
+            self.conn.execute("INSERT OR REPLACE INTO meta VALUES ('schema', ?)", (self.SCHEMA_VERSION,))
+
+    @staticmethod
+    def parse_centimes(montant):
+        """Parse a stored amount ("#12 500,00") to centimes, None if invalid"""
+        try:
+            return parse_amount(montant)
+        except ValueError:
+            return None
+
+    def _add_totals(self, keys, amounts):
+        """Fold (date, fournisseur, type_vir) keys and their centimes into the totals table"""
+        totals = {}
+        for (date, fournisseur, type_vir), centimes in zip(keys, amounts):
+            key = (str(fournisseur or "").strip(), ledger_month(date), str(type_vir or "").strip())
+            count, invalid, total = totals.get(key, (0, 0, 0))
+            totals[key] = (count + 1, invalid + (centimes is None), total + (centimes or 0))
+        self.conn.executemany(
+            "INSERT INTO totals VALUES (?, ?, ?, ?, ?, ?)"
+            " ON CONFLICT (fournisseur, month, type_vir) DO UPDATE SET"
+            " count = count + excluded.count, invalid = invalid + excluded.invalid,"
+            " centimes = centimes + excluded.centimes",
+            [key + value for key, value in totals.items()])
+
+    @staticmethod
+    def parse_number(virement_num):
+        """Split "2026/042" (or "VIR 2026/042") into (2026, 42), None if malformed"""
+        try:
+            year, seq = str(virement_num).replace("VIR", "").strip().split("/")
+            return int(year), int(seq)
+        except ValueError:
+            return None
+
+    def import_workbook(self):
+        """Seed the journal from the existing VIREMENTS sheet (first use only)"""
+        from openpyxl import load_workbook
+
+        wb = load_workbook(self.workbook_path, read_only=True)
+        try:
+            if "VIREMENTS" not in wb.sheetnames:
+                return
+            rows = wb["VIREMENTS"].iter_rows(values_only=True)
+            header = [str(col).strip() if col is not None else "" for col in next(rows, ())]
+            positions = [header.index(col) if col in header else None for col in self.COLUMNS]
+            records = []
+            for values in rows:
+                records.append(tuple("" if pos is None or pos >= len(values) or values[pos] is None
+                                     else str(values[pos]) for pos in positions))
+        finally:
+            wb.close()
+
+        with self.lock, self.conn:
+            self._insert(records)
+            exported = self.conn.execute("SELECT COALESCE(MAX(id), 0) FROM virements").fetchone()[0]
+            self.conn.execute("INSERT OR REPLACE INTO meta VALUES ('exported_id', ?)", (exported,))
+
+    def _insert(self, records):
+        """Insert journal records, update totals and advance the per-year sequence counters"""
+        amounts = [self.parse_centimes(record[3]) for record in records]
+        self.conn.executemany(
+            "INSERT INTO virements (date, order_de_vir, fournisseur, montant, montant_en_lettres,"
+            " type_vir, rib, banque, ville, centimes) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [record + (centimes,) for record, centimes in zip(records, amounts)])
+        self._add_totals([(record[0], record[2], record[5]) for record in records], amounts)
+        last_by_year = {}
+        for record in records:
+            parsed = self.parse_number(record[1])
+            if parsed:
+                last_by_year[parsed[0]] = max(parsed[1], last_by_year.get(parsed[0], 0))
+        self.conn.executemany(
+            "INSERT INTO sequence VALUES (?, ?)"
+            " ON CONFLICT (year) DO UPDATE SET last = MAX(last, excluded.last)",
+            last_by_year.items())
+        numbers = [parsed for parsed in map(self.parse_number, (record[1] for record in records)) if parsed]
+        self.conn.executemany(
+            f"UPDATE reservations SET status = '{NUMBER_USED}' WHERE year = ? AND number = ?", numbers)
+
+    @contextlib.contextmanager
+    def exclusive(self):
+        """Write transaction holding the lock file, for read-then-write updates shared between machines"""
+        with self.lock, file_lock(self.lock_path):
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.conn
+            except BaseException:
+                self.conn.rollback()
+                raise
+            self.conn.commit()
+
+    def reserve(self, count=1, year=None):
+        """Reserve count consecutive virement numbers in one lock round-trip
+
+        Numbers follow the year's sequence (the first reservation of a new year
+        starts at 001) and are never handed out again, even if later voided.
+        Returns ["2026/042", "2026/043", ...].
+        """
+        if count <= 0:
+            return []
+        year = year or datetime.now().year
+        with self.exclusive() as conn:
+            found = conn.execute("SELECT last FROM sequence WHERE year = ?", (year,)).fetchone()
+            first = (found[0] if found else 0) + 1
+            conn.execute("INSERT INTO sequence VALUES (?, ?)"
+                         " ON CONFLICT (year) DO UPDATE SET last = excluded.last", (year, first + count - 1))
+            stamp = datetime.now().isoformat(timespec="seconds")
+            owner = f"{platform.node()}:{os.getpid()}"
+            conn.executemany(
+                f"INSERT OR REPLACE INTO reservations VALUES (?, ?, '{NUMBER_RESERVED}', ?, ?, NULL)",
+                [(year, number, stamp, owner) for number in range(first, first + count)])
+        return [f"{year}/{number:03d}" for number in range(first, first + count)]
+
+    def void(self, numbers, reason=""):
+        """Mark reserved numbers that will not be journalled (failed or cancelled render) as void
+
+        Numbers already used, or not reserved here, are left alone. Returns the count voided.
+        """
+        keys = [parsed + (reason,) for parsed in map(self.parse_number, numbers) if parsed]
+        if not keys:
+            return 0
+        with self.exclusive() as conn:
+            before = conn.total_changes
+            conn.executemany(
+                f"UPDATE reservations SET status = '{NUMBER_VOID}', reason = ?3"
+                f" WHERE year = ?1 AND number = ?2 AND status = '{NUMBER_RESERVED}'", keys)
+            return conn.total_changes - before
+
+    def reservations(self, status=None, year=None):
+        """List (number, status, reserved_at, owner, reason) for auditing gaps in the sequence"""
+        conditions, params = [], []
+        if status:
+            conditions.append("status = ?")
+            params.append(status)
+        if year:
+            conditions.append("year = ?")
+            params.append(year)
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT year, number, status, reserved_at, owner, reason FROM reservations{where}"
+                " ORDER BY year, number", params).fetchall()
+        return [(f"{year}/{number:03d}",) + tuple(rest) for year, number, *rest in rows]
+
+    def last_number(self):
+        """Return the last issued virement number ("2026/042") or None"""
+        with self.lock:
+            found = self.conn.execute(
+                "SELECT year, last FROM sequence ORDER BY year DESC LIMIT 1").fetchone()
+        return f"{found[0]}/{found[1]:03d}" if found else None
+
+    def append(self, rows):
+        """Record engine rows (one per virement) in the journal"""
+        today = datetime.now().strftime("%d/%m/%Y")
+        records = [tuple(today if key == "date" else str(row.get(key, "")) for key in self.ROW_KEYS)
+                   for row in rows]
+        with self.exclusive():
+            self._insert(records)
+
+    def report(self, group_by=("fournisseur", "mois", "type"), month_from=None, month_to=None):
+        """Totals grouped by any of "fournisseur", "mois", "type", read from the aggregates
+
+        Months are "YYYY-MM" and bound the report inclusively. Returns a list of
+        (group values..., count, invalid, centimes) tuples sorted by group.
+        """
+        columns = [self.REPORT_COLUMNS[name] for name in group_by]
+        conditions, params = [], []
+        if month_from:
+            conditions.append("month >= ?")
+            params.append(month_from)
+        if month_to:
+            conditions.append("month <= ?")
+            params.append(month_to)
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        select = ", ".join(columns + ["SUM(count)", "SUM(invalid)", "SUM(centimes)"])
+        group = f" GROUP BY {', '.join(columns)} ORDER BY {', '.join(columns)}" if columns else ""
+        with self.lock:
+            return self.conn.execute(f"SELECT {select} FROM totals{where}{group}", params).fetchall()
+
+    def pending_export(self):
+        """Return journal rows not yet written to the workbook"""
+        with self.lock:
+            return self._pending()
+
+    def _pending(self):
+        found = self.conn.execute("SELECT value FROM meta WHERE key = 'exported_id'").fetchone()
+        return self.conn.execute(
+            "SELECT id, date, order_de_vir, fournisseur, montant, montant_en_lettres,"
+            " type_vir, rib, banque, ville FROM virements WHERE id > ? ORDER BY id",
+            (found[0] if found else 0,)).fetchall()
+
+    def export_to_excel(self):
+        """Append pending journal rows to the VIREMENTS sheet in a single write
+
+        Runs under the lock file, so workstations sharing the journal never
+        append the same rows twice or overwrite each other's save.
+        """
+        with self.lock, file_lock(self.lock_path):
+            return self._export_to_excel()
+
+    def _export_to_excel(self):
+        from openpyxl import Workbook, load_workbook
+
+        pending = self._pending()
+        if not pending:
+            return 0
+
+        if os.path.exists(self.workbook_path):
+            wb = load_workbook(self.workbook_path)
+        else:
+            wb = Workbook()
+            wb.remove(wb.active)
+        if "VIREMENTS" in wb.sheetnames:
+            ws = wb["VIREMENTS"]
+        else:
+            ws = wb.create_sheet("VIREMENTS")
+            ws.append(self.COLUMNS)
+        for record in pending:
+            ws.append(list(record[1:]))
+        wb.save(self.workbook_path)
+
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO meta VALUES ('exported_id', ?)", (pending[-1][0],))
+        return len(pending)
+
+    def close(self):
+        """Close the SQLite connection"""
+        with self.lock:
+            self.conn.close()
+
+
+def read_batch_rows(source):
+    """Read batch rows from a DataFrame or an Excel/CSV file into engine row dicts
+
+    A list of engine row dicts (rows already read, e.g. for validation) is copied.
+    Date cells are written DD/MM/YYYY, as typed dates are; other cells as text.
+    """
+    import pandas as pd
+
+    if isinstance(source, list):
+        return [dict(row) for row in source]
+    if isinstance(source, pd.DataFrame):
+        df = source.copy()
+    elif str(source).lower().endswith(".csv"):
+        df = pd.read_csv(source, dtype=str, sep=None, engine="python")
+    else:
+        df = pd.read_excel(source, dtype=object)
+
+    df.columns = [BATCH_COLUMNS.get(str(col).strip().upper(), str(col).strip().lower())
+                  for col in df.columns]
+    for col in df.columns:
+        if pd.api.types.is_datetime64_any_dtype(df[col]):
+            df[col] = df[col].dt.strftime(DATE_FORMATS[0])
+        elif df[col].dtype == object:
+            df[col] = df[col].map(batch_cell_text)
+    df = df.fillna("").astype(str)
+    return df.to_dict("records")
+
+
+def batch_cell_text(value):
+    """A date cell (datetime, Timestamp) as DD/MM/YYYY; anything else unchanged"""
+    if isinstance(value, datetime) and value == value:  # NaT is a datetime that is not equal to itself
+        return value.strftime(DATE_FORMATS[0])
+    return value
+
+
+BatchIssue = collections.namedtuple("BatchIssue", "line field severity message")
+
+
+def is_valid_date(text):
+    """True if text is a date in one of DATE_FORMATS"""
+    for date_format in DATE_FORMATS:
+        try:
+            datetime.strptime(text, date_format)
+            return True
+        except ValueError:
+            pass
+    return False
+
+
+def rib_bank_codes(bank):
+    """Return the RIB bank codes allowed for a BANQUE value, None if the bank is not known"""
+    name = normalize_text(bank)
+    for fragment, codes in RIB_BANK_CODES.items():
+        if fragment in name:
+            return codes
+    return None
+
+
+def rib_remainders(ribs):
+    """Remainders mod 97 of an array of 24-digit RIB strings (0 when the key is right)"""
+    import numpy as np
+
+    digits = np.frombuffer(np.asarray(ribs, dtype=f"S{RIB_LENGTH}").tobytes(), dtype=np.uint8)
+    digits = digits.reshape(-1, RIB_LENGTH).astype(np.int64) - ord("0")
+    weights = np.array([pow(10, RIB_LENGTH - 1 - i, 97) for i in range(RIB_LENGTH)], dtype=np.int64)
+    return digits @ weights % 97
+
+
+def validate_batch(rows, doc_type=None):
+    """Check batch rows (engine row dicts) before anything is rendered or printed
+
+    Every check is one pass over a whole column: document type, required
+    fields, amounts (parsed like format_amount), dates, RIB format and key, and
+    the RIB bank code against BANQUE. Rows sharing payee, amount and date are
+    reported as warnings. Returns BatchIssue tuples ordered by line, line 2
+    being the first row under the header as in the batch file.
+    """
+    import numpy as np
+    import pandas as pd
+
+    df = pd.DataFrame.from_records(rows)
+    issues = []
+
+    def column(name, clean=str.strip):
+        """Cleaned text of a column as an object array ("" where missing), each distinct value cleaned once"""
+        if name not in df:
+            return np.full(len(df), "", dtype=object)
+        codes, uniques = pd.factorize(df[name])
+        return np.array([clean(str(value)) for value in uniques.tolist()] + [""], dtype=object)[codes]
+
+    def flag(mask, field, severity, message, values=None):
+        """Add an issue for each row in mask, with the row's value appended to message if values are given"""
+        positions = np.flatnonzero(mask)
+        texts = (message + str(value) for value in values[positions]) if values is not None else itertools.repeat(message)
+        issues.extend(BatchIssue(int(i) + 2, field, severity, text) for i, text in zip(positions, texts))
+
+    doc_types = column("document", lambda value: value.strip().lower())
+    if doc_type:
+        doc_types[doc_types == ""] = doc_type
+    flag(~pd.Series(doc_types).isin(DOC_TYPES).to_numpy(), "document", ISSUE_ERROR, "Type de document inconnu: ",
+         np.where(doc_types == "", "(vide)", doc_types))
+    values = {field: column(field) for field in FIELD_LABELS if field != "document"}
+    for row_type, fields in REQUIRED_FIELDS.items():
+        for field in fields:
+            flag((doc_types == row_type) & (values[field] == ""), field, ISSUE_ERROR, f"{FIELD_LABELS[field]} obligatoire")
+
+    amounts = values["amount"]
+    centimes = parse_amounts(pd.Series(amounts, dtype=object))
+    parsed = centimes.notna().to_numpy(dtype=bool)
+    flag((amounts != "") & ~parsed, "amount", ISSUE_ERROR, "Montant invalide: ", amounts)
+    in_range = (centimes < MAX_WORDS_AMOUNT * 100).fillna(False).to_numpy(dtype=bool)
+    flag(parsed & ~in_range, "amount", ISSUE_ERROR, "Montant hors limites: ", amounts)
+    flag((centimes == 0).fillna(False).to_numpy(dtype=bool), "amount", ISSUE_WARNING, "Montant nul")
+
+    for field in DATE_FIELDS:
+        dates = values[field]
+        invalid = [text for text in pd.unique(dates[dates != ""]) if not is_valid_date(text)]
+        if invalid:
+            flag(pd.Series(dates).isin(invalid).to_numpy(), field, ISSUE_ERROR, f"{FIELD_LABELS[field]} invalide: ", dates)
+
+    ribs = pd.Series(values["rib"], dtype=object).str.replace(RIB_SEPARATORS, "", regex=True)
+    well_formed = ribs.str.fullmatch(rf"\d{{{RIB_LENGTH}}}").to_numpy(dtype=bool)
+    flag((values["rib"] != "") & ~well_formed, "rib", ISSUE_ERROR,
+         f"RIB invalide ({RIB_LENGTH} chiffres attendus): ", values["rib"])
+    bad_key = np.zeros(len(df), dtype=bool)
+    if well_formed.any():
+        bad_key[well_formed] = rib_remainders(ribs[well_formed].to_numpy()) != 0
+    flag(bad_key, "rib", ISSUE_ERROR, "Clé RIB invalide: ", values["rib"])
+
+    # Bank codes are checked once per distinct (BANQUE, code) pair
+    banks, codes = values["bank"], ribs.str[:3].to_numpy(dtype=object)
+    checked = well_formed & ~bad_key & (banks != "")
+    mismatched = [(bank, code) for bank, code in set(zip(banks[checked].tolist(), codes[checked].tolist()))
+                  if rib_bank_codes(bank) is not None and code not in rib_bank_codes(bank)]
+    mismatch = np.zeros(len(df), dtype=bool)
+    if mismatched:
+        mismatch[checked] = pd.MultiIndex.from_arrays([banks[checked], codes[checked]]).isin(mismatched)
+    flag(mismatch, "bank", ISSUE_ERROR, "Code banque du RIB incompatible avec la banque: ",
+         codes.astype(object) + " / " + banks)
+
+    # Duplicate payments: rows are keyed by a hash of (payee, amount, date); payees are
+    # only normalized on rows whose amount and date already occur more than once
+    eligible = parsed & (values["payee"] != "")
+    if eligible.sum() > 1:
+        dates = np.where(values["date"] != "", values["date"], values["due_date"])
+        keys = pd.DataFrame({"centimes": centimes.fillna(-1).to_numpy(dtype=np.int64), "date": dates})
+        eligible &= keys.duplicated(keep=False).to_numpy()
+    eligible = np.flatnonzero(eligible)
+    if len(eligible) > 1:
+        payee_codes, payee_names = pd.factorize(values["payee"][eligible])
+        keys = keys.iloc[eligible].assign(
+            payee=np.array([normalize_text(name) for name in payee_names.tolist()], dtype=object)[payee_codes])
+        hashes = pd.Series(pd.util.hash_pandas_object(keys, index=False).to_numpy(), index=eligible)
+        mask = np.zeros(len(df), dtype=bool)
+        mask[eligible[hashes.duplicated().to_numpy()]] = True
+        lines = np.zeros(len(df), dtype=np.int64)
+        lines[eligible] = hashes.index.to_series().groupby(hashes.to_numpy()).transform("min").to_numpy() + 2
+        flag(mask, "payee", ISSUE_WARNING, "Même bénéficiaire, montant et date que la ligne ", lines)
+
+    issues.sort(key=lambda issue: issue.line)
+    return issues
+
+
+def format_issues(issues, limit=20):
+    """Text report of validation issues, limited to the first limit lines"""
+    lines = [f"Ligne {issue.line} ({issue.severity}): {issue.message}" for issue in issues[:limit]]
+    if len(issues) > limit:
+        lines.append(f"... et {len(issues) - limit} autre(s)")
+    return "\n".join(lines)
+
+
+def rasterize_pdf(pdf_bytes, dpi=100):
+    """Rasterize the first page of an in-memory PDF to a PIL image
+
+    Poppler's pdftoppm reads the PDF on stdin and writes the PNG on stdout, so
+    nothing touches the disk. pdf2image (which goes through a temporary file)
+    is only used when pdftoppm is not on the PATH.
+    """
+    try:
+        result = subprocess.run(
+            ["pdftoppm", "-png", "-r", str(dpi), "-f", "1", "-l", "1", "-singlefile", "-"],
+            input=pdf_bytes, capture_output=True, check=True)
+        from PIL import Image
+        return Image.open(io.BytesIO(result.stdout))
+    except FileNotFoundError:
+        from pdf2image import convert_from_bytes
+        return convert_from_bytes(pdf_bytes, dpi=dpi, first_page=1, last_page=1)[0]
+
+
+def convert_word_template(path, digest, cache_dir=None):
+    """Convert a Word template to PDF with LibreOffice, once per file content; return the PDF path
+
+    soffice is taken from REGLIO_SOFFICE, the PATH or the default Windows install.
+    """
+    cache_dir = cache_dir or TEMPLATE_DIR
+    target = os.path.join(cache_dir, f"{digest}.pdf")
+    if os.path.exists(target):
+        return target
+
+    soffice = os.environ.get("REGLIO_SOFFICE") or shutil.which("soffice") or shutil.which("libreoffice")
+    if not soffice and os.name == 'nt':
+        candidate = os.path.join(os.environ.get("PROGRAMFILES", r"C:\Program Files"),
+                                 "LibreOffice", "program", "soffice.exe")
+        soffice = candidate if os.path.exists(candidate) else None
+    if not soffice:
+        raise RuntimeError("LibreOffice introuvable: installez-le ou importez le modèle exporté en PDF")
+
+    import pathlib
+
+    os.makedirs(cache_dir, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=cache_dir) as work:
+        # A private profile lets the conversion run while LibreOffice is open
+        profile = pathlib.Path(work, "profile").as_uri()
+        result = subprocess.run([soffice, f"-env:UserInstallation={profile}", "--headless",
+                                 "--convert-to", "pdf", "--outdir", work, path],
+                                capture_output=True, text=True, timeout=180)
+        produced = os.path.join(work, os.path.splitext(os.path.basename(path))[0] + ".pdf")
+        if not os.path.exists(produced):
+            raise RuntimeError(f"Conversion du modèle impossible: {result.stderr.strip() or result.stdout.strip()}")
+        os.replace(produced, target)
+    return target
+
+
+@functools.lru_cache(maxsize=8)
+def template_image(source, digest, dpi):
+    """Background image of a template source: first page of a PDF, or an image file"""
+    from PIL import Image
+
+    if source.lower().endswith(".pdf"):
+        with open(source, "rb") as f:
+            image = rasterize_pdf(f.read(), dpi=dpi)
+    else:
+        image = Image.open(source)
+    return image.convert("RGB")
+
+
+@functools.lru_cache(maxsize=8)
+def template_pdf_page(source, digest):
+    """First page of a PDF template as a pdfrw form, parsed once per content; None without pdfrw"""
+    try:
+        from pdfrw import PdfReader
+        from pdfrw.buildxobj import pagexobj
+    except ImportError:
+        return None
+    return pagexobj(PdfReader(source).pages[0])
+
+
+def template_jpeg(template, dpi=TEMPLATE_DPI):
+    """JPEG of a template's background, encoded once per content in TEMPLATE_DIR; return its path
+
+    ReportLab embeds a JPEG file as it is, so drawing the background costs a
+    file read instead of compressing the raster again for every document.
+    """
+    cache_dir = template.cache_dir or TEMPLATE_DIR
+    target = os.path.join(cache_dir, f"{template.digest}_{dpi}.jpg")
+    if not os.path.exists(target):
+        os.makedirs(cache_dir, exist_ok=True)
+        temp_path = f"{target}.{os.getpid()}.tmp"
+        template.image(dpi).save(temp_path, "JPEG", quality=TEMPLATE_JPEG_QUALITY)
+        os.replace(temp_path, target)
+    return target
+
+
+class PageTemplate:
+    """A page background (Word, PDF or image file) embedded once per PDF as a form XObject
+
+    Word files are converted to PDF once per content (see convert_word_template).
+    The first PDF page is imported as vector content with pdfrw when it is
+    installed, otherwise it is rasterized like an image. Both are prepared
+    once per content (parsed page, cached JPEG) and reused by every canvas.
+    Every page of a document then draws the same form, so a page costs one
+    "Do" operator whatever the background.
+    """
+
+    def __init__(self, path, cache_dir=None):
+        ext = os.path.splitext(path)[1].lower()
+        if ext not in WORD_EXTENSIONS + (".pdf",) + IMAGE_EXTENSIONS:
+            raise ValueError(f"Format de modèle non pris en charge: {ext or path}")
+        self.path = path
+        self.cache_dir = cache_dir
+        self.signature = None
+        self.refresh()
+
+    def refresh(self):
+        """Re-hash (and re-convert) the file if it changed since the last call"""
+        stat = os.stat(self.path)
+        signature = (stat.st_size, stat.st_mtime_ns)
+        if signature == self.signature:
+            return False
+        self.digest = file_digest(self.path)
+        self.name = f"reglio_template_{self.digest[:16]}"
+        if os.path.splitext(self.path)[1].lower() in WORD_EXTENSIONS:
+            self.source = convert_word_template(self.path, self.digest, self.cache_dir)
+        else:
+            self.source = self.path
+        self.signature = signature
+        return True
+
+    def image(self, dpi=TEMPLATE_DPI):
+        """The background as a PIL image (shared, not to be drawn on)"""
+        return template_image(self.source, self.digest, dpi)
+
+    def define(self, c, page_size):
+        """Add the background form to canvas c unless it is already there; return its name"""
+        if c.hasForm(self.name):
+            return self.name
+        width, height = page_size
+        page = None
+        if self.source.lower().endswith(".pdf"):
+            page = template_pdf_page(self.source, self.digest)
+
+        c.beginForm(self.name, 0, 0, width, height)
+        if page is not None:
+            from pdfrw.toreportlab import makerl
+            x0, y0, x1, y1 = (float(value) for value in page.BBox)
+            c.scale(width / (x1 - x0), height / (y1 - y0))
+            c.translate(-x0, -y0)
+            c.doForm(makerl(c, page))
+        else:
+            c.drawImage(template_jpeg(self), 0, 0, width, height)
+        c.endForm()
+        return self.name
+
+
+class GlyphWidths(dict):
+    """Advance widths of one font's characters at 1 point, measured with pdfmetrics on first use"""
+
+    def __init__(self, font_name):
+        super().__init__()
+        self.font_name = font_name
+
+    def __missing__(self, char):
+        width = self[char] = pdfmetrics.stringWidth(char, self.font_name, 1)
+        return width
+
+
+@functools.lru_cache(maxsize=None)
+def glyph_widths(font_name):
+    """Shared GlyphWidths table of a registered font"""
+    return GlyphWidths(font_name)
+
+
+def text_width(text, font_name, size):
+    """Width of text in points, as pdfmetrics.stringWidth computes it, from cached glyph widths"""
+    return sum(map(glyph_widths(font_name).__getitem__, text)) * size
+
+
+def pack_words(words, slots, scale, overflow=False):
+    """Fill (font, size, width) slots line by line with words at size * scale
+
+    Returns the lines, or None if the words need more lines than there are
+    slots or a single word is wider than its line. With overflow=True the last
+    line takes whatever is left instead.
+    """
+    lines = []
+    start = 0
+    for font_name, size, width in slots:
+        widths = glyph_widths(font_name)
+        limit = width / (size * scale)  # Compared at 1 point
+        space = widths[" "]
+        used = -space
+        end = start
+        while end < len(words):
+            word = sum(map(widths.__getitem__, words[end]))
+            if end > start and used + space + word > limit:
+                break
+            used += space + word
+            end += 1
+        if used > limit and not overflow:
+            return None
+        lines.append(" ".join(words[start:end]))
+        start = end
+        if start == len(words):
+            return tuple(lines)
+    if not overflow:
+        return None
+    lines[-1] = " ".join([lines[-1]] + words[start:])
+    return tuple(lines)
+
+
+@functools.lru_cache(maxsize=65536)
+def fit_text(text, slots, min_scale=FIT_MIN_SCALE):
+    """Break text at spaces over the (font, size, width) slots, one line each: returns (lines, scale)
+
+    Lines break at word boundaries and fill the slots in order; only if the
+    words do not fit at the layout size are all the sizes scaled down together,
+    FIT_SCALE_STEP at a time. At min_scale the last line takes the remaining
+    words even if it overflows. Cached: bulk runs repeat the same texts.
+    """
+    words = text.split()
+    if not words:
+        return (), 1.0
+    for step in range(round((1 - min_scale) / FIT_SCALE_STEP) + 1):
+        scale = 1 - step * FIT_SCALE_STEP
+        lines = pack_words(words, slots, scale)
+        if lines is not None:
+            return lines, scale
+    return pack_words(words, slots, min_scale, overflow=True), min_scale
+
+
+# Compiled field layout: coordinates in points, resolved font and the most lines the text may wrap over
+FieldPlan = collections.namedtuple("FieldPlan", "x top width font size align lines")
+
+
+def compile_render_plan(layout, doc_height_mm):
+    """Compile a layout into {field_name: FieldPlan} for a page doc_height_mm high"""
+    plan = {}
+    for field_name, config in layout.items():
+        plan[field_name] = FieldPlan(
+            x=config['x'] * mm,
+            top=(doc_height_mm - config['y']) * mm,
+            width=config['max_width'] * mm,
+            font=resolve_font(config['font']),
+            size=config['size'],
+            align=config['align'],
+            lines=config.get('lines', 1)
+        )
+    return plan
+
+
+def place_lines(plan, lines, size):
+    """Yield (x, baseline, line) in points from the bottom-left corner for lines fitted to plan's box
+
+    The first line's text top sits at the top of the box. The PDF and the
+    preview both place text through here, so they cannot drift apart.
+    """
+    baseline = plan.top - size
+    for line in lines:
+        x = plan.x
+        if plan.align in ("center", "right"):
+            free = plan.width - text_width(line, plan.font, size)
+            x += free / 2 if plan.align == "center" else free
+        yield x, baseline, line
+        baseline -= size * LINE_LEADING
+
+
+class DocumentEngine:
+    """Headless document renderer shared by the GUI and batch mode
+
+    Layouts are compiled once into render plans. Field texts are fitted to
+    their boxes with fit_text (cached glyph widths, word wrap, shrinking as a
+    last resort) and drawn with direct canvas text calls.
+    """
+
+    def __init__(self, bank=None, layout_cache=None):
+        # Fonts are registered and layouts compiled on the first render
+        self.layout_cache = layout_cache or LayoutCache()
+        self.bank = bank
+        self.layouts = self.plans = None
+        self.templates = {}  # doc_type -> PageTemplate drawn behind each page
+
+    def refresh_layouts(self):
+        """Pick up the current bank's layout, recompiled only if its file changed"""
+        layout = self.layout_cache.get(self.bank)
+        self.layouts, self.plans = layout.layouts, layout.plans
+
+    def set_template(self, doc_type, path):
+        """Draw path (Word, PDF or image) behind every doc_type page; None removes the background
+
+        The template is converted and embedded once here, so a file that cannot
+        be used fails now rather than at generation time.
+        """
+        if not path:
+            self.templates.pop(doc_type, None)
+            return None
+        template = PageTemplate(path)
+        template.define(canvas.Canvas(io.BytesIO(), pagesize=PAGE_SIZES[doc_type]), PAGE_SIZES[doc_type])
+        self.templates[doc_type] = template
+        return template
+
+    def template_form(self, c, doc_type, define=True):
+        """Name of doc_type's background form, defined on canvas c unless define=False; None without template"""
+        template = self.templates.get(doc_type)
+        if template is None:
+            return None
+        if not define:
+            return template.name
+        template.refresh()
+        return template.define(c, PAGE_SIZES[doc_type])
+
+    def prepare_row(self, row):
+        """Return a copy of row with formatted amount and amount in words filled in"""
+        row = {key: ("" if value is None else str(value)) for key, value in row.items()}
+        amount = row.get("amount", "")
+        if amount and not row.get("amount_words"):
+            row["amount_words"] = amount_to_words(amount)
+        if amount:
+            row["amount"] = format_amount(amount)
+        return row
+
+    def fit_field(self, plan, text):
+        """Return (lines, font size) of text fitted to plan's box
+
+        Single-line fields (amounts, dates, numbers...) are never broken, only
+        shrunk, and text that fits is returned as is without going through
+        fit_text; others wrap over up to plan.lines lines.
+        """
+        if plan.lines == 1 and text_width(text, plan.font, plan.size) <= plan.width:
+            return (text,), plan.size
+        lines, scale = fit_text(text, ((plan.font, plan.size, plan.width),) * plan.lines)
+        return lines, plan.size * scale
+
+    def fit_fields(self, doc_type, row):
+        """Return [(plan, lines, font size), ...] for the fields of row's doc_type page
+
+        The amount in words is spread over the layout's "amount in letters line N"
+        fields, in order, at one common size.
+        """
+        plans = self.plans[doc_type]
+        fitted = []
+        for field_name, text in self.page_fields(doc_type, row):
+            if not text:
+                continue
+            if field_name == AMOUNT_WORDS_FIELD:
+                group = []
+                while f"{AMOUNT_WORDS_FIELD} line {len(group) + 1}" in plans:
+                    group.append(plans[f"{AMOUNT_WORDS_FIELD} line {len(group) + 1}"])
+                if group:
+                    lines, scale = fit_text(text, tuple((plan.font, plan.size, plan.width) for plan in group))
+                    fitted += [(plan, (line,), plan.size * scale) for plan, line in zip(group, lines)]
+            elif field_name in plans:
+                fitted.append((plans[field_name], *self.fit_field(plans[field_name], text)))
+        return fitted
+
+    def draw_lines(self, canvas, plan, lines, size):
+        """Draw fitted lines in plan's box, placed by place_lines"""
+        canvas.setFont(plan.font, size)
+        for x, baseline, line in place_lines(plan, lines, size):
+            canvas.drawString(x, baseline, line)
+
+    def draw_field(self, canvas, text, field_name, doc_type):
+        """Draw one field's text, wrapped (and shrunk if need be) to its box"""
+        plan = self.plans[doc_type].get(field_name)
+        if plan and text:
+            self.draw_lines(canvas, plan, *self.fit_field(plan, text))
+
+    def draw_page(self, c, doc_type, row):
+        """Draw the fields of one doc_type page"""
+        for plan, lines, size in self.fit_fields(doc_type, row):
+            self.draw_lines(c, plan, lines, size)
+
+    def cheque_fields(self, row):
+        """Return the (field_name, text) pairs of a cheque page"""
+        return [("payee", row.get("payee", "")), ("amount", row.get("amount", "")),
+                (AMOUNT_WORDS_FIELD, row.get("amount_words", "")),
+                ("ville", row.get("city", "")), ("date", row.get("date", ""))]
+
+    def virement_fields(self, row):
+        """Return the (field_name, text) pairs of a virement page"""
+        fields = [("virement_num", f"VIR {row.get('virement_num', '')}"), ("amount", row.get("amount", "")),
+                  (AMOUNT_WORDS_FIELD, row.get("amount_words", ""))]
+        fields += [(key, row.get(key, "")) for key in ("payee", "type", "motif", "rib", "bank", "city")]
+        return fields
+
+    def letter_fields(self, row):
+        """Return the (field_name, text) pairs of a lettre de change page"""
+        return [("amount", row.get("amount", "")), (AMOUNT_WORDS_FIELD, row.get("amount_words", "")),
+                ("payee 1", row.get("payee", "")), ("due date", row.get("due_date", "")),
+                ("city and edition date", f"{row.get('city', '')}, le {row.get('edition_date', '')}"),
+                ("label", row.get("label", ""))]
+
+    def page_fields(self, doc_type, row):
+        """Return the (field_name, text) pairs drawn on a doc_type page"""
+        return getattr(self, f"{doc_type}_fields")(row)
+
+    def prime_fonts(self, c):
+        """Fix font resource names and TrueType codes so page streams are portable between canvases
+
+        Every canvas primed this way maps the layout fonts to the same /Fn names
+        and the FONT_REPERTOIRE characters to the same subset codes.
+        """
+        doc = c._doc
+        fonts = sorted({plan.font for plans in self.plans.values() for plan in plans.values()})
+        for font_name in fonts:
+            font = pdfmetrics.getFont(font_name)
+            if font._dynamicFont:
+                font.splitString(FONT_REPERTOIRE, doc)
+                for subset in range(len(font.state[doc].subsets)):
+                    font.getSubsetInternalName(subset, doc)
+            else:
+                doc.getInternalFontName(font_name)
+        return fonts
+
+    def merge_blocker(self, doc_type, rows):
+        """Why render_pages streams of rows could not be merged by write_pages, None if they can
+
+        Checked before any page is rendered: the ReportLab release must be in
+        REPORTLAB_MERGE_VERSIONS, and text drawn in a TrueType font may only use
+        FONT_REPERTOIRE characters.
+        """
+        version = reportlab_version()
+        low, high = REPORTLAB_MERGE_VERSIONS
+        if not low <= version < high:
+            return f"fusion des pages non vérifiée avec ReportLab {'.'.join(map(str, version))}"
+        self.refresh_layouts()
+        if not any(pdfmetrics.getFont(plan.font)._dynamicFont for plan in self.plans[doc_type].values()):
+            return None
+        used = set("".join(text for row in rows for field_name, text in self.page_fields(doc_type, row)))
+        outside = used.difference(FONT_REPERTOIRE)
+        if outside:
+            return f"caractères hors répertoire: {''.join(sorted(outside))[:20]}"
+        return None
+
+    def render_pages(self, doc_type, rows):
+        """Render rows into a list of raw page content streams for write_pages
+
+        Raises ValueError if a row uses a TrueType character outside
+        FONT_REPERTOIRE, whose code would differ in the merging canvas (callers
+        check merge_blocker first).
+        """
+        self.refresh_layouts()
+        c = canvas.Canvas(io.BytesIO(), pagesize=PAGE_SIZES[doc_type])
+        fonts = self.prime_fonts(c)
+        primed = {font_name: len(pdfmetrics.getFont(font_name).state[c._doc].assignments)
+                  for font_name in fonts if pdfmetrics.getFont(font_name)._dynamicFont}
+        form = self.template_form(c, doc_type, define=False)  # Defined by the merging canvas
+
+        pages = []
+        for row in rows:
+            if form:
+                c.doForm(form)
+            self.draw_page(c, doc_type, row)
+            pages.append("\n".join(c._code))
+            c._startPage()
+
+        for font_name, count in primed.items():
+            if len(pdfmetrics.getFont(font_name).state[c._doc].assignments) != count:
+                raise ValueError(f"Caractères hors répertoire pour la police {font_name}")
+        return pages
+
+    def write_pages(self, doc_type, pages, output, on_page=None):
+        """Assemble page streams from render_pages, in order, into one PDF"""
+        self.refresh_layouts()
+        c = canvas.Canvas(output, pagesize=PAGE_SIZES[doc_type])
+        self.prime_fonts(c)
+        form = self.template_form(c, doc_type)
+        page_number = 0
+        for page_number, page in enumerate(pages, 1):
+            c._code = [page]
+            if form:
+                c._formsinuse = [form]  # The page stream draws it; list it in the page resources
+            c.showPage()
+            if on_page:
+                on_page(page_number)
+        c.save()
+        return page_number
+
+    def render(self, doc_type, rows, output, on_page=None, prime=True):
+        """Render rows as a multi-page PDF (one page per row) into output path or file object
+
+        on_page(page_number) is called after each page (progress, cancellation).
+        prime=False embeds only the characters used instead of the whole
+        FONT_REPERTOIRE: smaller and faster for one-off documents, but no longer
+        byte-identical to a parallel render of the same rows.
+        """
+        if doc_type not in DOC_TYPES:
+            raise ValueError(f"Type de document inconnu: {doc_type}")
+
+        self.refresh_layouts()
+        c = canvas.Canvas(output, pagesize=PAGE_SIZES[doc_type])
+        if prime:
+            self.prime_fonts(c)  # Same resources as a parallel render of the same rows
+        form = self.template_form(c, doc_type)
+        for page_number, row in enumerate(rows, 1):
+            if form:
+                c.doForm(form)
+            self.draw_page(c, doc_type, row)
+            c.showPage()
+            if on_page:
+                on_page(page_number)
+        c.save()
+        return len(rows)
+
+    def render_bytes(self, doc_type, rows, prime=True):
+        """Render rows into an in-memory PDF and return its bytes"""
+        buffer = io.BytesIO()
+        self.render(doc_type, rows, buffer, prime=prime)
+        return buffer.getvalue()
+
+
+@functools.lru_cache(maxsize=64)
+def preview_font(font_name, size_px):
+    """PIL font matching a PDF font (its TrueType file, or a close sans-serif)"""
+    from PIL import ImageFont
+
+    pdf_font = pdfmetrics.getFont(font_name)
+    candidates = [getattr(getattr(pdf_font, "face", None), "filename", None)]
+    candidates += PREVIEW_FONT_FILES["bold" if "Bold" in font_name else "regular"]
+    for candidate in candidates:
+        if not candidate:
+            continue
+        try:
+            return ImageFont.truetype(candidate, size_px)
+        except OSError:
+            continue
+    return ImageFont.load_default(size_px)
+
+
+@functools.lru_cache(maxsize=4096)
+def preview_glyph(font_name, size_px, char):
+    """Rendered glyph mask and its offset from the line's top-left corner"""
+    from PIL import Image, ImageDraw
+
+    font = preview_font(font_name, size_px)
+    left, top, right, bottom = font.getbbox(char)
+    mask = Image.new("L", (max(1, right - left), max(1, bottom - top)), 0)
+    ImageDraw.Draw(mask).text((-left, -top), char, font=font, fill=255)
+    return mask, left, top
+
+
+def draw_glyphs(image, x, baseline, text, font_name, size, scale):
+    """Draw a line with PIL, placing each glyph at ReportLab's advance widths
+
+    x and baseline are in pixels. Spacing therefore matches the printed PDF
+    exactly even where PIL's own advances, kerning or hinting would differ.
+    """
+    size_px = max(1, round(size * scale))
+    top = baseline - preview_font(font_name, size_px).getmetrics()[0]
+    widths = glyph_widths(font_name)
+    for char in text:
+        if not char.isspace():
+            mask, dx, dy = preview_glyph(font_name, size_px, char)
+            image.paste("black", (round(x) + dx, round(top) + dy), mask)
+        x += widths[char] * size * scale
+
+
+@functools.lru_cache(maxsize=128)
+def render_font_preview(font_name, size, text, width=400, height=100, dpi=100):
+    """Font sample image drawn directly with PIL, cached by (font, size, text)
+
+    The text is fitted like a layout field 180 points wide, 10 points from the
+    left and 20 from the top, over as many lines as the image holds.
+    The returned image is shared by the cache: copy it before drawing on it.
+    """
+    from PIL import Image
+
+    image = Image.new("RGB", (width, height), "white")
+    scale = dpi / 72
+    page_height = height / scale
+    max_lines = max(1, 1 + int((page_height - 20 - size) // (size * LINE_LEADING)))
+    plan = FieldPlan(x=10, top=page_height - 20, width=180, font=font_name, size=size, align="left", lines=max_lines)
+    lines, fit_scale = fit_text(text, ((font_name, size, plan.width),) * max_lines)
+    for x, baseline, line in place_lines(plan, lines, size * fit_scale):
+        draw_glyphs(image, x * scale, (page_height - baseline) * scale, line, font_name, size * fit_scale, scale)
+    return image
+
+
+class PreviewRenderer:
+    """Preview images built from a cached page background and a PIL text overlay
+
+    The background (blank page, or the engine's page template) is rasterized
+    once per document type and resolution; each preview copies it and draws only the
+    field texts at their layout positions, so no PDF is rasterized. Printing
+    and saving still use the real PDF.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.backgrounds = {}
+        self.lock = threading.Lock()
+
+    def page_pixels(self, doc_type, dpi):
+        """Page size in pixels at dpi"""
+        width, height = PAGE_SIZES[doc_type]
+        return round(width * dpi / 72), round(height * dpi / 72)
+
+    def set_template(self, doc_type, path):
+        """Set doc_type's page template on the engine (None removes it) and drop its cached backgrounds"""
+        template = self.engine.set_template(doc_type, path)
+        with self.lock:
+            self.backgrounds = {key: image for key, image in self.backgrounds.items() if key[0] != doc_type}
+        return template
+
+    def background(self, doc_type, dpi):
+        """Return the cached background image (not to be drawn on)"""
+        from PIL import Image
+
+        template = self.engine.templates.get(doc_type)
+        key = (doc_type, dpi, template.digest if template else None)
+        with self.lock:
+            image = self.backgrounds.get(key)
+        if image is None:
+            size = self.page_pixels(doc_type, dpi)
+            try:
+                image = template.image(dpi).resize(size) if template else Image.new("RGB", size, "white")
+            except Exception as e:
+                print(f"Warning: template {template.path} not usable for preview: {e}")
+                image = Image.new("RGB", size, "white")
+            with self.lock:
+                self.backgrounds[key] = image
+        return image
+
+    def render(self, doc_type, row, dpi=PREVIEW_DPI):
+        """Return a PIL image of row's page: cached background plus field overlay"""
+        self.engine.refresh_layouts()
+        image = self.background(doc_type, dpi).copy()
+        scale = dpi / 72
+        page_height = PAGE_SIZES[doc_type][1]
+
+        # The same fitted lines and positions as the PDF (fit_fields, place_lines)
+        for plan, lines, size in self.engine.fit_fields(doc_type, row):
+            for x, baseline, line in place_lines(plan, lines, size):
+                draw_glyphs(image, x * scale, (page_height - baseline) * scale, line, plan.font, size, scale)
+        return image
+
+
+CachedDocument = collections.namedtuple("CachedDocument", "key doc_type virement_num payee date amount row created")
+
+
+class DocumentCache:
+    """Generated PDFs stored by a hash of their inputs, for reprints and identical regenerations
+
+    The key covers the row, the document type, the layout fields and fonts,
+    the page template and DOCUMENT_CACHE_VERSION, so anything that would change
+    the output gives a new key. Files live in <directory>/<key[:2]>/<key>.pdf;
+    an SQLite index records their size and last use, and the virement number,
+    payee and date they were made for. Past max_bytes the least recently used
+    files are deleted.
+    """
+
+    def __init__(self, directory=DOCUMENT_CACHE_DIR, max_bytes=DOCUMENT_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.layout_digests = {}  # doc_type -> (CompiledLayout, digest)
+        os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(os.path.join(directory, "index.sqlite"), check_same_thread=False)
+        # Local cache index: losing the last few updates in a crash is harmless, so no fsync per lookup
+        self.conn.executescript("""
+            PRAGMA journal_mode = WAL;
+            PRAGMA synchronous = NORMAL;
+            CREATE TABLE IF NOT EXISTS documents (
+                key TEXT PRIMARY KEY, doc_type TEXT NOT NULL, virement_num TEXT, payee TEXT, payee_key TEXT,
+                date TEXT, amount TEXT, row TEXT NOT NULL, size INTEGER NOT NULL, created TEXT NOT NULL,
+                used REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS documents_virement ON documents (virement_num);
+            CREATE INDEX IF NOT EXISTS documents_payee ON documents (payee_key, date);
+            CREATE INDEX IF NOT EXISTS documents_used ON documents (used);
+        """)
+        self.size = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM documents").fetchone()[0]
+
+    def path(self, key):
+        """File holding the document for key"""
+        return os.path.join(self.directory, key[:2], key + ".pdf")
+
+    def layout_digest(self, engine, doc_type):
+        """Hash of the layout fields and resolved fonts engine draws doc_type with, cached per compiled layout"""
+        layout = engine.layout_cache.get(engine.bank)
+        cached = self.layout_digests.get(doc_type)
+        if cached and cached[0] is layout:
+            return cached[1]
+        fonts = {field_name: plan.font for field_name, plan in layout.plans[doc_type].items()}
+        text = json.dumps([layout.layouts[doc_type], fonts], sort_keys=True, default=dict)
+        digest = hashlib.sha1(text.encode("utf-8")).hexdigest()
+        self.layout_digests[doc_type] = (layout, digest)
+        return digest
+
+    def key(self, engine, doc_type, row):
+        """Content key of the doc_type document engine would render for row"""
+        template = engine.templates.get(doc_type)
+        if template is not None:
+            template.refresh()
+        text = json.dumps([DOCUMENT_CACHE_VERSION, doc_type, self.layout_digest(engine, doc_type),
+                           template.digest if template else None, row], sort_keys=True, default=str)
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """Return the cached PDF bytes for key (marking them recently used), None if absent"""
+        try:
+            with open(self.path(key), "rb") as f:
+                pdf = f.read()
+        except FileNotFoundError:
+            return None
+        with self.lock, self.conn:
+            self.conn.execute("UPDATE documents SET used = ? WHERE key = ?", (time.time(), key))
+        return pdf
+
+    def put(self, key, doc_type, row, pdf):
+        """Store a rendered document and index it, evicting old documents past max_bytes"""
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(pdf)
+        os.replace(temp_path, path)
+        parsed = VirementLedger.parse_number(row.get("virement_num", ""))
+        payee = row.get("payee", "")
+        with self.lock, self.conn:
+            # A key stored again (concurrent miss, re-render) replaces its row: count only the difference
+            replaced = self.conn.execute("SELECT size FROM documents WHERE key = ?", (key,)).fetchone()
+            self.conn.execute(
+                "INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, doc_type, f"{parsed[0]}/{parsed[1]:03d}" if parsed else None, payee, normalize_text(payee),
+                 row.get("date") or row.get("edition_date", ""), row.get("amount", ""),
+                 json.dumps(row, ensure_ascii=False), len(pdf), datetime.now().isoformat(timespec="seconds"),
+                 time.time()))
+            self.size += len(pdf) - (replaced[0] if replaced else 0)
+        if self.size > self.max_bytes:
+            self.evict()
+
+    def render(self, engine, doc_type, row):
+        """Return (pdf bytes, True if read from the cache) for one document, rendering and storing it on a miss"""
+        try:
+            key = self.key(engine, doc_type, row)
+            pdf = self.get(key)
+        except (OSError, sqlite3.Error) as e:
+            print(f"Warning: document cache unavailable: {e}")
+            return engine.render_bytes(doc_type, [row]), False
+        if pdf is not None:
+            return pdf, True
+        pdf = engine.render_bytes(doc_type, [row])
+        try:
+            self.put(key, doc_type, row, pdf)
+        except (OSError, sqlite3.Error) as e:
+            print(f"Warning: document not cached: {e}")
+        return pdf, False
+
+    def evict(self):
+        """Delete least recently used documents until the cache is under 90% of max_bytes"""
+        with self.lock:
+            total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM documents").fetchone()[0]
+            removed = []
+            for key, size in self.conn.execute("SELECT key, size FROM documents ORDER BY used"):
+                if total <= self.max_bytes * 0.9:
+                    break
+                removed.append((key,))
+                total -= size
+            with self.conn:
+                self.conn.executemany("DELETE FROM documents WHERE key = ?", removed)
+            self.size = total
+        for key, in removed:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(self.path(key))
+        return len(removed)
+
+    def find(self, virement_num=None, payee=None, date=None, limit=50):
+        """Cached documents matching a virement number, part of a payee name and/or a date, newest first"""
+        conditions, params = [], []
+        if virement_num:
+            parsed = VirementLedger.parse_number(virement_num)
+            conditions.append("virement_num = ?")
+            params.append(f"{parsed[0]}/{parsed[1]:03d}" if parsed else str(virement_num))
+        if payee:
+            conditions.append("payee_key LIKE ?")
+            params.append(f"%{normalize_text(payee).strip()}%")
+        if date:
+            conditions.append("date = ?")
+            params.append(date)
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT key, doc_type, virement_num, payee, date, amount, row, created"
+                f" FROM documents{where} ORDER BY created DESC, rowid DESC LIMIT ?", params + [limit]).fetchall()
+        return [CachedDocument(*row[:6], json.loads(row[6]), row[7]) for row in rows]
+
+    def close(self):
+        """Close the SQLite connection"""
+        with self.lock:
+            self.conn.close()
+
+
+_worker_engine = None
+
+
+def _worker(bank=None, templates=None):
+    """Return this process's engine, set to bank and page templates"""
+    global _worker_engine
+    if _worker_engine is None:
+        _worker_engine = DocumentEngine()
+    _worker_engine.bank = bank
+    _worker_engine.templates = templates or {}
+    return _worker_engine
+
+
+def _warm_worker(bank=None):
+    """Process pool initializer: register fonts, compile layouts and run each draw path once"""
+    import signal
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl-C stops the service; it shuts the pool down
+    engine = _worker(bank)
+    for doc_type in DOC_TYPES:
+        engine.render_bytes(doc_type, [{}])
+
+
+def _render_chunk(doc_type, rows, bank=None, templates=None):
+    """Process pool task: render one shard of a batch into page streams"""
+    return _worker(bank, templates).render_pages(doc_type, rows)
+
+
+def _render_document(doc_type, rows, bank=None, templates=None):
+    """Process pool task: render prepared rows into PDF bytes"""
+    return _worker(bank, templates).render_bytes(doc_type, rows, prime=False)
+
+
+def reportlab_version():
+    """Installed ReportLab release as a tuple of ints ("4.2.5" -> (4, 2, 5))"""
+    import reportlab
+
+    return tuple(int(part) for part in re.findall(r"\d+", reportlab.Version)[:3])
+
+
+def render_parallel(engine, doc_type, rows, output, executor, workers, on_page=None):
+    """Shard rows across a process pool and merge the pages back in input order
+
+    Only for rows engine.merge_blocker() accepts.
+    """
+    # A few chunks per worker keeps cores busy when some chunks render slower
+    chunk_size = -(-len(rows) // (workers * 4))
+    chunks = [rows[i:i + chunk_size] for i in range(0, len(rows), chunk_size)]
+    futures = [executor.submit(_render_chunk, doc_type, chunk, engine.bank, engine.templates) for chunk in chunks]
+    try:
+        pages = (page for future in futures for page in future.result())
+        return engine.write_pages(doc_type, pages, output, on_page=on_page)
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+def unnumbered_virements(rows, doc_type=None):
+    """Count the batch rows that are virements without a number (to be reserved in the ledger)"""
+    return sum((row.get("document") or doc_type or "").strip().lower() == "virement" and not row.get("virement_num")
+               for row in rows)
+
+
+def generate_batch(source, output_dir, doc_type=None, engine=None, on_page=None, workers=None, executor=None,
+                   validate=True, ledger=None, volume_pages=None, timer=None):
+    """Render a batch of rows into multi-page PDFs, one per document type or per volume
+
+    Rows carrying a "document" column are grouped by it, otherwise doc_type applies
+    to every row. Virements without a number get a block reserved in the ledger,
+    voided if the batch fails; without a ledger they raise ValueError, as numbers
+    counted from scratch would repeat those of earlier runs.
+    on_page(doc_type, page_number, page_count) is called after each page.
+    With workers > 1 (or an executor) large batches are rendered in a process pool,
+    unless their pages could not be merged: they are then rendered here, and
+    the reason noted on timer.
+    Rows are first checked with validate_batch (unless the caller already did,
+    validate=False); errors raise ValueError with the report.
+
+    A canvas keeps every page until it is saved, so with volume_pages each type
+    rolls over into numbered volume files of at most that many pages, each saved
+    before the next is drawn, and memory stays bounded whatever the batch size.
+    lot_<stamp>_index.csv then maps every source line to its file and page.
+    Returns {doc_type: ([pdf_path, ...], prepared_rows)}.
+    """
+    engine = engine or DocumentEngine()
+    rows = read_batch_rows(source)
+    if validate:
+        errors = [issue for issue in validate_batch(rows, doc_type) if issue.severity == ISSUE_ERROR]
+        if errors:
+            raise ValueError(f"Lot invalide:\n{format_issues(errors)}")
+
+    # Amounts in words for the whole column at once
+    words = amounts_to_words([row.get("amount", "") for row in rows])
+    invalid = [str(i + 2) for i, (row, text) in enumerate(zip(rows, words))
+               if row.get("amount") and not isinstance(text, str)]
+    if invalid:
+        raise ValueError(f"Montant invalide ligne(s): {', '.join(invalid[:10])}")
+    for row, text in zip(rows, words):
+        if isinstance(text, str) and not row.get("amount_words"):
+            row["amount_words"] = text
+
+    groups, lines = {}, {}
+    for line, row in enumerate(rows, 2):
+        row_type = (row.get("document") or doc_type or "").strip().lower()
+        if row_type not in DOC_TYPES:
+            raise ValueError(f"Type de document inconnu: {row_type or '(vide)'}")
+        groups.setdefault(row_type, []).append(engine.prepare_row(row))
+        lines.setdefault(row_type, []).append(line)
+
+    # Numbers are allocated here, in input order, before any rendering is sharded
+    unnumbered = [row for row in groups.get("virement", []) if not row.get("virement_num")]
+    if unnumbered and not ledger:
+        raise ValueError(f"Numérotation des virements impossible sans journal: {len(unnumbered)} virement(s) sans numéro")
+    reserved = ledger.reserve(len(unnumbered)) if unnumbered else []
+    for row, number in zip(unnumbered, reserved):
+        row["virement_num"] = number
+
+    if executor is not None:
+        workers = workers or executor._max_workers
+    parallel = bool(workers and workers > 1) and any(len(rows) >= PARALLEL_MIN_ROWS for rows in groups.values())
+    pool = executor
+    if parallel and pool is None:
+        pool = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+
+    results = {}
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    index = None
+    try:
+        if volume_pages:
+            index = open(os.path.join(output_dir, f"lot_{stamp}_index.csv"), "w", newline="", encoding="utf-8-sig")
+            index_writer = csv.writer(index, delimiter=";")
+            index_writer.writerow(BATCH_INDEX_COLUMNS)
+        for row_type, rows in groups.items():
+            paths = []
+            for start in range(0, len(rows), volume_pages or len(rows)):
+                volume = rows[start:start + volume_pages] if volume_pages else rows
+                name = f"{row_type}_{stamp}_{len(paths) + 1:03d}" if volume_pages else f"{row_type}_{stamp}"
+                output_path = os.path.join(output_dir, name + ".pdf")
+                page_callback = None
+                if on_page:
+                    # Page numbers run on across volumes
+                    page_callback = lambda page_number, start=start: on_page(row_type, start + page_number, len(rows))
+                sequential = not parallel or len(volume) < PARALLEL_MIN_ROWS
+                if not sequential:
+                    blocker = engine.merge_blocker(row_type, volume)
+                    if blocker:
+                        sequential = True
+                        if timer:
+                            timer.note(f"{row_type}: rendu séquentiel, {blocker}")
+                if sequential:
+                    engine.render(row_type, volume, output_path, on_page=page_callback)
+                else:
+                    render_parallel(engine, row_type, volume, output_path, pool, workers, on_page=page_callback)
+                paths.append(output_path)
+                if index:
+                    file_name = os.path.basename(output_path)
+                    index_writer.writerows(
+                        (line, row_type, file_name, page, row.get("virement_num", ""), row.get("payee", ""),
+                         row.get("amount", ""))
+                        for page, (line, row) in enumerate(zip(lines[row_type][start:start + len(volume)], volume), 1))
+                    index.flush()
+            results[row_type] = (paths, rows)
+    except BaseException as e:
+        if reserved:
+            ledger.void(reserved, f"lot non généré: {e}")
+        raise
+    finally:
+        if index:
+            index.close()
+        if pool is not None and pool is not executor:
+            pool.shutdown(cancel_futures=True)
+    return results
+
+
+def service_row(record):
+    """Map a JSON row (engine keys or batch file headers) to an engine row dict"""
+    if not isinstance(record, dict):
+        raise ValueError(f"Ligne invalide: {record!r}")
+    return {BATCH_COLUMNS.get(str(key).strip().upper(), str(key).strip().lower()): value
+            for key, value in record.items()}
+
+
+class ServiceBatch:
+    """A batch submitted to the document service: its rows, status and output PDF"""
+
+    def __init__(self, batch_id, doc_type, rows, bank=None):
+        self.id = batch_id
+        self.doc_type = doc_type
+        self.rows = rows
+        self.row_count = len(rows)
+        self.bank = bank
+        self.status = BATCH_QUEUED
+        self.path = None
+        self.pages = 0
+        self.error = None
+        self.timing = None
+        self.finished = None
+
+    def finish(self):
+        """Mark the batch finished and let go of its rows"""
+        self.rows = None
+        self.finished = time.monotonic()
+
+    def to_json(self):
+        return {"id": self.id, "type": self.doc_type, "status": self.status, "pages": self.pages,
+                "rows": self.row_count, "error": self.error, "timing": self.timing}
+
+
+class DocumentService:
+    """Render documents for other programs over a local HTTP/JSON interface
+
+    Rows are prepared (amounts in words, virement numbers) in the service
+    process and rendered in a pool of worker processes that have registered
+    their fonts and compiled the layouts at start-up, so a request only pays
+    for drawing its pages. Small requests are answered with the PDF bytes;
+    batches return a handle that is polled for status and fetched when done.
+
+        GET  /health                 {"status", "workers", "layouts"}
+        POST /render                 {"type", "rows" | "row", "layout"?} -> application/pdf
+        POST /batches                same body -> 202 {"id", "status", ...}
+        GET  /batches/<id>           batch status
+        GET  /batches/<id>/pdf       the batch PDF once status is "done"
+
+    Virements without a number are reserved from the ledger (voided if
+    rendering fails) and recorded in it; without a ledger they are refused,
+    since numbers counted in memory would start over on every restart.
+    Finished batches are kept for SERVICE_BATCH_TTL seconds, at most
+    SERVICE_MAX_BATCHES of them, and their PDFs deleted when dropped.
+    handle() is independent of HTTP so the service can be driven in-process.
+    """
+
+    def __init__(self, workers=None, bank=None, output_dir=None, ledger=None, metrics=None, templates=None):
+        self.workers = max(1, workers or min(8, os.cpu_count() or 1))
+        self.engine = DocumentEngine(bank=bank)
+        for doc_type, path in (templates or {}).items():
+            self.engine.set_template(doc_type, path)
+        self.output_dir = output_dir or tempfile.mkdtemp(prefix="reglio-service-")
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.ledger = ledger
+        self.metrics = metrics
+        self.batches = {}
+        self.batches_lock = threading.Lock()
+        self.batch_ids = itertools.count(1)
+        self.pool = concurrent.futures.ProcessPoolExecutor(
+            max_workers=self.workers, initializer=_warm_worker, initargs=(bank,))
+        # Batches wait on the pool from their own threads, one or two at a time
+        self.batch_runner = concurrent.futures.ThreadPoolExecutor(max_workers=2, thread_name_prefix="reglio-batch")
+        self.server = None
+
+    def warm_up(self):
+        """Start every worker process now rather than on the first requests"""
+        futures = [self.pool.submit(os.getpid) for _ in range(self.workers * 2)]
+        return len({future.result() for future in futures})
+
+    def prepare(self, request):
+        """Validate a request body and return (doc_type, bank, prepared rows)"""
+        if not isinstance(request, dict):
+            raise ValueError("Requête JSON invalide: objet attendu")
+        doc_type = str(request.get("type", "")).strip().lower()
+        if doc_type not in DOC_TYPES:
+            raise ValueError(f"Type de document inconnu: {doc_type or '(vide)'}")
+        bank = request.get("layout") or self.engine.bank
+        if bank and bank not in self.engine.layout_cache.banks():
+            raise ValueError(f"Modèle inconnu: {bank}")
+        rows = request.get("rows")
+        if rows is None and "row" in request:
+            rows = [request["row"]]
+        if not isinstance(rows, list) or not rows:
+            raise ValueError("Aucune ligne à générer")
+        rows = [service_row(record) for record in rows]
+        errors = [issue for issue in validate_batch(rows, doc_type) if issue.severity == ISSUE_ERROR]
+        if errors:
+            raise ValueError(format_issues(errors))
+        rows = [self.engine.prepare_row(row) for row in rows]
+
+        unnumbered = [row for row in rows if doc_type == "virement" and not row.get("virement_num")]
+        if unnumbered and not self.ledger:
+            raise ValueError("Numérotation des virements impossible sans journal (--virements)")
+        if unnumbered:
+            for row, number in zip(unnumbered, self.ledger.reserve(len(unnumbered))):
+                row["virement_num"] = number
+        return doc_type, bank, rows
+
+    def release(self, doc_type, rows, reason):
+        """Void the reserved numbers of virements that were not rendered"""
+        if self.ledger and doc_type == "virement":
+            self.ledger.void([row["virement_num"] for row in rows], reason)
+
+    def record(self, doc_type, rows):
+        """Log rendered virements in the ledger"""
+        if self.ledger and doc_type == "virement":
+            self.ledger.append(rows)
+
+    def render(self, request):
+        """Render a request and return (pdf bytes, prepared rows)"""
+        doc_type, bank, rows = self.prepare(request)
+        try:
+            pdf = self.pool.submit(_render_document, doc_type, rows, bank, self.engine.templates).result()
+        except Exception as e:
+            self.release(doc_type, rows, f"rendu impossible: {e}")
+            raise
+        self.record(doc_type, rows)
+        return pdf, rows
+
+    def submit_batch(self, request):
+        """Queue a batch for rendering and return its ServiceBatch"""
+        doc_type, bank, rows = self.prepare(request)
+        batch = ServiceBatch(next(self.batch_ids), doc_type, rows, bank)
+        with self.batches_lock:
+            self.prune_batches()
+            self.batches[batch.id] = batch
+        self.batch_runner.submit(self.run_batch, batch)
+        return batch
+
+    def prune_batches(self):
+        """Drop finished batches past their TTL or beyond the count limit, deleting their PDFs"""
+        finished = sorted((batch for batch in self.batches.values() if batch.finished is not None),
+                          key=lambda batch: batch.finished)
+        expired = time.monotonic() - SERVICE_BATCH_TTL
+        excess = len(finished) - SERVICE_MAX_BATCHES + 1
+        for index, batch in enumerate(finished):
+            if batch.finished > expired and index >= excess:
+                break
+            del self.batches[batch.id]
+            if batch.path:
+                with contextlib.suppress(OSError):
+                    os.remove(batch.path)
+
+    def run_batch(self, batch):
+        """Batch thread: render a batch into its PDF, sharded across the pool when large"""
+        batch.status = BATCH_RUNNING
+        timer = StageTimer("service", self.metrics)
+        path = os.path.join(self.output_dir, f"{batch.doc_type}_{batch.id:06d}.pdf")
+        engine = DocumentEngine(bank=batch.bank, layout_cache=self.engine.layout_cache)
+        engine.templates = self.engine.templates
+        rendered = False
+        try:
+            with timer.span("rendu"):
+                parallel = len(batch.rows) >= PARALLEL_MIN_ROWS and self.workers > 1
+                blocker = parallel and engine.merge_blocker(batch.doc_type, batch.rows)
+                if blocker:
+                    timer.note(f"rendu sur un seul processus, {blocker}")
+                if parallel and not blocker:
+                    render_parallel(engine, batch.doc_type, batch.rows, path, self.pool, self.workers)
+                else:
+                    pdf = self.pool.submit(_render_document, batch.doc_type, batch.rows, batch.bank,
+                                           self.engine.templates).result()
+                    with open(path, "wb") as f:
+                        f.write(pdf)
+            rendered = True
+            with timer.span("journal"):
+                self.record(batch.doc_type, batch.rows)
+        except Exception as e:
+            batch.status, batch.error = BATCH_FAILED, str(e)
+            if not rendered:
+                self.release(batch.doc_type, batch.rows, f"lot {batch.id} non généré: {e}")
+        else:
+            batch.path, batch.pages, batch.status = path, batch.row_count, BATCH_DONE
+        if batch.status == BATCH_FAILED:
+            with contextlib.suppress(OSError):
+                os.remove(path)
+        batch.timing = timer.finish(pages=batch.row_count, status=batch.status)
+        batch.finish()
+
+    def handle(self, method, path, body=b""):
+        """Answer one request: returns (HTTP status, content type, payload bytes)"""
+        try:
+            parts = [part for part in path.split("?", 1)[0].split("/") if part]
+            if method == "GET" and parts == ["health"]:
+                return self.reply(200, {"status": "ok", "workers": self.workers,
+                                        "layouts": self.engine.layout_cache.banks()})
+            if method == "POST" and parts in (["render"], ["batches"]):
+                try:
+                    request = json.loads(body or b"null")
+                except ValueError as e:
+                    raise ValueError(f"Requête JSON invalide: {e}")
+                if parts == ["render"]:
+                    pdf, rows = self.render(request)
+                    return 200, "application/pdf", pdf
+                return self.reply(202, self.submit_batch(request).to_json())
+            if method == "GET" and len(parts) in (2, 3) and parts[0] == "batches":
+                with self.batches_lock:
+                    batch = self.batches.get(int(parts[1])) if parts[1].isdigit() else None
+                if batch is None:
+                    return self.reply(404, {"error": f"Lot inconnu: {parts[1]}"})
+                if len(parts) == 2:
+                    return self.reply(200, batch.to_json())
+                if parts[2] == "pdf":
+                    if batch.status != BATCH_DONE:
+                        return self.reply(409, batch.to_json())
+                    try:
+                        with open(batch.path, "rb") as f:
+                            return 200, "application/pdf", f.read()
+                    except FileNotFoundError:
+                        return self.reply(404, {"error": f"Lot expiré: {batch.id}"})
+            return self.reply(404, {"error": f"Chemin inconnu: {method} {path}"})
+        except ValueError as e:
+            return self.reply(400, {"error": str(e)})
+        except Exception as e:
+            return self.reply(500, {"error": str(e)})
+
+    @staticmethod
+    def reply(status, payload):
+        return status, "application/json", json.dumps(payload, ensure_ascii=False).encode("utf-8")
+
+    def serve(self, host=SERVICE_ADDRESS[0], port=SERVICE_ADDRESS[1]):
+        """Create the HTTP server (one thread per connection); call serve_forever() on it"""
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # Keep-alive for clients that reuse connections
+
+            def answer(self, method):
+                length = int(self.headers.get("Content-Length") or 0)
+                if length > SERVICE_MAX_BODY:
+                    status, content_type, payload = service.reply(413, {"error": "Requête trop volumineuse"})
+                    self.close_connection = True
+                else:
+                    body = self.rfile.read(length) if length else b""
+                    status, content_type, payload = service.handle(method, self.path, body)
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                self.answer("GET")
+
+            def do_POST(self):
+                self.answer("POST")
+
+            def log_message(self, format, *args):
+                pass  # One line per request would cost more than the render
+
+        class Server(ThreadingHTTPServer):
+            request_queue_size = 128  # Many clients may connect at once; the default backlog is 5
+
+        self.server = Server((host, port), Handler)
+        return self.server
+
+    def close(self):
+        """Stop the server and the worker pool"""
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+        self.batch_runner.shutdown(wait=True, cancel_futures=True)
+        self.pool.shutdown(cancel_futures=True)
+
+
+class ServiceClient:
+    """Minimal client for DocumentService, using only the standard library
+
+    Errors answered by the service raise ValueError (bad request) or
+    RuntimeError with the service's message.
+    """
+
+    def __init__(self, url=f"http://{SERVICE_ADDRESS[0]}:{SERVICE_ADDRESS[1]}", timeout=60):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+
+    def request(self, method, path, payload=None):
+        """Send a request and return the response body bytes"""
+        import urllib.error
+        import urllib.request
+
+        data = None if payload is None else json.dumps(payload).encode("utf-8")
+        request = urllib.request.Request(self.url + path, data=data, method=method,
+                                         headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return response.read()
+        except urllib.error.HTTPError as e:
+            try:
+                message = json.loads(e.read()).get("error") or e.reason
+            except ValueError:
+                message = e.reason
+            raise (ValueError if e.code == 400 else RuntimeError)(message) from None
+
+    def health(self):
+        return json.loads(self.request("GET", "/health"))
+
+    def render(self, doc_type, rows, layout=None):
+        """Render rows and return the PDF bytes"""
+        return self.request("POST", "/render", {"type": doc_type, "rows": rows, "layout": layout})
+
+    def submit_batch(self, doc_type, rows, layout=None):
+        """Submit a batch and return its id"""
+        return json.loads(self.request("POST", "/batches", {"type": doc_type, "rows": rows, "layout": layout}))["id"]
+
+    def batch(self, batch_id):
+        return json.loads(self.request("GET", f"/batches/{batch_id}"))
+
+    def wait_batch(self, batch_id, interval=0.2):
+        """Poll a batch until it is done or failed and return its status"""
+        while True:
+            status = self.batch(batch_id)
+            if status["status"] in (BATCH_DONE, BATCH_FAILED):
+                return status
+            time.sleep(interval)
+
+    def batch_pdf(self, batch_id):
+        return self.request("GET", f"/batches/{batch_id}/pdf")
+
+
+PRINT_QUEUED = "queued"
+PRINT_SENT = "sent"
+PRINT_FAILED = "failed"
+
+# Page ranges as lp -P accepts them: "1-3,5,8-"
+PAGE_RANGES = re.compile(r"^\d+(-\d*)?(,\d+(-\d*)?)*$")
+LP_REQUEST_ID = re.compile(r"request id is (\S+)")
+
+
+class PrintJob:
+    """One document in the print spooler: a PDF (bytes or path) and its print options"""
+
+    def __init__(self, job_id, document, printer=None, tray=None, copies=1, pages=None):
+        self.id = job_id
+        self.document = document
+        self.printer = printer
+        self.tray = tray
+        self.copies = copies
+        self.pages = pages
+        self.status = PRINT_QUEUED
+        self.request = None
+        self.error = None
+        self.timing = None
+
+    @property
+    def spool_key(self):
+        """Jobs with the same key are sent to lp together as a single print job"""
+        return self.printer, self.tray, self.copies, self.pages
+
+
+class PrintSpooler:
+    """Coalesce documents into one lp job per printer, tray and options
+
+    Documents submitted within COALESCE_SECONDS of each other are grouped and
+    sent with a single lp invocation listing every file, so a batch of 300
+    cheques is one spool job instead of 300 process spawns. lp runs on a
+    daemon thread; on_status(job) is called from that thread when a job is
+    sent or fails. The lp command comes from REGLIO_LP when set, so the
+    spooler can be pointed at a stub.
+    """
+
+    COALESCE_SECONDS = 0.3
+
+    def __init__(self, lp_command=None, on_status=None, metrics=None):
+        lp_command = lp_command or os.environ.get("REGLIO_LP")
+        if lp_command:
+            self.lp_command = shlex.split(lp_command)
+        else:
+            self.lp_command = None if os.name == 'nt' else ["lp"]
+        self.on_status = on_status
+        self.metrics = metrics
+        self.jobs = {}
+        self.pending = queue.Queue()
+        self.job_ids = itertools.count(1)
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def submit(self, document, printer=None, tray=None, copies=1, pages=None):
+        """Queue a PDF (bytes or file path) for printing and return its PrintJob"""
+        copies = int(copies)
+        if copies < 1:
+            raise ValueError(f"Nombre de copies invalide: {copies}")
+        pages = str(pages).replace(" ", "") if pages else None
+        if pages and not PAGE_RANGES.match(pages):
+            raise ValueError(f"Pages invalides: {pages}")
+            
+        job = PrintJob(next(self.job_ids), document, printer or None, tray or None, copies, pages)
+        with self.lock:
+            self.jobs[job.id] = job
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name="reglio-print", daemon=True)
+                self.thread.start()
+        self.pending.put(job)
+        return job
+
+    def status(self, job_id):
+        """Return the status of a submitted job"""
+        return self.jobs[job_id].status
+
+    def wait(self):
+        """Block until every submitted job has been sent or has failed"""
+        self.pending.join()
+
+    def run(self):
+        """Spooler thread: gather jobs arriving together and send each group"""
+        while True:
+            jobs = [self.pending.get()]
+            time.sleep(self.COALESCE_SECONDS)
+            while True:
+                try:
+                    jobs.append(self.pending.get_nowait())
+                except queue.Empty:
+                    break
+                    
+            groups = collections.defaultdict(list)
+            for job in jobs:
+                groups[job.spool_key].append(job)
+            for group in groups.values():
+                try:
+                    self.send(group)
+                except Exception as e:
+                    # Never let one group kill the thread: later jobs would stay queued forever
+                    print(f"Warning: print group failed: {e}")
+                    for job in group:
+                        if job.status not in (PRINT_SENT, PRINT_FAILED):
+                            job.status, job.error = PRINT_FAILED, str(e)
+                        job.document = None
+                finally:
+                    for _ in group:
+                        self.pending.task_done()
+
+    def lp_arguments(self, printer, tray, copies, pages):
+        """Build the lp options for one group"""
+        args = []
+        if printer:
+            args += ["-d", printer]
+        if tray:
+            args += ["-o", f"InputSlot={tray}"]
+        if copies > 1:
+            args += ["-n", str(copies)]
+        if pages:
+            args += ["-P", pages]
+        return args
+
+    def send(self, jobs):
+        """Send a group of jobs sharing the same options as one lp job"""
+        timer = StageTimer("impression", self.metrics)
+        spool_dir = None
+        try:
+            spool_dir = tempfile.mkdtemp(prefix="reglio-print-")
+            paths = []
+            with timer.span("fichiers"):
+                for job in jobs:
+                    if isinstance(job.document, (bytes, bytearray)):
+                        path = os.path.join(spool_dir, f"document_{job.id}.pdf")
+                        with open(path, "wb") as f:
+                            f.write(job.document)
+                    else:
+                        path = os.fspath(job.document)
+                    paths.append(path)
+                
+            request = None
+            if self.lp_command is None:  # Windows: the shell "print" verb, one document at a time
+                for path in paths:
+                    os.startfile(path, "print")
+                # The printing application reads the files later; leave them in the temp dir
+                spool_dir = None
+            else:
+                with timer.span("lp"):
+                    result = subprocess.run(self.lp_command + self.lp_arguments(*jobs[0].spool_key) + paths,
+                                            capture_output=True, text=True)
+                if result.returncode != 0:
+                    raise RuntimeError(result.stderr.strip() or f"lp a échoué (code {result.returncode})")
+                match = LP_REQUEST_ID.search(result.stdout)
+                request = match.group(1) if match else None
+        except Exception as e:
+            for job in jobs:
+                job.status, job.error = PRINT_FAILED, str(e)
+        else:
+            for job in jobs:
+                job.status, job.request = PRINT_SENT, request
+        finally:
+            if spool_dir:
+                shutil.rmtree(spool_dir, ignore_errors=True)
+                
+        timing = timer.finish(documents=len(jobs), status=jobs[0].status)
+        for job in jobs:
+            job.document = None  # Sent or failed: release the PDF bytes
+            job.timing = timing
+            if self.on_status:
+                try:
+                    self.on_status(job)
+                except Exception as e:
+                    print(f"Warning: print status callback failed: {e}")
+
+
+class MetricsLog:
+    """Append-only JSON-lines file of run timings, rotated by size
+
+    Each line is one run: {"ts", "run", "spans": {stage: ms}, "total_ms", ...}.
+    When the file exceeds METRICS_MAX_BYTES it is renamed to .1 (older files
+    shift up to METRICS_BACKUPS).
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(REGLIO_HOME, "metrics.jsonl")
+        self.lock = threading.Lock()
+
+    def append(self, record):
+        """Write one run record"""
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self.lock:
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                if os.path.exists(self.path) and os.path.getsize(self.path) + len(line) > METRICS_MAX_BYTES:
+                    for n in range(METRICS_BACKUPS - 1, 0, -1):
+                        if os.path.exists(f"{self.path}.{n}"):
+                            os.replace(f"{self.path}.{n}", f"{self.path}.{n + 1}")
+                    os.replace(self.path, f"{self.path}.1")
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(line)
+            except OSError as e:
+                print(f"Warning: metrics not written: {e}")
+
+    def records(self):
+        """Yield every record, oldest file first"""
+        paths = [f"{self.path}.{n}" for n in range(METRICS_BACKUPS, 0, -1)] + [self.path]
+        for path in paths:
+            try:
+                with open(path, encoding="utf-8") as f:
+                    for line in f:
+                        try:
+                            yield json.loads(line)
+                        except ValueError:
+                            continue
+            except OSError:
+                continue
+
+    def summary(self):
+        """Return {run: {stage: (count, p50_ms, p95_ms)}}, "total" included"""
+        samples = collections.defaultdict(lambda: collections.defaultdict(list))
+        totals = collections.defaultdict(list)
+        for record in self.records():
+            for stage, ms in record.get("spans", {}).items():
+                samples[record.get("run")][stage].append(ms)
+            totals[record.get("run")].append(record.get("total_ms", 0))
+        for run, values in totals.items():
+            samples[run]["total"] = values
+
+        def percentile(values, q):
+            values = sorted(values)
+            return values[min(len(values) - 1, int(q * len(values)))]
+        return {run: {stage: (len(values), percentile(values, 0.5), percentile(values, 0.95))
+                      for stage, values in stages.items()}
+                for run, stages in samples.items()}
+
+    def report(self):
+        """Format summary() as text"""
+        lines = []
+        for run, stages in sorted(self.summary().items()):
+            lines.append(f"{run}:")
+            for stage, (count, p50, p95) in stages.items():
+                lines.append(f"  {stage:20s} n={count:<6d} p50={p50:8.1f} ms  p95={p95:8.1f} ms")
+        return "\n".join(lines) or "Aucune mesure"
+
+
+class StageTimer:
+    """Span timings for one run of a pipeline (a cheque, a batch, a print job...)
+
+    Spans may be opened from any thread; finish() appends the run to the
+    MetricsLog and returns a one-line summary for the status bar. With
+    profile=True, profiled() captures cProfile and tracemalloc statistics for
+    the code it wraps into REGLIO_HOME/profiles.
+    """
+
+    def __init__(self, run, metrics=None, profile=False):
+        self.run = run
+        self.metrics = metrics
+        self.profile = profile
+        self.spans = {}
+        self.notes = []
+        self.started = time.perf_counter()
+
+    @contextlib.contextmanager
+    def span(self, stage):
+        """Time the enclosed block as stage (repeated stages add up)"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.spans[stage] = self.spans.get(stage, 0) + (time.perf_counter() - start) * 1000
+
+    def note(self, message):
+        """Attach a remark to the run (a fallback taken...), logged and shown with its timings"""
+        self.notes.append(message)
+
+    @contextlib.contextmanager
+    def profiled(self):
+        """Run the enclosed block under cProfile and tracemalloc when profiling is on"""
+        if not self.profile:
+            yield
+            return
+        import cProfile
+        import pstats
+        import tracemalloc
+
+        profiler = cProfile.Profile()
+        tracemalloc.start()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            snapshot = tracemalloc.take_snapshot()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+            directory = os.path.join(REGLIO_HOME, "profiles")
+            os.makedirs(directory, exist_ok=True)
+            base = os.path.join(directory, f"{self.run}_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+            profiler.dump_stats(base + ".prof")
+            with open(base + ".txt", "w", encoding="utf-8") as f:
+                pstats.Stats(profiler, stream=f).sort_stats("cumulative").print_stats(40)
+                f.write(f"\nPic mémoire: {peak / 1e6:.1f} Mo\n")
+                for stat in snapshot.statistics("lineno")[:20]:
+                    f.write(f"{stat}\n")
+            self.profile = base
+
+    def finish(self, **extra):
+        """Record the run and return its summary line"""
+        total = (time.perf_counter() - self.started) * 1000
+        if self.metrics:
+            record = {"ts": datetime.now().isoformat(timespec="seconds"), "run": self.run,
+                      "spans": {stage: round(ms, 2) for stage, ms in self.spans.items()},
+                      "total_ms": round(total, 2)}
+            if self.notes:
+                record["notes"] = self.notes
+            record.update(extra)
+            self.metrics.append(record)
+        parts = [f"{stage} {ms:.0f} ms" for stage, ms in self.spans.items()]
+        return " · ".join(parts + [f"total {total:.0f} ms"] + self.notes)
+
+
+class TaskCancelled(Exception):
+    """Raised inside a background task once it has been cancelled"""
+
+
+class TaskToken:
+    """Handed to each background task: cancellation flag and progress reporting"""
+
+    def __init__(self, key, events):
+        self.key = key
+        self.cancelled = threading.Event()
+        self.events = events
+
+    def check(self):
+        """Raise TaskCancelled if the task was cancelled"""
+        if self.cancelled.is_set():
+            raise TaskCancelled(self.key)
+
+    def report(self, message):
+        """Post a progress message to the Tk thread"""
+        self.events.put(("progress", self.key, message))
+
+
+class BackgroundWorker:
+    """Run slow stages (rendering, Excel reads, rasterization) off the Tk thread
+
+    At most one task per key (one per tab) is in flight. Tasks receive a
+    TaskToken; their results, errors and progress messages go through a queue
+    that the Tk thread drains with root.after, since Tk may only be touched
+    from its own thread.
+    """
+
+    POLL_MS = 50
+
+    def __init__(self, root, on_status=None):
+        self.root = root
+        self.on_status = on_status
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=2, thread_name_prefix="reglio")
+        self.events = queue.Queue()
+        self.tokens = {}
+        self.poll_job = self.root.after(self.POLL_MS, self.poll)
+
+    def busy(self, key=None):
+        """Return True if a task is in flight for key (or for any key)"""
+        return key in self.tokens if key is not None else bool(self.tokens)
+
+    def submit(self, key, message, func, on_done, on_error=None):
+        """Run func(token) in the background, then on_done(result) on the Tk thread
+
+        Returns False without starting anything if key already has a task in flight.
+        """
+        if key in self.tokens:
+            return False
+        token = TaskToken(key, self.events)
+        self.tokens[key] = token
+        future = self.executor.submit(func, token)
+        future.add_done_callback(lambda f: self.events.put(("done", key, (f, on_done, on_error))))
+        self.status(message)
+        return True
+
+    def post(self, message):
+        """Show a status message; safe to call from any thread"""
+        self.events.put(("progress", None, message))
+
+    def cancel(self, key=None):
+        """Ask the task for key (or every task) to stop at its next check"""
+        for token_key, token in self.tokens.items():
+            if key is None or token_key == key:
+                token.cancelled.set()
+
+    def status(self, message):
+        """Forward a status message to the status bar"""
+        if self.on_status:
+            self.on_status(message, self.busy())
+
+    def poll(self):
+        """Deliver queued progress and results on the Tk thread"""
+        try:
+            while True:
+                try:
+                    kind, key, payload = self.events.get_nowait()
+                except queue.Empty:
+                    break
+                if kind == "progress":
+                    self.status(payload)
+                    continue
+                self.tokens.pop(key, None)
+                self.deliver(*payload)
+        finally:
+            self.poll_job = self.root.after(self.POLL_MS, self.poll)
+
+    def deliver(self, future, on_done, on_error):
+        """Hand a finished task's result or error to its callbacks; a failing callback is reported, not raised"""
+        try:
+            result = future.result()
+        except TaskCancelled:
+            self.status("Annulé")
+            return
+        except Exception as e:
+            error = e
+        else:
+            self.status("Prêt")
+            try:
+                on_done(result)
+                return
+            except Exception as e:
+                error = e
+        self.status("Erreur")
+        try:
+            if on_error:
+                on_error(error)
+            else:
+                messagebox.showerror("Erreur", str(error))
+        except Exception as e:
+            print(f"Warning: task error not reported: {error} ({e})")
+
+    def shutdown(self):
+        """Cancel running tasks and stop polling"""
+        self.cancel()
+        self.root.after_cancel(self.poll_job)
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
 
 class ChequeVirementApp:
-    def __init__(self, root):
+    def __init__(self, root, report_startup=False):
         self.root = root
+        self.report_startup = report_startup
         self.root.title("Générateur de Documents Bancaires")
         
         try:
@@ -29,9 +3141,16 @@ class ChequeVirementApp:
         # Initialize data structures
         self.payee_db = None
         self.payee_list = []
+        self.payee_index = PayeeIndex([])
+        self.payee_records = None
+        self.payee_filter_job = None
         self.virements_db_path = None
-        self.template_path = None
+        self.ledger = None
+        self.ledger_export_job = None
+        self.live_preview_labels = {}
+        self.live_preview_jobs = {}
         self.cities = ["Témara", "Rabat", "Casablanca", "Autre"]
+        self.batch_types = {"Chèque": "cheque", "Virement": "virement", "Lettre de Change": "letter"}
         
         # Initialize all variables
         self.initialize_variables()
@@ -39,11 +3158,59 @@ class ChequeVirementApp:
         # Setup UI
         self.setup_ui()
         
-        # Register fonts and load layouts
-        self.register_fonts()
-        self.cheque_layout = self.load_layout_config("cheque")
-        self.letter_layout = self.load_layout_config("letter")
-        self.virement_layout = self.load_layout_config("virement")
+        # Fonts and layouts are loaded on first render (or by warm_up)
+        self.engine = DocumentEngine()
+        self.preview_renderer = PreviewRenderer(self.engine)
+        try:
+            self.document_cache = DocumentCache()
+        except (OSError, sqlite3.Error) as e:
+            print(f"Warning: document cache disabled: {e}")
+            self.document_cache = None
+        
+        # Slow stages run in the background and report to the status bar
+        self.worker = BackgroundWorker(self.root, on_status=self.update_status)
+        self.metrics = MetricsLog()
+        self.spooler = PrintSpooler(on_status=self.report_print_job, metrics=self.metrics)
+        
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.root.after(100, self.warm_up)
+
+    def warm_up(self):
+        """Load heavy modules, fonts and layouts in the background once the window is up"""
+        startup_mark("fenêtre affichée")
+        
+        def task(token):
+            for module in WARM_UP_MODULES:
+                try:
+                    importlib.import_module(module)
+                except ImportError as e:
+                    print(f"Warning: {e}")
+                startup_mark(module)
+            self.engine.refresh_layouts()
+            startup_mark("polices et modèles")
+
+            # Page backgrounds imported in a previous session
+            restored = []
+            for doc_type, path in load_settings().get("templates", {}).items():
+                try:
+                    self.preview_renderer.set_template(doc_type, path)
+                    restored.append(doc_type)
+                except Exception as e:
+                    print(f"Warning: template {path} not restored: {e}")
+            return restored
+            
+        def done(restored):
+            for doc_type in restored:
+                self.schedule_live_preview(doc_type)
+            if self.report_startup:
+                print(startup_report())
+                
+        self.worker.submit("warmup", "Préparation...", task, done)
+        
+        # Reopen the payee database used last time
+        last_payee_db = load_settings().get("payee_db")
+        if last_payee_db and os.path.exists(last_payee_db):
+            self.load_payee_db(last_payee_db, quiet=True)
 
     def initialize_variables(self):
         """Initialize all Tkinter variables"""
@@ -73,21 +3240,27 @@ class ChequeVirementApp:
         self.letter_edition_date_var = tk.StringVar(value=datetime.now().strftime("%d/%m/%Y"))
         self.letter_label_var = tk.StringVar()
         
+        # Status bar
+        self.status_var = tk.StringVar(value="Prêt")
+        
         # Settings Tab
+        self.batch_type_var = tk.StringVar(value="Chèque")
+        self.batch_volume_var = tk.IntVar(value=0)
+        self.template_type_var = tk.StringVar(value="Lettre de Change")
+        self.layout_bank_var = tk.StringVar()
+        self.profile_next_var = tk.BooleanVar(value=False)
         self.font_var = tk.StringVar(value="Arial")
         self.size_var = tk.IntVar(value=10)
         self.preview_text_var = tk.StringVar(value="Exemple de texte")
-
-    def register_fonts(self):
-        """Register required fonts"""
-        try:
-            pdfmetrics.registerFont(TTFont('Arial', 'arial.ttf'))
-            pdfmetrics.registerFont(TTFont('Arial-Bold', 'arialbd.ttf'))
-        except:
-            print("Warning: Arial fonts not found - using defaults")
+        self.printer_var = tk.StringVar()
+        self.tray_var = tk.StringVar()
+        self.copies_var = tk.IntVar(value=1)
+        self.pages_var = tk.StringVar()
 
     def setup_ui(self):
         """Setup the main notebook interface"""
+        self.setup_status_bar()
+        
         self.notebook = ttk.Notebook(self.root)
         self.notebook.pack(fill=tk.BOTH, expand=True)
         
@@ -96,6 +3269,74 @@ class ChequeVirementApp:
         self.setup_letter_tab()
         self.setup_settings_tab()
 
+    def setup_status_bar(self):
+        """Setup the status bar showing background work"""
+        status_frame = ttk.Frame(self.root, padding=(5, 2))
+        status_frame.pack(side=tk.BOTTOM, fill=tk.X)
+        
+        ttk.Label(status_frame, textvariable=self.status_var).pack(side=tk.LEFT)
+        self.cancel_btn = ttk.Button(status_frame, text="Annuler", command=lambda: self.worker.cancel(),
+                                     state=tk.DISABLED)
+        self.cancel_btn.pack(side=tk.RIGHT)
+        self.progress_bar = ttk.Progressbar(status_frame, mode="indeterminate", length=120)
+        self.progress_bar.pack(side=tk.RIGHT, padx=5)
+
+    def select_layout(self, event=None):
+        """Use the selected bank's layout file for the next documents"""
+        bank = self.layout_bank_var.get() or None
+        try:
+            self.engine.layout_cache.get(bank)
+        except Exception as e:
+            messagebox.showerror("Erreur", f"Modèle invalide:\n{str(e)}")
+            self.layout_bank_var.set(self.engine.bank or "")
+            return
+        self.engine.bank = bank
+
+    def update_status(self, message, busy):
+        """Show worker status; animate the progress bar while tasks run"""
+        self.status_var.set(message)
+        if busy:
+            self.progress_bar.start(15)
+            self.cancel_btn.config(state=tk.NORMAL)
+        else:
+            self.progress_bar.stop()
+            self.cancel_btn.config(state=tk.DISABLED)
+
+    def add_live_preview(self, tab, doc_type, variables):
+        """Show a small page preview beside a tab's fields, refreshed when variables change"""
+        label = ttk.Label(tab, relief=tk.SUNKEN)
+        label.grid(row=0, column=2, rowspan=20, sticky="n", padx=10, pady=5)
+        self.live_preview_labels[doc_type] = label
+        for variable in variables:
+            variable.trace_add("write", lambda *args: self.schedule_live_preview(doc_type))
+
+    def schedule_live_preview(self, doc_type):
+        """Debounce live preview refreshes while the user types"""
+        job = self.live_preview_jobs.get(doc_type)
+        if job is not None:
+            self.root.after_cancel(job)
+        self.live_preview_jobs[doc_type] = self.root.after(LIVE_PREVIEW_DELAY_MS, self.update_live_preview, doc_type)
+
+    def update_live_preview(self, doc_type):
+        """Redraw a tab's live preview from its current field values"""
+        from PIL import ImageTk
+        
+        self.live_preview_jobs[doc_type] = None
+        row = getattr(self, f"collect_{doc_type}_row")()
+        try:
+            row = self.engine.prepare_row(row)
+        except ValueError:
+            pass  # Amount still being typed: preview without the amount in words
+        try:
+            img = self.preview_renderer.render(doc_type, row, dpi=LIVE_PREVIEW_DPI)
+        except Exception as e:
+            print(f"Error updating preview: {e}")
+            return
+        img_tk = ImageTk.PhotoImage(img)
+        label = self.live_preview_labels[doc_type]
+        label.configure(image=img_tk)
+        label.image = img_tk  # Keep reference
+
     def setup_cheque_tab(self):
         """Setup cheque tab widgets"""
         tab = ttk.Frame(self.notebook)
@@ -128,6 +3369,9 @@ class ChequeVirementApp:
         # Generate button
         ttk.Button(tab, text="Générer Chèque", command=self.generate_cheque).grid(row=5, columnspan=2, pady=10)
         
+        # Live preview, refreshed as fields are edited
+        self.add_live_preview(tab, "cheque", [self.payee_var, self.amount_var, self.city_var, self.date_var])
+        
         tab.grid_columnconfigure(1, weight=1)
 
     def setup_virement_tab(self):
@@ -175,6 +3419,11 @@ class ChequeVirementApp:
         # Generate button
         ttk.Button(tab, text="Générer Virement", command=self.generate_virement).grid(row=8, columnspan=2, pady=10)
         
+        # Live preview, refreshed as fields are edited
+        self.add_live_preview(tab, "virement", [
+            self.virement_payee_var, self.virement_amount_var, self.virement_type_var, self.virement_motif_var,
+            self.virement_rib_var, self.virement_bank_var, self.virement_city_var])
+        
         tab.grid_columnconfigure(1, weight=1)
 
     def setup_letter_tab(self):
@@ -217,6 +3466,11 @@ class ChequeVirementApp:
         # Generate button
         ttk.Button(tab, text="Générer Lettre", command=self.generate_letter).grid(row=7, columnspan=2, pady=10)
         
+        # Live preview, refreshed as fields are edited
+        self.add_live_preview(tab, "letter", [
+            self.letter_payee_var, self.letter_amount_var, self.letter_due_date_var, self.letter_city_var,
+            self.letter_edition_date_var, self.letter_label_var])
+        
         tab.grid_columnconfigure(1, weight=1)
 
     def setup_settings_tab(self):
@@ -227,7 +3481,54 @@ class ChequeVirementApp:
         # File import buttons
         ttk.Button(tab, text="Importer Base Bénéficiaires", command=self.import_payee_db).pack(pady=5)
         ttk.Button(tab, text="Importer Fichier Virements", command=self.import_virements_db).pack(pady=5)
-        ttk.Button(tab, text="Importer Modèle Word", command=self.import_template).pack(pady=5)
+        ttk.Button(tab, text="Rapport Virements", command=self.show_ledger_report).pack(pady=5)
+        ttk.Button(tab, text="Réimprimer un document", command=self.show_reprints).pack(pady=5)
+        template_frame = ttk.Frame(tab)
+        template_frame.pack(pady=5)
+        ttk.Combobox(template_frame, textvariable=self.template_type_var, values=list(self.batch_types),
+                     width=15, state="readonly").pack(side=tk.LEFT, padx=5)
+        ttk.Button(template_frame, text="Importer Modèle", command=self.import_template).pack(side=tk.LEFT)
+        ttk.Button(template_frame, text="Retirer", command=self.remove_template).pack(side=tk.LEFT, padx=5)
+        
+        # Bank layout
+        layout_frame = ttk.LabelFrame(tab, text="Modèle de la banque", padding=10)
+        layout_frame.pack(fill=tk.X, pady=10)
+        ttk.Label(layout_frame, text="Banque:").grid(row=0, column=0)
+        layout_cb = ttk.Combobox(layout_frame, textvariable=self.layout_bank_var, width=20, state="readonly")
+        layout_cb.configure(postcommand=lambda: layout_cb.configure(values=[""] + self.engine.layout_cache.banks()))
+        layout_cb.grid(row=0, column=1)
+        layout_cb.bind("<<ComboboxSelected>>", self.select_layout)
+        
+        # Batch generation
+        batch_frame = ttk.LabelFrame(tab, text="Génération par lot", padding=10)
+        batch_frame.pack(fill=tk.X, pady=10)
+        ttk.Label(batch_frame, text="Type:").grid(row=0, column=0)
+        ttk.Combobox(batch_frame, textvariable=self.batch_type_var,
+                     values=list(self.batch_types), width=15).grid(row=0, column=1)
+        ttk.Button(batch_frame, text="Générer un lot", command=self.generate_batch).grid(row=0, column=2, padx=5)
+        ttk.Label(batch_frame, text="Pages par volume:").grid(row=1, column=0, sticky=tk.W)
+        ttk.Spinbox(batch_frame, from_=0, to=100000, increment=500, textvariable=self.batch_volume_var,
+                    width=8).grid(row=1, column=1, sticky=tk.W)
+        ttk.Label(batch_frame, text="(0 = un seul fichier)").grid(row=1, column=2, sticky=tk.W)
+        
+        # Printing
+        print_frame = ttk.LabelFrame(tab, text="Impression", padding=10)
+        print_frame.pack(fill=tk.X, pady=10)
+        ttk.Label(print_frame, text="Imprimante:").grid(row=0, column=0, sticky=tk.W)
+        ttk.Entry(print_frame, textvariable=self.printer_var, width=20).grid(row=0, column=1)
+        ttk.Label(print_frame, text="Bac:").grid(row=0, column=2, sticky=tk.W, padx=(10, 0))
+        ttk.Entry(print_frame, textvariable=self.tray_var, width=10).grid(row=0, column=3)
+        ttk.Label(print_frame, text="Copies:").grid(row=1, column=0, sticky=tk.W)
+        ttk.Spinbox(print_frame, from_=1, to=99, textvariable=self.copies_var, width=5).grid(row=1, column=1, sticky=tk.W)
+        ttk.Label(print_frame, text="Pages:").grid(row=1, column=2, sticky=tk.W, padx=(10, 0))
+        ttk.Entry(print_frame, textvariable=self.pages_var, width=10).grid(row=1, column=3)
+        
+        # Timings
+        metrics_frame = ttk.LabelFrame(tab, text="Mesures", padding=10)
+        metrics_frame.pack(fill=tk.X, pady=10)
+        ttk.Checkbutton(metrics_frame, text="Profiler la prochaine génération",
+                        variable=self.profile_next_var).grid(row=0, column=0, sticky=tk.W)
+        ttk.Button(metrics_frame, text="Statistiques", command=self.show_metrics).grid(row=0, column=1, padx=5)
         
         # Font preview section
         self.setup_font_preview(tab)
@@ -239,8 +3540,8 @@ class ChequeVirementApp:
         
         # Font selection
         ttk.Label(preview_frame, text="Police:").grid(row=0, column=0)
-        font_cb = ttk.Combobox(preview_frame, textvariable=self.font_var, 
-                              values=list(pdfmetrics.getRegisteredFontNames()))
+        font_cb = ttk.Combobox(preview_frame, textvariable=self.font_var)
+        font_cb.configure(postcommand=lambda: font_cb.configure(values=list(pdfmetrics.getRegisteredFontNames())))
         font_cb.grid(row=0, column=1)
         
         # Font size
@@ -257,30 +3558,23 @@ class ChequeVirementApp:
         # Preview canvas
         self.preview_canvas = tk.Canvas(preview_frame, width=400, height=100, bg='white')
         self.preview_canvas.grid(row=4, columnspan=2)
+        
+        # Live update as the user types
+        self.font_preview_job = None
+        for variable in (self.font_var, self.size_var, self.preview_text_var):
+            variable.trace_add("write", self.schedule_font_preview)
 
-    def update_font_preview(self):
+    def update_font_preview(self, *args):
         """Update font preview canvas"""
+        from PIL import ImageTk
+        
+        self.font_preview_job = None
         try:
-            # Create temporary PDF
-            temp_pdf = tempfile.NamedTemporaryFile(suffix=".pdf", delete=False)
-            c = canvas.Canvas(temp_pdf.name, pagesize=(200, 100))
-            
-            # Draw sample text
-            style = ParagraphStyle(
-                name='Preview',
-                fontName=self.font_var.get(),
-                fontSize=self.size_var.get(),
-                textColor=colors.black,
-                leading=self.size_var.get() * 1.2
-            )
-            p = Paragraph(self.preview_text_var.get(), style)
-            p.wrapOn(c, 180, 100)
-            p.drawOn(c, 10, 80 - p.height)
-            c.save()
-            
-            # Convert to image
-            img = self.pdf_to_image(temp_pdf.name)
-            os.unlink(temp_pdf.name)
+            size = self.size_var.get()
+        except tk.TclError:
+            return  # Size being edited
+        try:
+            img = render_font_preview(resolve_font(self.font_var.get()), size, self.preview_text_var.get())
             
             # Update canvas
             self.preview_canvas.delete("all")
@@ -290,280 +3584,233 @@ class ChequeVirementApp:
         except Exception as e:
             messagebox.showerror("Erreur", f"Échec de l'aperçu:\n{str(e)}")
 
-    def pdf_to_image(self, pdf_path):
-        """Convert PDF to PIL Image"""
-        try:
-            from pdf2image import convert_from_path
-            images = convert_from_path(pdf_path, dpi=100)
-            return images[0] if images else Image.new('RGB', (400, 100), 'white')
-        except:
-            return Image.new('RGB', (400, 100), 'white')
+    def schedule_font_preview(self, *args):
+        """Debounce font preview updates while the user types"""
+        if self.font_preview_job is not None:
+            self.root.after_cancel(self.font_preview_job)
+        self.font_preview_job = self.root.after(LIVE_PREVIEW_DELAY_MS, self.update_font_preview)
 
     def filter_payees(self, event=None):
-        """Filter payees based on combobox input"""
-        typed = self.payee_var.get().lower()
-        if not typed:
-            self.payee_cb['values'] = self.payee_list
+        """Debounce payee filtering while the user types in a payee combobox"""
+        if event is not None and event.keysym in PAYEE_NAVIGATION_KEYS:
             return
-        
-        filtered = [p for p in self.payee_list if typed in p.lower()]
-        self.payee_cb['values'] = filtered
-        self.payee_cb.event_generate('<Down>')
+        if self.payee_filter_job is not None:
+            self.root.after_cancel(self.payee_filter_job)
+        combobox = event.widget if event is not None else self.payee_cb
+        self.payee_filter_job = self.root.after(PAYEE_FILTER_DELAY_MS, self.apply_payee_filter, combobox)
+
+    def apply_payee_filter(self, combobox):
+        """Show the best index matches for the text typed in combobox"""
+        self.payee_filter_job = None
+        typed = combobox.get()
+        combobox['values'] = self.payee_index.search(typed, PAYEE_SUGGESTIONS)
+        if typed:
+            combobox.event_generate('<Down>')
 
     def fill_payee_details(self, event=None):
         """Fill RIB, bank, and city from payee database"""
-        if self.payee_db is None:
+        if self.payee_records is None:
             return
             
         payee = self.virement_payee_var.get()
         if not payee:
             return
             
-        try:
-            # Find payee in database (case insensitive)
-            match = self.payee_db[self.payee_db.iloc[:, 0].str.lower() == payee.lower()]
-            if not match.empty:
-                # Assuming columns are: Payee, RIB, Bank, City
-                if len(match.columns) > 1:
-                    self.virement_rib_var.set(str(match.iloc[0, 1]))
-                if len(match.columns) > 2:
-                    self.virement_bank_var.set(str(match.iloc[0, 2]))
-                if len(match.columns) > 3:
-                    self.virement_city_var.set(str(match.iloc[0, 3]))
-        except Exception as e:
-            print(f"Error filling payee details: {e}")
-
-    def format_amount(self, amount_str):
-        """Format amount as #000 000,00"""
-        try:
-            # Remove any existing formatting
-            clean_amount = amount_str.replace('#', '').replace(' ', '').replace(',', '.')
-            amount = float(clean_amount)
-            
-            # Format with thousands separator and 2 decimals
-            formatted = f"#{amount:,.2f}".replace(".", "X").replace(",", " ").replace("X", ",")
-            return formatted
-        except:
-            return amount_str
-
-    def amount_to_words(self, amount_str):
-        """Convert numeric amount to French words"""
-        try:
-            # Remove formatting characters and handle empty input
-            if not amount_str:
-                return ""
-                
-            clean_amount = amount_str.replace('#', '').replace(' ', '').replace(',', '.')
-            
-            # Handle cases where amount is not a valid number
-            try:
-                amount = float(clean_amount)
-            except ValueError:
-                return ""
-            
-            # Handle zero case
-            if amount == 0:
-                return "Zéro dirham"
-            
-            # Split into dirhams and centimes
-            dirhams = int(amount)
-            centimes = int(round((amount - dirhams) * 100))
-            
-            # French number words
-            units = ["", "un", "deux", "trois", "quatre", "cinq", 
-                    "six", "sept", "huit", "neuf"]
-            teens = ["dix", "onze", "douze", "treize", "quatorze", 
-                    "quinze", "seize", "dix-sept", "dix-huit", "dix-neuf"]
-            tens = ["", "dix", "vingt", "trente", "quarante", 
-                   "cinquante", "soixante", "soixante", "quatre-vingt", "quatre-vingt"]
-            
-            def convert_less_than_one_thousand(n):
-                if n < 10:
-                    return units[n]
-                elif n < 20:
-                    return teens[n - 10]
-                elif n < 100:
-                    if n % 10 == 0:
-                        return tens[n // 10]
-                    elif n // 10 == 7 or n // 10 == 9:
-                        return tens[n // 10] + "-" + teens[n % 10]
-                    else:
-                        return tens[n // 10] + "-" + units[n % 10]
-                else:
-                    if n % 100 == 0:
-                        return units[n // 100] + " cent"
-                    else:
-                        return units[n // 100] + " cent " + convert_less_than_one_thousand(n % 100)
-            
-            # Convert dirhams
-            if dirhams == 1:
-                words = "un dirham"
-            else:
-                words = convert_less_than_one_thousand(dirhams) + " dirhams"
-            
-            # Convert centimes if any
-            if centimes > 0:
-                if centimes == 1:
-                    words += " et un centime"
-                else:
-                    words += " et " + convert_less_than_one_thousand(centimes) + " centimes"
+        found = self.payee_records.lookup(payee)
+        if not found:
+            return
             
-            # Capitalize first letter
-            return words.capitalize()
+        rib, bank, city = found[0]
+        self.virement_rib_var.set(rib)
+        self.virement_bank_var.set(bank)
+        if city:
+            self.virement_city_var.set(city)
             
-        except Exception as e:
-            print(f"Error converting amount to words: {e}")
-            return ""
-
-    def get_layout_config(self, field_name):
-        """Get layout configuration for a specific field"""
-        # First check cheque layout
-        if field_name in self.cheque_layout:
-            return self.cheque_layout[field_name]
-        # Then check virement layout
-        elif field_name in self.virement_layout:
-            return self.virement_layout[field_name]
-        # Finally check letter layout
-        elif field_name in self.letter_layout:
-            return self.letter_layout[field_name]
-        return None
-
-    def load_layout_config(self, doc_type):
-        """Load layout configuration for document type"""
-        if doc_type == "cheque":
-            return {
-                "payee": {"x": 35, "y": 45, "max_width": 130, "font": "Arial", "size": 10, "align": "left"},
-                "amount": {"x": 130, "y": 73, "max_width": 31, "font": "Arial", "size": 10, "align": "left"},
-                "amount in letters line 1": {"x": 40, "y": 56, "max_width": 100, "font": "Arial", "size": 10, "align": "center"},
-                "amount in letters line 2": {"x": 10, "y": 51, "max_width": 160, "font": "Arial", "size": 10, "align": "center"},
-                "ville": {"x": 75, "y": 38, "max_width": 35, "font": "Arial", "size": 10, "align": "left"},
-                "date": {"x": 130, "y": 38, "max_width": 30, "font": "Arial", "size": 10, "align": "left"}
-            }
-        elif doc_type == "letter":
-            return {
-                "amount": {"x": 155, "y": 84, "max_width": 40, "font": "Arial", "size": 10, "align": "center"},
-                "amount in letters line 1": {"x": 148, "y": 62, "max_width": 48, "font": "Arial", "size": 10, "align": "left"},
-                "amount in letters line 2": {"x": 148, "y": 58, "max_width": 48, "font": "Arial", "size": 10, "align": "left"},
-                "amount in letters line 3": {"x": 148, "y": 54, "max_width": 48, "font": "Arial", "size": 10, "align": "left"},
-                "payee 1": {"x": 85, "y": 71, "max_width": 110, "font": "Arial", "size": 10, "align": "left"},
-                "payee 2": {"x": 7, "y": 69, "max_width": 55, "font": "Arial", "size": 10, "align": "left"},
-                "due date": {"x": 155, "y": 94, "max_width": 40, "font": "Arial", "size": 10, "align": "center"},
-                "motif": {"x": 85, "y": 56, "max_width": 55, "font": "Arial", "size": 10, "align": "left"},
-                "city and edition date": {"x": 85, "y": 62, "max_width": 55, "font": "Arial", "size": 10, "align": "left"}
-            }
-        elif doc_type == "virement":
-            return {
-                "virement_num": {"x": 50, "y": 250, "max_width": 80, "font": "Arial-Bold", "size": 12, "align": "left"},
-                "amount": {"x": 50, "y": 230, "max_width": 60, "font": "Arial", "size": 12, "align": "left"},
-                "amount in letters line 1": {"x": 50, "y": 210, "max_width": 140, "font": "Arial", "size": 10, "align": "left"},
-                "amount in letters line 2": {"x": 50, "y": 200, "max_width": 140, "font": "Arial", "size": 10, "align": "left"},
-                "payee": {"x": 50, "y": 180, "max_width": 120, "font": "Arial", "size": 10, "align": "left"},
-                "type": {"x": 50, "y": 160, "max_width": 60, "font": "Arial", "size": 10, "align": "left"},
-                "motif": {"x": 50, "y": 140, "max_width": 120, "font": "Arial", "size": 10, "align": "left"},
-                "rib": {"x": 50, "y": 120, "max_width": 100, "font": "Arial", "size": 10, "align": "left"},
-                "bank": {"x": 50, "y": 100, "max_width": 100, "font": "Arial", "size": 10, "align": "left"},
-                "city": {"x": 50, "y": 80, "max_width": 80, "font": "Arial", "size": 10, "align": "left"}
-            }
-        return {}
+        if len(found) > 1:
+            details = "\n".join(f"- RIB {r or '?'} ({b or '?'}, {c or '?'})" for r, b, c in found)
+            messagebox.showwarning("Attention", f"{len(found)} fiches pour {payee}, la première est utilisée:\n{details}")
 
     def update_amount_fields(self, event=None):
         """Update formatted amount and words when amount changes"""
         try:
-            amount = self.amount_var.get()
+            amount_var, words_var = self.amount_vars_for(event.widget if event else None)
+            amount = amount_var.get()
             if not amount:
                 return
                 
-            formatted = self.format_amount(amount)
-            self.amount_var.set(formatted)
-            
-            words = self.amount_to_words(amount)
-            if words:  # Only update if conversion succeeded
-                self.amount_words_var.set(words)
-                self.virement_amount_words_var.set(words)
-                self.letter_amount_words_var.set(words)
+            formatted = format_amount(amount)
+            amount_var.set(formatted)
+            
+            try:
+                words_var.set(amount_to_words(amount))
+            except ValueError:
+                words_var.set("Montant invalide")
         except Exception as e:
             print(f"Error updating amount fields: {e}")
 
+    def amount_vars_for(self, widget):
+        """Return (amount_var, words_var) of the tab owning widget"""
+        if widget is self.virement_amount_entry:
+            return self.virement_amount_var, self.virement_amount_words_var
+        if widget is self.letter_amount_entry:
+            return self.letter_amount_var, self.letter_amount_words_var
+        return self.amount_var, self.amount_words_var
+
+    def collect_cheque_row(self):
+        """Read cheque fields into an engine row"""
+        return {
+            "payee": self.payee_var.get(),
+            "amount": self.amount_var.get(),
+            "city": self.city_var.get(),
+            "date": self.date_var.get()
+        }
+
+    def collect_virement_row(self):
+        """Read virement fields into an engine row"""
+        return {
+            "payee": self.virement_payee_var.get(),
+            "amount": self.virement_amount_var.get(),
+            "type": self.virement_type_var.get(),
+            "motif": self.virement_motif_var.get(),
+            "rib": self.virement_rib_var.get(),
+            "bank": self.virement_bank_var.get(),
+            "city": self.virement_city_var.get()
+        }
+
+    def collect_letter_row(self):
+        """Read lettre de change fields into an engine row"""
+        return {
+            "payee": self.letter_payee_var.get(),
+            "amount": self.letter_amount_var.get(),
+            "due_date": self.letter_due_date_var.get(),
+            "city": self.letter_city_var.get(),
+            "edition_date": self.letter_edition_date_var.get(),
+            "label": self.letter_label_var.get()
+        }
+
+    def check_row(self, doc_type, row):
+        """Validate a form row like a batch row; show its errors and return False if there are any"""
+        errors = [issue.message for issue in validate_batch([row], doc_type) if issue.severity == ISSUE_ERROR]
+        if errors:
+            messagebox.showerror("Erreur", "\n".join(errors))
+            return False
+        return True
+
+    def new_timer(self, run):
+        """Start timing a run; profiles it if requested in the settings (once)"""
+        profile = self.profile_next_var.get()
+        self.profile_next_var.set(False)
+        return StageTimer(run, self.metrics, profile=profile)
+
+    def finish_timer(self, timer, label):
+        """Record a run and show its stage timings in the status bar"""
+        summary = f"{label}: {timer.finish()}"
+        if isinstance(timer.profile, str):
+            summary += f" · profil: {timer.profile}.txt"
+        self.status_var.set(summary)
+
+    def show_metrics(self):
+        """Show p50/p95 stage timings from the metrics file"""
+        messagebox.showinfo("Statistiques", self.metrics.report())
+
+    def start_render(self, key, message, task, timer, label, on_done=None):
+        """Run a render task for one tab in the background, then show its preview"""
+        def done(result):
+            if on_done:
+                on_done(result)
+            with timer.span("aperçu"):
+                self.show_pdf_preview(*result[:2])
+            self.finish_timer(timer, label)
+            
+        def failed(e):
+            messagebox.showerror("Erreur", f"Échec de génération:\n{str(e)}")
+            
+        if not self.worker.submit(key, message, task, done, failed):
+            self.status_var.set("Génération déjà en cours pour cet onglet")
+
+    def render_preview_task(self, doc_type, row, timer):
+        """Background task: render a single document and rasterize its preview"""
+        def task(token):
+            with timer.profiled():
+                with timer.span("rendu"):
+                    pdf_bytes = self.render_document(doc_type, row)
+                token.check()
+                with timer.span("image"):
+                    return pdf_bytes, self.preview_renderer.render(doc_type, row)
+        return task
+
+    def render_document(self, doc_type, row):
+        """Render one document, or read it back if the same document was generated before"""
+        if self.document_cache is None:
+            return self.engine.render_bytes(doc_type, [row])
+        return self.document_cache.render(self.engine, doc_type, row)[0]
+
     def generate_cheque(self):
         """Generate cheque PDF and show preview"""
         try:
-            # Validate fields
-            if not all([self.payee_var.get(), self.amount_var.get(), self.date_var.get()]):
-                messagebox.showerror("Erreur", "Champs obligatoires manquants!")
-                return
-            
-            # Create temporary PDF
-            temp_pdf = tempfile.NamedTemporaryFile(suffix=".pdf", delete=False)
-            temp_pdf_path = temp_pdf.name
-            temp_pdf.close()
-            
-            c = canvas.Canvas(temp_pdf_path, pagesize=(210*mm, 99*mm))
-            
-            # Draw fields using layout config
-            self.draw_field(c, self.payee_var.get(), "payee", 99)
-            self.draw_field(c, f"#{self.amount_var.get()}", "amount", 99)
-            
-            # Amount in words (multi-line)
-            amount_lines = self.amount_words_var.get().split(" et ", 1)
-            self.draw_field(c, amount_lines[0], "amount in letters line 1", 99)
-            if len(amount_lines) > 1:
-                self.draw_field(c, "et " + amount_lines[1], "amount in letters line 2", 99)
-            
-            self.draw_field(c, self.city_var.get(), "ville", 99)
-            self.draw_field(c, self.date_var.get(), "date", 99)
-            
-            c.save()
-            
-            # Show preview instead of saving
-            self.show_pdf_preview(temp_pdf_path)
+            timer = self.new_timer("cheque")
+            with timer.span("validation"):
+                # Validate fields
+                row = self.collect_cheque_row()
+                if not self.check_row("cheque", row):
+                    return
+                row = self.engine.prepare_row(row)
+            self.start_render("cheque", "Génération du chèque...", self.render_preview_task("cheque", row, timer),
+                              timer, "Chèque")
             
         except Exception as e:
             messagebox.showerror("Erreur", f"Échec de génération:\n{str(e)}")
 
     def generate_virement(self):
         """Generate virement PDF and show preview"""
+        ledger = self.ledger  # The one this virement is numbered and journalled in, even if another is loaded meanwhile
+        if not ledger:
+            # Numbers only come from the ledger: counting from scratch would repeat earlier ones
+            messagebox.showerror("Erreur", "Aucun fichier virements chargé: importez-le pour numéroter les virements")
+            return
         try:
-            # Auto-format the amount
-            self.update_amount_fields()
-            
-            # Validate fields
-            if not all([self.virement_payee_var.get(), self.virement_amount_var.get()]):
-                messagebox.showerror("Erreur", "Bénéficiaire et montant sont obligatoires!")
-                return
-            
-            # Auto-numbering
-            current_year = datetime.now().year
-            last_num = self.get_last_virement_number()
-            next_num = f"{current_year}/{(int(last_num.split('/')[1]) + 1):03d}" if last_num and str(current_year) in last_num else f"{current_year}/001"
-            
-            # Create temporary PDF
-            temp_pdf = tempfile.NamedTemporaryFile(suffix=".pdf", delete=False)
-            temp_pdf_path = temp_pdf.name
-            temp_pdf.close()
-            
-            c = canvas.Canvas(temp_pdf_path, pagesize=A4)
-            
-            # Draw fields
-            self.draw_field(c, f"VIR {next_num}", "virement_num", 297)
-            self.draw_field(c, f"#{self.virement_amount_var.get()}", "amount", 297)
-            
-            # Amount in words (multi-line)
-            amount_lines = self.split_amount_text(self.virement_amount_words_var.get())
-            for i, line in enumerate(amount_lines[:3]):  # Max 3 lines
-                self.draw_field(c, line, f"amount in letters line {i+1}", 297)
-            
-            self.draw_field(c, self.virement_payee_var.get(), "payee", 297)
-            self.draw_field(c, self.virement_type_var.get(), "type", 297)
-            self.draw_field(c, self.virement_motif_var.get(), "motif", 297)
-            self.draw_field(c, self.virement_rib_var.get(), "rib", 297)
-            self.draw_field(c, self.virement_bank_var.get(), "bank", 297)
-            self.draw_field(c, self.virement_city_var.get(), "city", 297)
+            timer = self.new_timer("virement")
+            with timer.span("validation"):
+                # Validate fields
+                row = self.collect_virement_row()
+                if not self.check_row("virement", row):
+                    return
+                row = self.engine.prepare_row(row)
             
-            c.save()
+            # Auto-format the amount
+            self.virement_amount_var.set(row["amount"])
+            self.virement_amount_words_var.set(row["amount_words"])
             
-            # Log virement and show preview
-            self.log_virement(next_num)
-            self.show_pdf_preview(temp_pdf_path)
+            def task(token):
+                with timer.profiled():
+                    # Auto-numbering: the number is reserved, and voided if the virement is not issued
+                    with timer.span("numérotation"):
+                        row["virement_num"] = ledger.reserve()[0]
+                    try:
+                        with timer.span("rendu"):
+                            pdf_bytes = self.render_document("virement", row)
+                        token.check()
+                    except BaseException as e:
+                        ledger.void([row["virement_num"]], f"virement non généré: {e}")
+                        raise
+                    
+                    # Log virement; from here on the number is used and the task runs to the end
+                    log_error = None
+                    try:
+                        with timer.span("journal"):
+                            ledger.append([row])
+                    except Exception as e:
+                        log_error = e
+                    with timer.span("image"):
+                        return pdf_bytes, self.preview_renderer.render("virement", row), log_error
+                
+            def logged(result):
+                if result[2] is not None:
+                    messagebox.showwarning("Attention", f"Virement non enregistré:\n{str(result[2])}")
+                elif self.ledger:
+                    self.schedule_ledger_export()
+                    
+            self.start_render("virement", "Génération du virement...", task, timer, "Virement", on_done=logged)
             
         except Exception as e:
             messagebox.showerror("Erreur", f"Échec de génération:\n{str(e)}")
@@ -571,197 +3818,346 @@ class ChequeVirementApp:
     def generate_letter(self):
         """Generate letter PDF and show preview"""
         try:
-            # Validate fields
-            if not all([self.letter_payee_var.get(), self.letter_amount_var.get(), self.letter_due_date_var.get()]):
-                messagebox.showerror("Erreur", "Champs obligatoires manquants!")
-                return
-            
-            # Create temporary PDF
-            temp_pdf = tempfile.NamedTemporaryFile(suffix=".pdf", delete=False)
-            temp_pdf_path = temp_pdf.name
-            temp_pdf.close()
-            
-            c = canvas.Canvas(temp_pdf_path, pagesize=A4)
-            
-            # Draw fields
-            self.draw_field(c, f"#{self.letter_amount_var.get()}", "amount", 297)
-            
-            # Amount in words (multi-line)
-            amount_lines = self.split_amount_text(self.letter_amount_words_var.get())
-            for i, line in enumerate(amount_lines[:3]):  # Max 3 lines
-                self.draw_field(c, line, f"amount in letters line {i+1}", 297)
-            
-            self.draw_field(c, self.letter_payee_var.get(), "payee 1", 297)
-            self.draw_field(c, self.letter_due_date_var.get(), "due date", 297)
-            self.draw_field(c, f"{self.letter_city_var.get()}, le {self.letter_edition_date_var.get()}", 
-                          "city and edition date", 297)
-            self.draw_field(c, self.letter_label_var.get(), "label", 297)
-            
-            c.save()
-            
-            # Show preview
-            self.show_pdf_preview(temp_pdf_path)
+            timer = self.new_timer("letter")
+            with timer.span("validation"):
+                # Validate fields
+                row = self.collect_letter_row()
+                if not self.check_row("letter", row):
+                    return
+                row = self.engine.prepare_row(row)
+            self.start_render("letter", "Génération de la lettre...", self.render_preview_task("letter", row, timer),
+                              timer, "Lettre")
             
         except Exception as e:
             messagebox.showerror("Erreur", f"Échec de génération:\n{str(e)}")
 
-    def draw_field(self, canvas, text, field_name, doc_height_mm):
-        """Generic field drawing method"""
-        config = self.get_layout_config(field_name)
-        if not config:
+    def generate_batch(self):
+        """Generate one multi-page PDF per document type from an Excel/CSV batch"""
+        path = filedialog.askopenfilename(filetypes=[("Lots", "*.xlsx *.xls *.csv")])
+        if not path:
+            return
+        output_dir = filedialog.askdirectory(title="Dossier de sortie")
+        if not output_dir:
             return
             
-        style = ParagraphStyle(
-            name='Field',
-            fontName=config['font'],
-            fontSize=config['size'],
-            alignment=config['align'].upper(),
-            leading=config['size'] * 1.2
-        )
-        p = Paragraph(text, style)
-        p.wrapOn(canvas, config['max_width'] * mm, 1000)
-        y_pos = doc_height_mm*mm - config['y'] * mm - p.height
-        p.drawOn(canvas, config['x'] * mm, y_pos)
-
-    def split_amount_text(self, text, max_line_length=60):
-        """Smart text splitting for amount in words"""
-        if len(text) <= max_line_length:
-            return [text]
-        
-        # Try to split at natural breaks
-        for delimiter in [" et ", ", "]:
-            if delimiter in text:
-                return text.split(delimiter)
-        
-        # Hard split if no natural break found
-        return [text[i:i+max_line_length] for i in range(0, len(text), max_line_length)]
-
-    def get_last_virement_number(self):
-        """Get last virement number from Excel log"""
-        if not hasattr(self, 'virements_db_path') or not self.virements_db_path:
-            return None
-            
+        doc_type = self.batch_types.get(self.batch_type_var.get())
         try:
-            df = pd.read_excel(self.virements_db_path, sheet_name="VIREMENTS")
-            if not df.empty and "ORDER_DE_VIR" in df.columns:
-                return df["ORDER_DE_VIR"].iloc[-1]
-            return None
-        except:
-            return None
+            volume_pages = max(0, self.batch_volume_var.get())
+        except tk.TclError:
+            volume_pages = 0
+        timer = self.new_timer("lot")
 
-    def log_virement(self, virement_num):
-        """Record virement in Excel log"""
-        if not hasattr(self, 'virements_db_path') or not self.virements_db_path:
-            return
+        def check(token):
+            with timer.span("validation"):
+                rows = read_batch_rows(path)
+                return rows, validate_batch(rows, doc_type)
+
+        def checked(result):
+            rows, issues = result
+            errors = sum(issue.severity == ISSUE_ERROR for issue in issues)
+            if errors:
+                self.status_var.set(f"Lot invalide: {errors} erreur(s)")
+                messagebox.showerror("Lot invalide", format_issues(issues))
+                return
+            if not self.ledger and unnumbered_virements(rows, doc_type):
+                messagebox.showerror("Erreur", "Aucun fichier virements chargé: importez-le pour numéroter les virements")
+                return
+            if issues and not messagebox.askyesno("Vérification du lot",
+                                                  f"{format_issues(issues)}\n\nGénérer le lot quand même ?"):
+                return
+            if not self.worker.submit("batch", "Génération du lot...", functools.partial(task, rows), done, failed):
+                self.status_var.set("Un lot est déjà en cours")
+
+        def task(rows, token):
+            def on_page(row_type, page_number, page_count):
+                token.check()
+                if page_number % 50 == 0 or page_number == page_count:
+                    token.report(f"Lot {row_type}: {page_number}/{page_count} pages")
+                    
+            with timer.profiled():
+                with timer.span("rendu"):
+                    results = generate_batch(rows, output_dir, doc_type, ledger=self.ledger,
+                                             engine=self.engine, on_page=on_page,
+                                             workers=min(8, os.cpu_count() or 1), validate=False,
+                                             volume_pages=volume_pages or None, timer=timer)
+                if "virement" in results and self.ledger:
+                    with timer.span("journal"):
+                        self.ledger.append(results["virement"][1])
+            return results
             
-        try:
-            new_data = {
-                "DATE": [datetime.now().strftime("%d/%m/%Y")],
-                "ORDER_DE_VIR": [virement_num],
-                "FOURNISSEUR": [self.virement_payee_var.get()],
-                "MONTANT": [self.virement_amount_var.get()],
-                "MONTANT_EN_LETTRES": [self.virement_amount_words_var.get()],
-                "TYPE_VIR": [self.virement_type_var.get()],
-                "RIB": [self.virement_rib_var.get()],
-                "BANQUE": [self.virement_bank_var.get()],
-                "VILLE": [self.virement_city_var.get()]
-            }
+        def done(results):
+            self.finish_timer(timer, f"Lot ({sum(len(rows) for paths, rows in results.values())} pages)")
+            if "virement" in results:
+                self.schedule_ledger_export()
+            summary = "\n".join(f"{os.path.basename(paths[0])}"
+                                + (f" (+{len(paths) - 1} volume(s))" if len(paths) > 1 else "")
+                                + f": {len(rows)} page(s)"
+                                for paths, rows in results.values())
+            if messagebox.askyesno("Succès", f"Lot généré:\n{summary}\n\nImprimer le lot ?"):
+                for paths, rows in results.values():
+                    for pdf_path in paths:
+                        self.print_pdf(pdf_path)
             
-            df = pd.DataFrame(new_data)
+        def failed(e):
+            messagebox.showerror("Erreur", f"Échec du lot:\n{str(e)}")
             
-            try:
-                with pd.ExcelWriter(self.virements_db_path, engine='openpyxl', mode='a', 
-                                   if_sheet_exists='overlay') as writer:
-                    df.to_excel(writer, sheet_name="VIREMENTS", 
-                               startrow=writer.sheets["VIREMENTS"].max_row, 
-                               header=False, index=False)
-            except:
-                # Create new file if doesn't exist
-                df.to_excel(self.virements_db_path, sheet_name="VIREMENTS", index=False)
-                
+        if not self.worker.submit("batch", "Vérification du lot...", check, checked, failed):
+            self.status_var.set("Un lot est déjà en cours")
+
+    def schedule_ledger_export(self, delay_ms=5000):
+        """Coalesce Excel exports so a burst of virements costs one workbook write"""
+        if self.ledger_export_job is None:
+            self.ledger_export_job = self.root.after(delay_ms, self.export_ledger)
+
+    def export_ledger(self):
+        """Write pending ledger rows to the VIREMENTS sheet"""
+        self.ledger_export_job = None
+        if not self.ledger:
+            return
+        timer = StageTimer("export excel", self.metrics)
+        try:
+            with timer.span("openpyxl"):
+                exported = self.ledger.export_to_excel()
+            if exported:
+                timer.finish(rows=exported)
         except Exception as e:
-            messagebox.showwarning("Attention", f"Virement non enregistré:\n{str(e)}")
+            # Workbook is probably open in Excel: keep rows pending and retry later
+            print(f"Error exporting virements: {e}")
+            self.schedule_ledger_export(delay_ms=60000)
+
+    def on_close(self):
+        """Flush the ledger export before quitting"""
+        self.worker.shutdown()
+        if self.ledger_export_job is not None:
+            self.root.after_cancel(self.ledger_export_job)
+            self.ledger_export_job = None
+        if self.ledger:
+            try:
+                self.ledger.export_to_excel()
+            except Exception as e:
+                messagebox.showwarning("Attention", f"Export Excel des virements impossible:\n{str(e)}")
+            self.ledger.close()
+        if self.document_cache:
+            self.document_cache.close()
+        self.root.destroy()
 
     def import_payee_db(self):
         """Import payee database from Excel"""
         path = filedialog.askopenfilename(filetypes=[("Excel Files", "*.xlsx *.xls")])
-        if path:
-            try:
-                self.payee_db = pd.read_excel(path)
-                self.payee_list = self.payee_db.iloc[:, 0].tolist()  # First column as payee names
+        if not path:
+            return
+        self.load_payee_db(path)
+
+    def load_payee_db(self, path, quiet=False):
+        """Load a payee workbook (through the cache) in the background"""
+        timer = StageTimer("base bénéficiaires", self.metrics)
+        
+        def task(token):
+            with timer.span("chargement"):
+                return load_payee_db(path)
                 
-                # Update all comboboxes
-                self.payee_cb['values'] = self.payee_list
-                self.virement_payee_cb['values'] = self.payee_list
-                self.letter_payee_cb['values'] = self.payee_list
+        def done(result):
+            self.payee_db, self.payee_list, self.payee_index, self.payee_records, from_cache = result
+            timer.finish(rows=len(self.payee_db), cache=from_cache)
+            
+            # Update all comboboxes
+            suggestions = self.payee_index.search("", PAYEE_SUGGESTIONS)
+            self.payee_cb['values'] = suggestions
+            self.virement_payee_cb['values'] = suggestions
+            self.letter_payee_cb['values'] = suggestions
+            
+            try:
+                save_settings(payee_db=os.path.abspath(path))
+            except OSError as e:
+                print(f"Warning: settings not saved: {e}")
                 
-                messagebox.showinfo("Succès", f"Base chargée: {len(self.payee_db)} bénéficiaires")
-            except Exception as e:
+            message = f"Base chargée: {len(self.payee_db)} bénéficiaires"
+            if quiet:
+                self.status_var.set(message + " (" + os.path.basename(path) + ")")
+                return
+            if self.payee_records.duplicates:
+                examples = ", ".join(list(self.payee_records.duplicates)[:5])
+                message += (f"\n\nAttention: {len(self.payee_records.duplicates)} noms ont plusieurs fiches "
+                            f"différentes (ex: {examples})")
+            messagebox.showinfo("Succès", message)
+            
+        def failed(e):
+            if quiet:
+                self.status_var.set(f"Base bénéficiaires non chargée: {str(e)}")
+            else:
                 messagebox.showerror("Erreur", f"Échec du chargement:\n{str(e)}")
+            
+        self.worker.submit("payees", "Chargement des bénéficiaires...", task, done, failed)
+
+    def show_ledger_report(self):
+        """Open the virement totals report (by supplier, month and type)"""
+        if not self.ledger:
+            messagebox.showerror("Erreur", "Aucun fichier virements chargé")
+            return
+            
+        window = tk.Toplevel(self.root)
+        window.title("Rapport des virements")
+        groupings = {"Fournisseur": ("fournisseur",), "Mois": ("mois",), "Type": ("type",),
+                     "Fournisseur et mois": ("fournisseur", "mois"), "Mois et type": ("mois", "type"),
+                     "Fournisseur, mois et type": ("fournisseur", "mois", "type")}
+        group_var = tk.StringVar(value="Fournisseur")
+        from_var = tk.StringVar()
+        to_var = tk.StringVar()
+        
+        controls = ttk.Frame(window, padding=5)
+        controls.pack(fill=tk.X)
+        ttk.Label(controls, text="Regrouper par:").pack(side=tk.LEFT)
+        ttk.Combobox(controls, textvariable=group_var, values=list(groupings), state="readonly",
+                     width=25).pack(side=tk.LEFT, padx=5)
+        ttk.Label(controls, text="Du mois (AAAA-MM):").pack(side=tk.LEFT)
+        ttk.Entry(controls, textvariable=from_var, width=8).pack(side=tk.LEFT, padx=5)
+        ttk.Label(controls, text="au:").pack(side=tk.LEFT)
+        ttk.Entry(controls, textvariable=to_var, width=8).pack(side=tk.LEFT, padx=5)
+        
+        tree = ttk.Treeview(window, show="headings", height=20)
+        tree.pack(fill=tk.BOTH, expand=True)
+        
+        def refresh(*args):
+            group_by = groupings[group_var.get()]
+            headings = [name.capitalize() for name in group_by] + ["Virements", "Montant"]
+            tree.configure(columns=headings)
+            for heading in headings:
+                tree.heading(heading, text=heading)
+            tree.delete(*tree.get_children())
+            for row in self.ledger.report(group_by, from_var.get().strip() or None, to_var.get().strip() or None):
+                *groups, count, invalid, centimes = row
+                label = f"{count}" + (f" ({invalid} montant(s) invalide(s))" if invalid else "")
+                tree.insert("", tk.END, values=[value or "-" for value in groups] + [label, format_centimes(centimes)])
+                
+        group_var.trace_add("write", refresh)
+        ttk.Button(controls, text="Actualiser", command=refresh).pack(side=tk.LEFT, padx=5)
+        refresh()
+
+    def show_reprints(self):
+        """Find a previously generated document (by virement number, payee or date) to view or print again"""
+        if self.document_cache is None:
+            messagebox.showerror("Erreur", "Cache des documents indisponible")
+            return
+            
+        window = tk.Toplevel(self.root)
+        window.title("Réimprimer un document")
+        number_var = tk.StringVar()
+        payee_var = tk.StringVar()
+        date_var = tk.StringVar()
+        
+        controls = ttk.Frame(window, padding=5)
+        controls.pack(fill=tk.X)
+        for label, var, width in (("N° virement:", number_var, 10), ("Bénéficiaire:", payee_var, 25),
+                                  ("Date:", date_var, 10)):
+            ttk.Label(controls, text=label).pack(side=tk.LEFT)
+            ttk.Entry(controls, textvariable=var, width=width).pack(side=tk.LEFT, padx=5)
+        
+        headings = ("Type", "N° virement", "Bénéficiaire", "Date", "Montant", "Généré le")
+        tree = ttk.Treeview(window, columns=headings, show="headings", height=20)
+        for heading in headings:
+            tree.heading(heading, text=heading)
+        tree.pack(fill=tk.BOTH, expand=True)
+        documents = {}
+        
+        def refresh(*args):
+            tree.delete(*tree.get_children())
+            documents.clear()
+            for document in self.document_cache.find(number_var.get().strip(), payee_var.get().strip(),
+                                                      date_var.get().strip(), limit=200):
+                item = tree.insert("", tk.END, values=(document.doc_type, document.virement_num or "-",
+                                                       document.payee, document.date, document.amount,
+                                                       document.created.replace("T", " ")))
+                documents[item] = document
+                
+        def selected_pdf():
+            document = documents.get(tree.focus())
+            if document is None:
+                return None, None
+            pdf_bytes = self.document_cache.get(document.key)
+            if pdf_bytes is None:
+                messagebox.showerror("Erreur", "Document retiré du cache, à générer de nouveau", parent=window)
+            return document, pdf_bytes
+            
+        def preview(*args):
+            document, pdf_bytes = selected_pdf()
+            if pdf_bytes is not None:
+                self.show_pdf_preview(pdf_bytes, self.preview_renderer.render(document.doc_type, document.row))
+                
+        def reprint():
+            document, pdf_bytes = selected_pdf()
+            if pdf_bytes is not None:
+                self.print_pdf(pdf_bytes)
+                
+        ttk.Button(controls, text="Rechercher", command=refresh).pack(side=tk.LEFT, padx=5)
+        buttons = ttk.Frame(window, padding=5)
+        buttons.pack(fill=tk.X)
+        ttk.Button(buttons, text="Aperçu", command=preview).pack(side=tk.LEFT, padx=5)
+        ttk.Button(buttons, text="Imprimer", command=reprint).pack(side=tk.LEFT, padx=5)
+        tree.bind("<Double-1>", preview)
+        window.bind("<Return>", refresh)
+        refresh()
 
     def import_virements_db(self):
         """Import virements database"""
         path = filedialog.askopenfilename(filetypes=[("Excel Files", "*.xlsx *.xls")])
-        if path:
+        if not path:
+            return
+            
+        def done(ledger):
+            if self.ledger:
+                self.export_ledger()
+                self.ledger.close()
+            self.ledger = ledger
             self.virements_db_path = path
             messagebox.showinfo("Succès", "Fichier virements configuré")
+            
+        def failed(e):
+            messagebox.showerror("Erreur", f"Échec du chargement:\n{str(e)}")
+            
+        # Opening a ledger for the first time imports the whole VIREMENTS sheet
+        self.worker.submit("virements", "Chargement des virements...",
+                           lambda token: VirementLedger(path), done, failed)
 
     def import_template(self):
-        """Import Word template"""
-        path = filedialog.askopenfilename(filetypes=[("Word Files", "*.docm *.docx")])
-        if path:
-            self.template_path = path
+        """Import a page background (Word, PDF or scanned image) for the selected document type"""
+        path = filedialog.askopenfilename(filetypes=[("Modèles", "*.docm *.docx *.pdf *.png *.jpg *.jpeg"),
+                                                     ("Word Files", "*.docm *.docx")])
+        if not path:
+            return
+        doc_type = self.batch_types[self.template_type_var.get()]
+
+        def done(template):
+            save_settings(templates=dict(load_settings().get("templates", {}), **{doc_type: path}))
+            self.schedule_live_preview(doc_type)
             messagebox.showinfo("Succès", "Modèle importé")
 
-    def load_layout_config(self, doc_type):
-        """Load layout configuration for document type"""
-        if doc_type == "cheque":
-            return {
-                "payee": {"x": 35, "y": 45, "max_width": 130, "font": "Arial", "size": 10, "align": "left"},
-                "amount": {"x": 130, "y": 73, "max_width": 31, "font": "Arial", "size": 10, "align": "left"},
-                "amount in letters line 1": {"x": 40, "y": 56, "max_width": 100, "font": "Arial", "size": 10, "align": "center"},
-                "amount in letters line 2": {"x": 10, "y": 51, "max_width": 160, "font": "Arial", "size": 10, "align": "center"},
-                "ville": {"x": 75, "y": 38, "max_width": 35, "font": "Arial", "size": 10, "align": "left"},
-                "date": {"x": 130, "y": 38, "max_width": 30, "font": "Arial", "size": 10, "align": "left"}
-            }
-        elif doc_type == "letter":
-            return {
-                "amount": {"x": 155, "y": 84, "max_width": 40, "font": "Arial", "size": 10, "align": "center"},
-                "amount in letters line 1": {"x": 148, "y": 62, "max_width": 48, "font": "Arial", "size": 10, "align": "left"},
-                "amount in letters line 2": {"x": 148, "y": 58, "max_width": 48, "font": "Arial", "size": 10, "align": "left"},
-                "amount in letters line 3": {"x": 148, "y": 54, "max_width": 48, "font": "Arial", "size": 10, "align": "left"},
-                "payee 1": {"x": 85, "y": 71, "max_width": 110, "font": "Arial", "size": 10, "align": "left"},
-                "payee 2": {"x": 7, "y": 69, "max_width": 55, "font": "Arial", "size": 10, "align": "left"},
-                "due date": {"x": 155, "y": 94, "max_width": 40, "font": "Arial", "size": 10, "align": "center"},
-                "motif": {"x": 85, "y": 56, "max_width": 55, "font": "Arial", "size": 10, "align": "left"},
-                "city and edition date": {"x": 85, "y": 62, "max_width": 55, "font": "Arial", "size": 10, "align": "left"}
-            }
-        elif doc_type == "virement":
-            return {
-                "virement_num": {"x": 50, "y": 250, "max_width": 80, "font": "Arial-Bold", "size": 12, "align": "left"},
-                "amount": {"x": 50, "y": 230, "max_width": 60, "font": "Arial", "size": 12, "align": "left"},
-                "amount in letters line 1": {"x": 50, "y": 210, "max_width": 140, "font": "Arial", "size": 10, "align": "left"},
-                "amount in letters line 2": {"x": 50, "y": 200, "max_width": 140, "font": "Arial", "size": 10, "align": "left"},
-                "payee": {"x": 50, "y": 180, "max_width": 120, "font": "Arial", "size": 10, "align": "left"},
-                "type": {"x": 50, "y": 160, "max_width": 60, "font": "Arial", "size": 10, "align": "left"},
-                "motif": {"x": 50, "y": 140, "max_width": 120, "font": "Arial", "size": 10, "align": "left"},
-                "rib": {"x": 50, "y": 120, "max_width": 100, "font": "Arial", "size": 10, "align": "left"},
-                "bank": {"x": 50, "y": 100, "max_width": 100, "font": "Arial", "size": 10, "align": "left"},
-                "city": {"x": 50, "y": 80, "max_width": 80, "font": "Arial", "size": 10, "align": "left"}
-            }
-        return {}
+        def failed(e):
+            messagebox.showerror("Erreur", f"Modèle inutilisable:\n{str(e)}")
 
-    def show_pdf_preview(self, pdf_path):
+        # Word templates go through LibreOffice the first time, which takes a few seconds
+        self.worker.submit("template", "Conversion du modèle...",
+                           lambda token: self.preview_renderer.set_template(doc_type, path), done, failed)
+
+    def remove_template(self):
+        """Stop drawing a background under the selected document type"""
+        doc_type = self.batch_types[self.template_type_var.get()]
+        self.preview_renderer.set_template(doc_type, None)
+        templates = load_settings().get("templates", {})
+        templates.pop(doc_type, None)
+        save_settings(templates=templates)
+        self.schedule_live_preview(doc_type)
+
+    def show_pdf_preview(self, pdf_bytes, img=None):
         """Display PDF preview in a new window"""
         try:
-            from pdf2image import convert_from_path
-            images = convert_from_path(pdf_path, dpi=100)
+            if img is None:
+                img = rasterize_pdf(pdf_bytes, dpi=100)
             
             preview_window = tk.Toplevel(self.root)
             preview_window.title("Aperçu du Document")
             
             # Convert first page to ImageTk
-            img = images[0]
+            from PIL import ImageTk
             img_tk = ImageTk.PhotoImage(img)
             
             # Display image
@@ -773,33 +4169,241 @@ class ChequeVirementApp:
             print_btn = ttk.Button(
                 preview_window, 
                 text="Imprimer", 
-                command=lambda: self.print_pdf(pdf_path)
+                command=lambda: self.print_pdf(pdf_bytes)
             )
             print_btn.pack(pady=10)
             
+            # Add save button
+            save_btn = ttk.Button(
+                preview_window, 
+                text="Enregistrer", 
+                command=lambda: self.save_pdf(pdf_bytes)
+            )
+            save_btn.pack(pady=5)
+            
             # Add close button
             close_btn = ttk.Button(
                 preview_window, 
                 text="Fermer", 
-                command=lambda: [preview_window.destroy(), os.unlink(pdf_path)]
+                command=preview_window.destroy
             )
             close_btn.pack(pady=5)
             
         except Exception as e:
             messagebox.showerror("Erreur", f"Impossible d'afficher l'aperçu:\n{str(e)}")
-            os.unlink(pdf_path)
 
-    def print_pdf(self, pdf_path):
-        """Print the PDF file"""
+    def save_pdf(self, pdf_bytes):
+        """Write the in-memory PDF to a file chosen by the user"""
+        path = filedialog.asksaveasfilename(defaultextension=".pdf", filetypes=[("PDF", "*.pdf")])
+        if path:
+            try:
+                with open(path, "wb") as f:
+                    f.write(pdf_bytes)
+            except Exception as e:
+                messagebox.showerror("Erreur", f"Impossible d'enregistrer:\n{str(e)}")
+
+    def print_pdf(self, document):
+        """Queue an in-memory PDF (or a PDF file) on the print spooler"""
         try:
-            if os.name == 'nt':  # Windows
-                os.startfile(pdf_path, "print")
-            else:  # MacOS and Linux
-                subprocess.run(["lp", pdf_path])
+            job = self.spooler.submit(document, self.printer_var.get().strip(), self.tray_var.get().strip(),
+                                      self.copies_var.get(), self.pages_var.get().strip())
+            self.status_var.set(f"Impression {job.id}: en attente")
         except Exception as e:
             messagebox.showerror("Erreur", f"Impossible d'imprimer:\n{str(e)}")
 
-if __name__ == "__main__":
+    def report_print_job(self, job):
+        """Spooler callback (spooler thread): show the job outcome in the status bar"""
+        if job.status == PRINT_SENT:
+            self.worker.post(f"Impression {job.id}: envoyée" + (f" ({job.request})" if job.request else "")
+                             + f" · {job.timing}")
+        else:
+            self.worker.post(f"Impression {job.id}: échec - {job.error}")
+
+
+def main(argv=None):
+    """Start the GUI, or run a headless batch when --batch is given"""
+    parser = argparse.ArgumentParser(description="Générateur de Documents Bancaires")
+    parser.add_argument("--batch", metavar="FICHIER", help="lot Excel/CSV à générer sans interface")
+    parser.add_argument("--type", choices=DOC_TYPES, help="type de document si le lot n'a pas de colonne DOCUMENT")
+    parser.add_argument("--out", default=".", help="dossier de sortie des PDF")
+    parser.add_argument("--virements", metavar="XLSX", help="journal des virements (numérotation et enregistrement)")
+    parser.add_argument("--layout", metavar="BANQUE", help=f"modèle de la banque (fichier dans {LAYOUT_DIR})")
+    parser.add_argument("--template", action="append", default=[], metavar="TYPE=FICHIER",
+                        help="fond de page (Word, PDF ou image) imprimé sous les documents de ce type")
+    parser.add_argument("--workers", type=int, default=min(8, os.cpu_count() or 1),
+                        help="processus de rendu pour les gros lots (1 = séquentiel)")
+    parser.add_argument("--volume", type=int, metavar="PAGES",
+                        help="découper le lot en fichiers d'au plus PAGES pages (mémoire bornée) avec un index CSV")
+    parser.add_argument("--check", action="store_true",
+                        help="vérifier le lot (montants, dates, RIB, doublons) sans générer")
+    parser.add_argument("--print", dest="printer", nargs="?", const="", metavar="IMPRIMANTE",
+                        help="imprimer le lot (imprimante par défaut si non précisée)")
+    parser.add_argument("--tray", help="bac d'alimentation de l'imprimante")
+    parser.add_argument("--copies", type=int, default=1, help="nombre de copies")
+    parser.add_argument("--report", metavar="GROUPES",
+                        help="totaux des virements (--virements) groupés par fournisseur,mois,type")
+    parser.add_argument("--reservations", nargs="?", const="", metavar="STATUT",
+                        help=f"numéros de virement réservés (--virements): {NUMBER_RESERVED}, {NUMBER_USED} "
+                             f"ou {NUMBER_VOID}, tous si non précisé")
+    parser.add_argument("--reprint", metavar="NUMERO|BENEFICIAIRE",
+                        help="retrouver des documents déjà générés (cache) et les écrire dans --out (--print pour imprimer)")
+    parser.add_argument("--from", dest="month_from", metavar="AAAA-MM", help="premier mois du rapport")
+    parser.add_argument("--to", dest="month_to", metavar="AAAA-MM", help="dernier mois du rapport")
+    parser.add_argument("--serve", nargs="?", const=f"{SERVICE_ADDRESS[0]}:{SERVICE_ADDRESS[1]}",
+                        metavar="[HOTE:]PORT", help="service HTTP/JSON de génération (lots dans --out)")
+    parser.add_argument("--metrics", action="store_true", help="afficher les temps p50/p95 enregistrés et quitter")
+    parser.add_argument("--profile", action="store_true",
+                        help=f"profiler le lot (cProfile + tracemalloc, dans {os.path.join(REGLIO_HOME, 'profiles')})")
+    parser.add_argument("--startup-report", action="store_true",
+                        help="afficher les temps de démarrage (modules, fenêtre, polices)")
+    args = parser.parse_args(argv)
+    startup_mark("modules")
+
+    templates = {}
+    for option in args.template:
+        doc_type, _, path = option.partition("=")
+        if doc_type not in DOC_TYPES or not path:
+            parser.error(f"--template: TYPE=FICHIER attendu, TYPE parmi {', '.join(DOC_TYPES)}: {option}")
+        templates[doc_type] = path
+
+    if args.volume is not None and args.volume < 1:
+        parser.error("--volume: nombre de pages positif attendu")
+
+    if args.metrics:
+        print(MetricsLog().report())
+        return
+
+    if args.report:
+        if not args.virements:
+            parser.error("--report demande --virements")
+        group_by = [name.strip() for name in args.report.split(",") if name.strip()]
+        unknown = [name for name in group_by if name not in VirementLedger.REPORT_COLUMNS]
+        if unknown:
+            parser.error(f"--report: regroupement inconnu {', '.join(unknown)} "
+                         f"(choix: {', '.join(VirementLedger.REPORT_COLUMNS)})")
+        ledger = VirementLedger(args.virements)
+        for *groups, count, invalid, centimes in ledger.report(group_by, args.month_from, args.month_to):
+            line = "\t".join([value or "-" for value in groups] + [str(count), format_centimes(centimes)])
+            print(line + (f"\t({invalid} montant(s) invalide(s))" if invalid else ""))
+        ledger.close()
+        return
+
+    if args.reservations is not None:
+        if not args.virements:
+            parser.error("--reservations demande --virements")
+        if args.reservations not in ("", NUMBER_RESERVED, NUMBER_USED, NUMBER_VOID):
+            parser.error(f"--reservations: statut inconnu {args.reservations}")
+        ledger = VirementLedger(args.virements)
+        for number, status, reserved_at, owner, reason in ledger.reservations(args.reservations or None):
+            print("\t".join([number, status, reserved_at, owner] + ([reason] if reason else [])))
+        ledger.close()
+        return
+
+    if args.reprint:
+        cache = DocumentCache()
+        if VirementLedger.parse_number(args.reprint):
+            documents = cache.find(virement_num=args.reprint)
+        else:
+            documents = cache.find(payee=args.reprint)
+        paths = []
+        for document in documents:
+            pdf_bytes = cache.get(document.key)
+            if pdf_bytes is None:
+                continue
+            name = (document.virement_num or document.key[:12]).replace("/", "-")
+            paths.append(os.path.join(args.out, f"{document.doc_type}_{name}.pdf"))
+            with open(paths[-1], "wb") as f:
+                f.write(pdf_bytes)
+            print(f"{paths[-1]}\t{document.payee}\t{document.date}\t{document.amount}")
+        cache.close()
+        if not paths:
+            print(f"Aucun document en cache pour: {args.reprint}")
+            sys.exit(1)
+        if args.printer is not None:
+            spooler = PrintSpooler()
+            jobs = [spooler.submit(path, args.printer, args.tray, args.copies) for path in paths]
+            spooler.wait()
+            for job in jobs:
+                print(f"Impression {job.id}: {job.status}" + (f" ({job.error})" if job.error else ""))
+        return
+
+    if args.serve:
+        host, _, port = args.serve.rpartition(":")
+        if not port.isdigit():
+            parser.error(f"--serve: port invalide: {args.serve}")
+        ledger = VirementLedger(args.virements) if args.virements else None
+        service = DocumentService(workers=args.workers, bank=args.layout,
+                                  output_dir=args.out,
+                                  ledger=ledger, metrics=MetricsLog(), templates=templates)
+        server = service.serve(host or SERVICE_ADDRESS[0], int(port))
+        service.warm_up()
+        print(f"Service prêt sur http://{server.server_address[0]}:{server.server_address[1]} "
+              f"({service.workers} processus, lots dans {service.output_dir})")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            service.server = None
+            service.close()
+            if ledger:
+                ledger.export_to_excel()
+                ledger.close()
+        return
+
+    if args.batch:
+        timer = StageTimer("lot", MetricsLog(), profile=args.profile)
+        with timer.profiled():
+            with timer.span("validation"):
+                rows = read_batch_rows(args.batch)
+                issues = validate_batch(rows, args.type)
+            if issues:
+                print(format_issues(issues, limit=100))
+            if args.check or any(issue.severity == ISSUE_ERROR for issue in issues):
+                errors = sum(issue.severity == ISSUE_ERROR for issue in issues)
+                print(f"{len(rows)} ligne(s), {errors} erreur(s), {len(issues) - errors} avertissement(s)")
+                sys.exit(1 if errors else 0)
+            if not args.virements and unnumbered_virements(rows, args.type):
+                parser.error("--batch: virements sans numéro (ORDER_DE_VIR), numérotation impossible sans --virements")
+            ledger = VirementLedger(args.virements) if args.virements else None
+            engine = DocumentEngine(bank=args.layout)
+            with timer.span("modèles"):
+                for doc_type, path in templates.items():
+                    engine.set_template(doc_type, path)
+            with timer.span("rendu"):
+                results = generate_batch(rows, args.out, args.type, ledger=ledger,
+                                         engine=engine, workers=args.workers, validate=False,
+                                         volume_pages=args.volume, timer=timer)
+            if ledger:
+                with timer.span("journal"):
+                    if "virement" in results:
+                        ledger.append(results["virement"][1])
+                    ledger.export_to_excel()
+                ledger.close()
+        for paths, rows in results.values():
+            for number, pdf_path in enumerate(paths):
+                pages = min(args.volume, len(rows) - number * args.volume) if args.volume else len(rows)
+                print(f"{pdf_path}: {pages} page(s)")
+        print(timer.finish(pages=sum(len(rows) for paths, rows in results.values())))
+        if args.profile:
+            print(f"Profil: {timer.profile}.txt")
+        startup_mark("lot généré")
+        if args.printer is not None:
+            spooler = PrintSpooler()
+            jobs = [spooler.submit(pdf_path, args.printer, args.tray, args.copies)
+                    for paths, rows in results.values() for pdf_path in paths]
+            spooler.wait()
+            for job in jobs:
+                print(f"Impression {job.id}: {job.status}" + (f" ({job.error})" if job.error else ""))
+        if args.startup_report:
+            print(startup_report())
+        return
+
     root = tk.Tk()
-    app = ChequeVirementApp(root)
+    app = ChequeVirementApp(root, report_startup=args.startup_report)
+    startup_mark("fenêtre créée")
     root.mainloop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,17 @@
+import os
+import shutil
+import sys
+import tempfile
+
+import reportlab
+
+# Settings, caches and templates go to a throwaway home, set before reglio reads it at import
+os.environ.setdefault("REGLIO_HOME", tempfile.mkdtemp(prefix="reglio-tests-"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# register_fonts() loads arial.ttf/arialbd.ttf from the working directory: give it ReportLab's
+# bundled Vera there, so TrueType subsetting is exercised (worker processes included) on any machine
+_fonts = tempfile.mkdtemp(prefix="reglio-fonts-")
+for _source, _target in (("Vera.ttf", "arial.ttf"), ("VeraBd.ttf", "arialbd.ttf")):
+    shutil.copy(os.path.join(os.path.dirname(reportlab.__file__), "fonts", _source), os.path.join(_fonts, _target))
+os.chdir(_fonts)
@@ -0,0 +1,86 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import reglio
+
+
+@pytest.mark.parametrize("amount, centimes", [
+    ("1234", 123400), ("1234.5", 123450), ("1 234,56", 123456), ("#1 234,56", 123456),
+    ("0,005", 1), ("0.004", 0), ("12,", 1200), (17, 1700), (" 3 ", 300),
+])
+def test_parse_amount(amount, centimes):
+    assert reglio.parse_amount(amount) == centimes
+
+
+@pytest.mark.parametrize("amount", ["", "abc", "-5", "1.2.3", "1,000,00", "12e3"])
+def test_parse_amount_rejects(amount):
+    with pytest.raises(ValueError):
+        reglio.parse_amount(amount)
+
+
+def test_parse_amounts_matches_parse_amount():
+    texts = ["1234", "1 234,56", "abc", "", "0,005", "1234"]
+    expected = []
+    for text in texts:
+        try:
+            expected.append(reglio.parse_amount(text))
+        except ValueError:
+            expected.append(None)
+    assert [None if value is pd.NA else value for value in reglio.parse_amounts(texts)] == expected
+    assert reglio.parse_amounts(pd.Series([12, 3])).tolist() == [1200, 300]
+    assert reglio.parse_amounts(pd.Series([1.005, 2.5, -1.0])).tolist()[:2] == [101, 250]
+    assert reglio.parse_amounts(pd.Series([-1.0])).isna().all()
+
+
+@pytest.mark.parametrize("amount, words", [
+    ("0", "Zéro dirham"),
+    ("1", "Un dirham"),
+    ("0,01", "Un centime"),
+    ("0,10", "Dix centimes"),
+    ("21", "Vingt et un dirhams"),
+    ("71", "Soixante et onze dirhams"),
+    ("80", "Quatre-vingts dirhams"),
+    ("81", "Quatre-vingt-un dirhams"),
+    ("91", "Quatre-vingt-onze dirhams"),
+    ("200", "Deux cents dirhams"),
+    ("201", "Deux cent un dirhams"),
+    ("1000", "Mille dirhams"),
+    ("80000", "Quatre-vingt mille dirhams"),
+    ("200000", "Deux cent mille dirhams"),
+    ("1000000", "Un million de dirhams"),
+    ("2000000000", "Deux milliards de dirhams"),
+    ("1500,10", "Mille cinq cents dirhams et dix centimes"),
+    ("999999999999,99", "Neuf cent quatre-vingt-dix-neuf milliards neuf cent quatre-vingt-dix-neuf millions "
+                        "neuf cent quatre-vingt-dix-neuf mille neuf cent quatre-vingt-dix-neuf dirhams "
+                        "et quatre-vingt-dix-neuf centimes"),
+])
+def test_amount_to_words(amount, words):
+    assert reglio.amount_to_words(amount) == words
+
+
+def test_amount_to_words_limits():
+    with pytest.raises(ValueError):
+        reglio.amount_to_words(str(reglio.MAX_WORDS_AMOUNT))
+    with pytest.raises(ValueError):
+        reglio.amount_to_words("douze")
+
+
+def test_amounts_to_words_matches_amount_to_words():
+    rng = np.random.default_rng(5)
+    centimes = np.concatenate([rng.integers(0, 10**14, 2000), rng.integers(0, 10**5, 2000),
+                               [0, 1, 100, 10**8, 10**11, 10**14 - 1, 2 * 10**8 + 1]])
+    texts = [reglio.format_centimes(int(value)) for value in centimes]
+    assert reglio.amounts_to_words(texts).tolist() == [reglio.amount_to_words(text) for text in texts]
+
+
+def test_amounts_to_words_marks_invalid_amounts_missing():
+    words = reglio.amounts_to_words(pd.Series(["12", "abc", str(reglio.MAX_WORDS_AMOUNT), None], index=[5, 6, 7, 8]))
+    assert words.index.tolist() == [5, 6, 7, 8]
+    assert words[5] == "Douze dirhams"
+    assert words[[6, 7, 8]].isna().all()
+
+
+def test_format_amount():
+    assert reglio.format_amount("1234567.8") == "#1 234 567,80"
+    assert reglio.format_amount("n/a") == "n/a"
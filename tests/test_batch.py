@@ -0,0 +1,116 @@
+from datetime import datetime
+
+import openpyxl
+import pytest
+
+import reglio
+
+
+def write_workbook(path, header, *rows):
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.append(header)
+    for row in rows:
+        ws.append(row)
+    wb.save(path)
+    return path
+
+
+def test_read_batch_rows_excel_date_cells(tmp_path):
+    path = write_workbook(tmp_path / "lot.xlsx", ["DOCUMENT", "BENEFICIAIRE", "MONTANT", "DATE", "VILLE"],
+                          ["cheque", "Société Dupont", 1250.5, datetime(2026, 10, 18), "Alger"],
+                          ["cheque", "Martin", "300", "19/10/2026", "Oran"],
+                          ["cheque", "Durand", 12, None, "Blida"])
+    rows = reglio.read_batch_rows(str(path))
+    assert [row["date"] for row in rows] == ["18/10/2026", "19/10/2026", ""]
+    assert rows[0]["payee"] == "Société Dupont"
+    assert rows[0]["amount"] == "1250.5"
+    assert rows[2]["amount"] == "12"
+    assert not [issue for issue in reglio.validate_batch(rows[:2]) if issue.field == "date"]
+
+
+def batch_rows(n, document="virement"):
+    return [{"document": document, "payee": f"Fournisseur {i}", "amount": f"{100 + i},50", "city": "Alger",
+             "date": "18/10/2026", "rib": "007999990001234567890123", "bank": "BNA", "type": "Ordinaire",
+             "motif": f"Facture {i}"} for i in range(n)]
+
+
+def test_generate_batch_refuses_unnumbered_virements_without_ledger(tmp_path):
+    rows = batch_rows(3)
+    assert reglio.unnumbered_virements(rows) == 3
+    with pytest.raises(ValueError, match="sans journal"):
+        reglio.generate_batch(rows, str(tmp_path), validate=False)
+    assert not list(tmp_path.iterdir())
+
+    numbered = [dict(row, virement_num=f"2026/{i + 1:03d}") for i, row in enumerate(rows)]
+    assert reglio.unnumbered_virements(numbered) == 0
+    (paths, prepared), = reglio.generate_batch(numbered, str(tmp_path), validate=False).values()
+    assert [row["virement_num"] for row in prepared] == ["2026/001", "2026/002", "2026/003"]
+
+
+def test_generate_batch_reserves_virement_numbers_in_ledger(tmp_path):
+    ledger = reglio.VirementLedger(str(tmp_path / "virements.xlsx"))
+    try:
+        first = reglio.generate_batch(batch_rows(2) + batch_rows(1, "cheque"), str(tmp_path), ledger=ledger,
+                                      validate=False)
+        second = reglio.generate_batch(batch_rows(2), str(tmp_path), ledger=ledger, validate=False)
+        numbers = [row["virement_num"] for result in (first, second) for row in result["virement"][1]]
+        assert len(set(numbers)) == 4
+        assert [int(number.split("/")[1]) for number in numbers] == [1, 2, 3, 4]
+        assert "virement_num" not in first["cheque"][1][0]
+    finally:
+        ledger.close()
+
+
+def rib(bank_code="007", account="780000123456789012"):
+    """A 24-digit RIB with a valid key"""
+    body = bank_code + account[:19].rjust(19, "0")
+    return body + f"{97 - int(body) * 100 % 97:02d}"
+
+
+def issues_by_field(rows, doc_type=None):
+    return {(issue.line, issue.field, issue.severity) for issue in reglio.validate_batch(rows, doc_type)}
+
+
+def test_validate_batch_clean_rows():
+    rows = [{"payee": "Atlas", "amount": "1 250,50", "date": "18/10/2026", "rib": rib(), "bank": "Attijariwafa bank"},
+            {"payee": "Cèdre", "amount": "12", "date": "2026-10-19", "rib": rib("011"), "bank": "BMCE"}]
+    assert reglio.validate_batch(rows, "virement") == []
+
+
+def test_validate_batch_reports_each_problem_on_its_line():
+    E, W = reglio.ISSUE_ERROR, reglio.ISSUE_WARNING
+    rows = [
+        {"document": "chèque", "payee": "A", "amount": "1", "date": "18/10/2026"},          # 2: unknown type
+        {"document": "cheque", "amount": "1", "date": "18/10/2026"},                        # 3: payee missing
+        {"document": "cheque", "payee": "B", "amount": "abc", "date": "18/10/2026"},        # 4: bad amount
+        {"document": "cheque", "payee": "C", "amount": "10" + "0" * 12, "date": "18/10/2026"},  # 5: too large
+        {"document": "cheque", "payee": "D", "amount": "0", "date": "18/10/2026"},          # 6: zero amount
+        {"document": "cheque", "payee": "E", "amount": "5", "date": "31/02/2026"},          # 7: bad date
+        {"document": "letter", "payee": "F", "amount": "5"},                                # 8: due date missing
+        {"document": "virement", "payee": "G", "amount": "5", "rib": "12345"},              # 9: RIB length
+        {"document": "virement", "payee": "H", "amount": "5", "rib": rib()[:-2] + "00"},    # 10: RIB key
+        {"document": "virement", "payee": "I", "amount": "5", "rib": rib("011"), "bank": "Attijariwafa"},  # 11
+        {"document": "virement", "payee": "J", "amount": "5", "rib": rib("999"), "bank": "Banque inconnue"},  # 12: ok
+    ]
+    assert issues_by_field(rows) == {
+        (2, "document", E), (3, "payee", E), (4, "amount", E), (5, "amount", E), (6, "amount", W),
+        (7, "date", E), (8, "due_date", E), (9, "rib", E), (10, "rib", E), (11, "bank", E),
+    }
+
+
+def test_validate_batch_flags_duplicate_payments_against_first_line():
+    rows = [{"payee": "Société Atlas", "amount": "100", "date": "18/10/2026"},
+            {"payee": "Autre", "amount": "100", "date": "18/10/2026"},
+            {"payee": "SOCIETE ATLAS", "amount": "100,00", "date": "18/10/2026"},
+            {"payee": "Société Atlas", "amount": "100", "date": "19/10/2026"}]
+    issues = reglio.validate_batch(rows, "cheque")
+    assert [(issue.line, issue.severity) for issue in issues] == [(4, reglio.ISSUE_WARNING)]
+    assert issues[0].message.endswith("ligne 2")
+
+
+def test_format_issues_limit():
+    issues = [reglio.BatchIssue(line, "amount", reglio.ISSUE_ERROR, "Montant invalide") for line in range(2, 8)]
+    text = reglio.format_issues(issues, limit=2)
+    assert text.splitlines() == ["Ligne 2 (erreur): Montant invalide", "Ligne 3 (erreur): Montant invalide",
+                                 "... et 4 autre(s)"]
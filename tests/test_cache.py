@@ -0,0 +1,92 @@
+import json
+import os
+import time
+
+import pytest
+
+import reglio
+
+
+@pytest.fixture(scope="module")
+def engine():
+    return reglio.DocumentEngine()
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = reglio.DocumentCache(str(tmp_path / "documents"), max_bytes=10000)
+    yield cache
+    cache.close()
+
+
+def cheque(payee, amount="12"):
+    return {"payee": payee, "amount": amount, "amount_words": reglio.amount_to_words(amount), "date": "18/10/2026"}
+
+
+def indexed_size(cache):
+    return cache.conn.execute("SELECT COALESCE(SUM(size), 0) FROM documents").fetchone()[0]
+
+
+def test_render_stores_then_reads_back(engine, tmp_path):
+    cache = reglio.DocumentCache(str(tmp_path))
+    try:
+        pdf, hit = cache.render(engine, "cheque", cheque("Atlas"))
+        assert not hit and pdf.startswith(b"%PDF")
+        assert cache.render(engine, "cheque", cheque("Atlas")) == (pdf, True)
+        assert cache.render(engine, "cheque", cheque("Cèdre"))[1] is False
+        assert cache.render(engine, "letter", cheque("Atlas"))[1] is False
+    finally:
+        cache.close()
+
+
+def test_key_depends_on_row_type_and_layout(cache, engine, tmp_path):
+    key = cache.key(engine, "cheque", cheque("Atlas"))
+    assert key == cache.key(engine, "cheque", cheque("Atlas"))
+    assert key != cache.key(engine, "cheque", cheque("Atlas", "13"))
+    assert key != cache.key(engine, "letter", cheque("Atlas"))
+
+    (tmp_path / "banque.json").write_text(json.dumps({"cheque": {"payee": {"x": 40}}}))
+    other = reglio.DocumentEngine(bank="banque", layout_cache=reglio.LayoutCache(str(tmp_path)))
+    assert key != cache.key(other, "cheque", cheque("Atlas"))
+
+
+def test_storing_a_key_again_keeps_the_size_exact(cache):
+    for size in (100, 300, 200):
+        cache.put("k" * 64, "cheque", cheque("Atlas"), b"x" * size)
+    cache.put("j" * 64, "cheque", cheque("Cèdre"), b"y" * 50)
+    assert cache.size == indexed_size(cache) == 250
+
+
+def test_eviction_drops_least_recently_used(cache):
+    keys = [f"{n:064d}" for n in range(4)]
+    for key in keys:
+        cache.put(key, "cheque", cheque(key[-1]), b"x" * 2500)
+        time.sleep(0.002)
+    assert cache.get(keys[0]) is not None  # Now the most recently used
+    time.sleep(0.002)
+    cache.put("f" * 64, "cheque", cheque("f"), b"x" * 2500)  # 12500 > max_bytes: back under 9000
+    remaining = {key for key, in cache.conn.execute("SELECT key FROM documents")}
+    assert remaining == {keys[0], keys[3], "f" * 64}
+    assert cache.size == indexed_size(cache) == 7500
+    assert cache.get(keys[1]) is None and not os.path.exists(cache.path(keys[1]))
+
+
+def test_find_by_number_payee_and_date(cache):
+    cache.put("a" * 64, "virement", dict(cheque("Société Atlas"), virement_num="VIR 2026/7"), b"1")
+    cache.put("b" * 64, "cheque", dict(cheque("Cèdre"), date="19/10/2026"), b"2")
+    assert [found.key for found in cache.find(virement_num="2026/007")] == ["a" * 64]
+    assert [found.key for found in cache.find(payee="societe")] == ["a" * 64]
+    assert [found.payee for found in cache.find(date="19/10/2026")] == ["Cèdre"]
+    assert {found.key for found in cache.find()} == {"a" * 64, "b" * 64}
+    assert cache.find(virement_num="2026/007")[0].row["payee"] == "Société Atlas"
+
+
+def test_size_survives_reopening(tmp_path):
+    cache = reglio.DocumentCache(str(tmp_path), max_bytes=10000)
+    cache.put("a" * 64, "cheque", cheque("Atlas"), b"x" * 1234)
+    cache.close()
+    cache = reglio.DocumentCache(str(tmp_path), max_bytes=10000)
+    try:
+        assert cache.size == 1234
+    finally:
+        cache.close()
@@ -0,0 +1,79 @@
+import json
+import os
+
+import pytest
+
+import reglio
+
+
+def write_layout(directory, bank, layout, mtime=None):
+    path = directory / f"{bank}.json"
+    path.write_text(json.dumps(layout), encoding="utf-8")
+    if mtime is not None:
+        os.utime(path, ns=(mtime, mtime))
+    return path
+
+
+def test_builtin_layout_without_bank():
+    cache = reglio.LayoutCache("/nonexistent")
+    layout = cache.get()
+    assert layout is cache.get(None)
+    assert set(layout.plans) == set(reglio.DOC_TYPES)
+    assert cache.banks() == []
+
+
+def test_bank_file_overrides_builtin_fields(tmp_path):
+    write_layout(tmp_path, "bna", {"cheque": {"payee": {"x": 40}, "memo": {
+        "x": 10, "y": 10, "max_width": 50, "font": "Arial", "size": 8, "align": "right"}}})
+    cache = reglio.LayoutCache(str(tmp_path))
+    layout = cache.get("bna")
+    assert cache.banks() == ["bna"]
+    assert layout.layouts["cheque"]["payee"]["x"] == 40
+    assert layout.layouts["cheque"]["payee"]["y"] == reglio.load_layout_config("cheque")["payee"]["y"]
+    assert layout.plans["cheque"]["memo"].align == "right"
+    with pytest.raises(TypeError):
+        layout.layouts["cheque"]["payee"] = {}  # Compiled layouts are shared: read-only
+
+
+def test_layout_recompiled_only_when_content_changes(tmp_path):
+    write_layout(tmp_path, "bna", {"cheque": {"payee": {"x": 40}}}, mtime=10**18)
+    cache = reglio.LayoutCache(str(tmp_path))
+    first = cache.get("bna")
+    assert cache.get("bna") is first
+
+    write_layout(tmp_path, "bna", {"cheque": {"payee": {"x": 40}}}, mtime=2 * 10**18)  # Touched only
+    assert cache.get("bna") is first
+
+    write_layout(tmp_path, "bna", {"cheque": {"payee": {"x": 45}}}, mtime=3 * 10**18)
+    changed = cache.get("bna")
+    assert changed is not first and changed.layouts["cheque"]["payee"]["x"] == 45
+
+
+def test_broken_edit_keeps_last_good_layout(tmp_path, capsys):
+    write_layout(tmp_path, "bna", {"cheque": {"payee": {"x": 40}}}, mtime=10**18)
+    cache = reglio.LayoutCache(str(tmp_path))
+    good = cache.get("bna")
+    (tmp_path / "bna.json").write_text('{"cheque": {"payee": ', encoding="utf-8")
+    assert cache.get("bna") is good
+    assert "keeping previous version" in capsys.readouterr().out
+
+
+@pytest.mark.parametrize("layout, message", [
+    ({"cheque": {"payee": "x"}}, "Modèle invalide"),
+    ({"facture": {}}, "type de document inconnu"),
+    ({"cheque": {"memo": {"x": 1}}}, r"clé\(s\) manquante\(s\)"),
+    ({"cheque": {"payee": {"align": "middle"}}}, "alignement inconnu"),
+    ({"cheque": {"payee": {"size": "10"}}}, "nombre attendu"),
+])
+def test_invalid_first_load_raises(tmp_path, layout, message):
+    write_layout(tmp_path, "bna", layout)
+    with pytest.raises(ValueError, match=message):
+        reglio.LayoutCache(str(tmp_path)).get("bna")
+
+
+def test_unknown_or_unsafe_bank(tmp_path):
+    cache = reglio.LayoutCache(str(tmp_path))
+    with pytest.raises(ValueError, match="Aucun modèle"):
+        cache.get("absente")
+    with pytest.raises(ValueError, match="Nom de banque invalide"):
+        cache.get("../bna")
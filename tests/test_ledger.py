@@ -0,0 +1,103 @@
+import concurrent.futures
+
+import openpyxl
+import pytest
+
+import reglio
+
+
+@pytest.fixture
+def workbook(tmp_path):
+    return str(tmp_path / "virements.xlsx")
+
+
+@pytest.fixture
+def ledger(workbook):
+    ledger = reglio.VirementLedger(workbook)
+    yield ledger
+    ledger.close()
+
+
+def virement(number, payee="Atlas", amount="#1 250,00", type_vir="Ordinaire"):
+    return {"virement_num": number, "payee": payee, "amount": amount, "amount_words": "", "type": type_vir,
+            "rib": "", "bank": "", "city": ""}
+
+
+def reserve_in_process(workbook, count):
+    ledger = reglio.VirementLedger(workbook)
+    try:
+        return [number for _ in range(count) for number in ledger.reserve(year=2026)]
+    finally:
+        ledger.close()
+
+
+def test_reserve_follows_the_sequence(ledger):
+    assert ledger.reserve(year=2026) == ["2026/001"]
+    assert ledger.reserve(3, year=2026) == ["2026/002", "2026/003", "2026/004"]
+    assert ledger.reserve(0, year=2026) == []
+    assert ledger.last_number() == "2026/004"
+
+
+def test_reserve_rolls_over_each_year(ledger):
+    ledger.reserve(2, year=2026)
+    assert ledger.reserve(year=2027) == ["2027/001"]
+    assert ledger.reserve(year=2026) == ["2026/003"]
+    assert ledger.last_number() == "2027/001"
+
+
+def test_void_only_touches_reserved_numbers(ledger):
+    first, second, third = ledger.reserve(3, year=2026)
+    ledger.append([virement(first)])
+    assert ledger.void([first, second, "2026/999", "n/a"], "rendu impossible") == 1
+    statuses = {number: (status, reason) for number, status, reserved_at, owner, reason in ledger.reservations()}
+    assert statuses == {first: (reglio.NUMBER_USED, None), second: (reglio.NUMBER_VOID, "rendu impossible"),
+                        third: (reglio.NUMBER_RESERVED, None)}
+    assert [row[0] for row in ledger.reservations(reglio.NUMBER_VOID, 2026)] == [second]
+    # Voided numbers are never handed out again
+    assert ledger.reserve(year=2026) == ["2026/004"]
+
+
+def test_reservations_are_unique_across_processes(workbook):
+    reglio.VirementLedger(workbook).close()
+    with concurrent.futures.ProcessPoolExecutor(max_workers=4) as pool:
+        numbers = [number for numbers in pool.map(reserve_in_process, [workbook] * 4, [15] * 4) for number in numbers]
+    assert sorted(numbers) == [f"2026/{n:03d}" for n in range(1, 61)]
+
+
+def test_new_journal_continues_the_workbook_sequence(workbook):
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = "VIREMENTS"
+    ws.append(reglio.VirementLedger.COLUMNS)
+    ws.append(["18/10/2026", "2026/041", "Atlas", "#100,00", "Cent dirhams", "Ordinaire", "", "", ""])
+    ws.append(["19/10/2026", "2026/007", "Cèdre", "#50,50", "", "Urgent", "", "", ""])
+    wb.save(workbook)
+
+    ledger = reglio.VirementLedger(workbook)
+    try:
+        assert ledger.reserve(year=2026) == ["2026/042"]
+        assert ledger.pending_export() == []
+        assert ledger.report(("fournisseur",)) == [("Atlas", 1, 0, 10000), ("Cèdre", 1, 0, 5050)]
+    finally:
+        ledger.close()
+
+
+def test_export_appends_pending_rows_once(ledger, workbook):
+    number, = ledger.reserve(year=2026)
+    ledger.append([virement(number)])
+    assert len(ledger.pending_export()) == 1
+    assert ledger.export_to_excel() == 1
+    assert ledger.export_to_excel() == 0
+    rows = list(openpyxl.load_workbook(workbook)["VIREMENTS"].iter_rows(values_only=True))
+    assert rows[0] == reglio.VirementLedger.COLUMNS
+    assert [row[1] for row in rows[1:]] == [number]
+
+
+def test_report_totals(ledger):
+    ledger.append([virement("2026/001", amount="#100,00"), virement("2026/002", amount="#0,50"),
+                   virement("2026/003", payee="Cèdre", amount="invalide", type_vir="Urgent")])
+    assert ledger.report(("fournisseur", "type")) == [("Atlas", "Ordinaire", 2, 0, 10050),
+                                                      ("Cèdre", "Urgent", 1, 1, 0)]
+    month = reglio.ledger_month(reglio.datetime.now().strftime("%d/%m/%Y"))
+    assert ledger.report((), month, month) == [(3, 1, 10050)]
+    assert ledger.report(("mois",), "1999-01", "1999-12") == []
@@ -0,0 +1,55 @@
+import random
+
+import pandas as pd
+import pytest
+
+import reglio
+
+
+def reference_search(names, query, limit):
+    """PayeeIndex ranking spelled out: exact/prefix, word prefix, substring, alphabetical within each"""
+    query = reglio.normalize_text(query).strip()
+    ranked = sorted((reglio.normalize_text(name), name) for name in names)
+
+    def rank(key):
+        if key.startswith(query):
+            return 0
+        if any(word.startswith(query) for word in key.split()):
+            return 1
+        return 2 if len(query) >= 3 and query in key else None
+    matches = [(rank(key), key, name) for key, name in ranked if rank(key) is not None]
+    return [name for _, _, name in sorted(matches)][:limit]
+
+
+@pytest.fixture(scope="module")
+def names():
+    rng = random.Random(7)
+    words = ["Société", "Cèdre", "Cedres", "Étoile", "étoiles", "Atlas", "Médical", "SARL", "Oasis", "Ets", "El"]
+    return list(dict.fromkeys(" ".join(rng.choice(words) for _ in range(rng.randint(1, 4))) + f" {i % 37}"
+                              for i in range(3000)))
+
+
+@pytest.mark.parametrize("query", ["cedre", "CÈDRE", "etoile", "sarl 1", "dical", "s", "e", "cedres cedre", "zz"])
+@pytest.mark.parametrize("limit", [1, 5, 50, 5000])
+def test_search_matches_reference(names, query, limit):
+    index = reglio.PayeeIndex(names)
+    assert index.search(query, limit) == reference_search(names, query, limit)
+
+
+def test_search_names_with_several_matching_words_once():
+    index = reglio.PayeeIndex(["Cedre Cedres", "Cedres", "Le Cedre"])
+    assert index.search("ced") == ["Cedre Cedres", "Cedres", "Le Cedre"]
+
+
+def test_empty_query_lists_names_alphabetically():
+    assert reglio.PayeeIndex(["b", "A", "é"]).search("", 2) == ["A", "b"]
+
+
+
+def test_payee_records_lookup_and_duplicates():
+    df = pd.DataFrame([["Société Dupont", "0079", "BNA", "Alger"], ["SOCIETE DUPONT ", "0079", "BNA", "Alger"],
+                       ["Martin", "1", "CPA", "Oran"], ["martin", "2", "CPA", "Oran"], ["", "3", "X", "Y"]])
+    records = reglio.PayeeRecords(df)
+    assert records.lookup("societe dupont") == [("0079", "BNA", "Alger")]
+    assert records.lookup("Inconnu") == []
+    assert records.duplicates == {"Martin": [("1", "CPA", "Oran"), ("2", "CPA", "Oran")]}
@@ -0,0 +1,134 @@
+import concurrent.futures
+import re
+import zlib
+
+import pytest
+from reportlab.pdfbase import pdfmetrics
+
+import reglio
+
+
+@pytest.fixture(scope="module")
+def engine():
+    engine = reglio.DocumentEngine()
+    engine.refresh_layouts()
+    return engine
+
+
+def test_single_line_fields_shrink_instead_of_wrapping(engine):
+    plans = engine.plans["cheque"]
+    assert plans["amount"].lines == plans["date"].lines == 1
+    amount = reglio.format_amount("999999999999.99")
+    lines, size = engine.fit_field(plans["amount"], amount)
+    assert lines == (amount,)
+    assert size < plans["amount"].size
+
+
+def test_single_line_field_that_fits_keeps_its_size(engine):
+    plan = engine.plans["cheque"]["date"]
+    assert engine.fit_field(plan, "18/10/2026") == (("18/10/2026",), plan.size)
+
+
+def test_multi_line_fields_wrap(engine):
+    plan = engine.plans["virement"]["motif"]
+    assert plan.lines == reglio.FIELD_MAX_LINES
+    lines, size = engine.fit_field(plan, " ".join(["Facture fournisseur du mois"] * 8))
+    assert 1 < len(lines) <= plan.lines
+
+
+def test_layout_lines_must_be_positive():
+    with pytest.raises(ValueError):
+        reglio.merge_layout({"cheque": {"amount": {"lines": 0}}}, "test.json")
+    merged = reglio.merge_layout({"cheque": {"amount": {"lines": 2}}}, "test.json")
+    assert merged["cheque"]["amount"]["lines"] == 2
+
+
+def sample_rows(n, payee="Société d'Équipement n°{}"):
+    return [{"payee": payee.format(i), "amount": f"{i * 7919 % 100000}.{i % 100:02d}", "city": "Alger",
+             "date": "18/10/2026", "due_date": "30/11/2026", "edition_date": "18/10/2026",
+             "rib": "007999990001234567890123", "bank": "BNA", "type": "Ordinaire",
+             "motif": "Facture " + "du mois " * (i % 5) + str(i), "virement_num": f"2026/{i + 1:03d}"}
+            for i in range(n)]
+
+
+def inflate(stream):
+    return zlib.decompress(stream.stream.encode("latin-1"))
+
+
+def page_streams(pdf):
+    """Decompressed content stream of every page, with the fonts its resources name
+
+    A font is its base name, widths and character map, so pages merged into a
+    canvas that assigned different resource names or subset codes differ too.
+    """
+    pdfrw = pytest.importorskip("pdfrw")
+    pages = []
+    for page in pdfrw.PdfReader(fdata=pdf.decode("latin-1"), verbose=False).pages:
+        fonts = {name: (font.BaseFont, font.FirstChar, font.Widths and list(font.Widths),
+                        font.ToUnicode and inflate(font.ToUnicode))
+                 for name, font in (page.Resources.Font or {}).items()}
+        pages.append((inflate(page.Contents), fonts))
+    return pages
+
+
+@pytest.fixture(scope="module")
+def pool():
+    with concurrent.futures.ProcessPoolExecutor(max_workers=2) as pool:
+        yield pool
+
+
+@pytest.mark.parametrize("doc_type", reglio.DOC_TYPES)
+def test_parallel_merge_matches_sequential_render(engine, pool, doc_type, tmp_path):
+    rows = [engine.prepare_row(row) for row in sample_rows(60)]
+    assert engine.merge_blocker(doc_type, rows) is None
+    output = tmp_path / "parallel.pdf"
+    assert reglio.render_parallel(engine, doc_type, rows, str(output), pool, 2) == len(rows)
+    parallel, sequential = page_streams(output.read_bytes()), page_streams(engine.render_bytes(doc_type, rows))
+    assert len(parallel) == len(rows)
+    assert parallel == sequential
+
+
+def test_merge_blocked_by_characters_outside_repertoire(engine):
+    assert pdfmetrics.getFont(engine.plans["cheque"]["payee"].font)._dynamicFont
+    rows = [engine.prepare_row(row) for row in sample_rows(3, payee="Ŝnow ☃ {}")]
+    assert "répertoire" in engine.merge_blocker("cheque", rows)
+
+
+def test_merge_blocked_by_unchecked_reportlab_release(engine, monkeypatch):
+    monkeypatch.setattr(reglio, "REPORTLAB_MERGE_VERSIONS", ((0, 1), (0, 2)))
+    assert "ReportLab" in engine.merge_blocker("cheque", sample_rows(1))
+
+
+def test_generate_batch_falls_back_before_rendering(engine, tmp_path):
+    timer = reglio.StageTimer("test")
+    pages = []
+    rows = sample_rows(reglio.PARALLEL_MIN_ROWS, payee="Ŝnow ☃ {}")
+    results = reglio.generate_batch(rows, str(tmp_path), "cheque", engine=engine, workers=2, validate=False,
+                                    on_page=lambda doc_type, page, count: pages.append(page), timer=timer)
+    assert pages == list(range(1, len(rows) + 1))
+    assert len(timer.notes) == 1 and "répertoire" in timer.notes[0]
+    (path,), prepared = results["cheque"]
+    with open(path, "rb") as f:
+        assert page_streams(f.read()) == page_streams(engine.render_bytes("cheque", prepared))
+
+
+@pytest.mark.parametrize("doc_type", reglio.DOC_TYPES)
+def test_preview_places_text_where_the_pdf_does(engine, doc_type):
+    row = engine.prepare_row(sample_rows(4)[3])
+    placed = [(round(x, 2), round(baseline, 2))
+              for plan, lines, size in engine.fit_fields(doc_type, row)
+              for x, baseline, line in reglio.place_lines(plan, lines, size)]
+    (stream, fonts), = page_streams(engine.render_bytes(doc_type, [row]))
+    drawn = [(round(float(x), 2), round(float(y), 2))
+             for x, y in re.findall(rb"BT 1 0 0 1 (\S+) (\S+) Tm", stream)]
+    assert drawn == placed
+
+
+def test_preview_renders_every_document_type(engine):
+    pytest.importorskip("PIL")
+    preview = reglio.PreviewRenderer(engine)
+    row = engine.prepare_row(sample_rows(1)[0])
+    for doc_type in reglio.DOC_TYPES:
+        image = preview.render(doc_type, row, dpi=50)
+        assert image.size == preview.page_pixels(doc_type, 50)
+        assert image.convert("L").getextrema()[0] == 0  # Black text drawn on the white page
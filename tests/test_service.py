@@ -0,0 +1,137 @@
+import json
+import os
+import threading
+import time
+
+import pytest
+
+import reglio
+
+
+def row(i=0, **fields):
+    body = "007" + f"{780000123456789000 + i:019d}"
+    return dict({"payee": f"Fournisseur {i}", "amount": f"{100 + i},50", "city": "Alger", "date": "18/10/2026",
+                 "rib": body + f"{97 - int(body) * 100 % 97:02d}", "bank": "BNA", "type": "Ordinaire",
+                 "motif": f"Facture {i}"}, **fields)
+
+
+def call(service, method, path, payload=None):
+    body = b"" if payload is None else json.dumps(payload).encode("utf-8")
+    status, content_type, data = service.handle(method, path, body)
+    return status, data if content_type == "application/pdf" else json.loads(data)
+
+
+def wait_batch(service, batch_id, timeout=60):
+    deadline = time.monotonic() + timeout
+    while True:
+        status, batch = call(service, "GET", f"/batches/{batch_id}")
+        if batch["status"] in (reglio.BATCH_DONE, reglio.BATCH_FAILED) or time.monotonic() > deadline:
+            return batch
+        time.sleep(0.05)
+
+
+@pytest.fixture(scope="module")
+def service(tmp_path_factory):
+    service = reglio.DocumentService(workers=1, output_dir=str(tmp_path_factory.mktemp("service")))
+    yield service
+    service.close()
+
+
+@pytest.fixture
+def ledger_service(service, tmp_path):
+    service.ledger = reglio.VirementLedger(str(tmp_path / "virements.xlsx"))
+    yield service
+    service.ledger.close()
+    service.ledger = None
+
+
+def test_health(service):
+    assert call(service, "GET", "/health") == (200, {"status": "ok", "workers": 1, "layouts": []})
+
+
+def test_render_cheque(service):
+    status, pdf = call(service, "POST", "/render", {"type": "cheque", "row": row()})
+    assert status == 200 and pdf.startswith(b"%PDF")
+
+
+@pytest.mark.parametrize("body, message", [
+    (b"{", "Requête JSON invalide"),
+    (b"[]", "objet attendu"),
+    (b'{"type": "facture", "rows": [{}]}', "Type de document inconnu"),
+    (b'{"type": "cheque", "rows": []}', "Aucune ligne"),
+    (b'{"type": "cheque", "layout": "absente", "rows": [{}]}', "Modèle inconnu"),
+])
+def test_bad_requests(service, body, message):
+    status, content_type, data = service.handle("POST", "/render", body)
+    assert status == 400 and message in json.loads(data)["error"]
+
+
+def test_invalid_rows_are_reported(service):
+    status, error = call(service, "POST", "/render", {"type": "cheque", "rows": [row(), row(1, amount="abc")]})
+    assert status == 400 and "Ligne 3" in error["error"]
+
+
+def test_unnumbered_virements_need_a_ledger(service):
+    status, error = call(service, "POST", "/render", {"type": "virement", "row": row()})
+    assert status == 400 and "sans journal" in error["error"]
+    status, pdf = call(service, "POST", "/render", {"type": "virement", "row": row(virement_num="2026/007")})
+    assert status == 200
+
+
+def test_virements_numbered_from_ledger(ledger_service):
+    for _ in range(2):
+        status, pdf = call(ledger_service, "POST", "/render", {"type": "virement", "rows": [row(0), row(1)]})
+        assert status == 200
+    status, batch = call(ledger_service, "POST", "/batches", {"type": "virement", "rows": [row(2)]})
+    assert wait_batch(ledger_service, batch["id"])["status"] == reglio.BATCH_DONE
+    assert ledger_service.ledger.reserve(1) == ["2026/006"]
+
+
+def test_batch_lifecycle(service):
+    rows = [row(i, due_date="30/11/2026") for i in range(3)]
+    status, batch = call(service, "POST", "/batches", {"type": "letter", "rows": rows})
+    assert status == 202 and batch["rows"] == 3
+    batch = wait_batch(service, batch["id"])
+    assert batch["status"] == reglio.BATCH_DONE and batch["pages"] == 3
+    status, pdf = call(service, "GET", f"/batches/{batch['id']}/pdf")
+    assert status == 200 and pdf.startswith(b"%PDF")
+
+    assert call(service, "GET", "/batches/999999")[0] == 404
+    assert call(service, "GET", "/batches/abc/pdf")[0] == 404
+    assert call(service, "GET", "/inconnu")[0] == 404
+
+
+def test_finished_batches_are_pruned(service, monkeypatch):
+    monkeypatch.setattr(reglio, "SERVICE_MAX_BATCHES", 2)
+    ids = []
+    for i in range(3):
+        status, batch = call(service, "POST", "/batches", {"type": "cheque", "row": row(i)})
+        ids.append(batch["id"])
+        assert wait_batch(service, batch["id"])["status"] == reglio.BATCH_DONE
+    dropped = service.batches[ids[1]].path
+    call(service, "POST", "/batches", {"type": "cheque", "row": row()})
+    assert ids[0] not in service.batches and ids[1] not in service.batches
+    assert call(service, "GET", f"/batches/{ids[1]}/pdf")[0] == 404
+    assert not os.path.exists(dropped)
+    assert ids[2] in service.batches
+
+
+def test_http_server_and_client(service):
+    server = service.serve("127.0.0.1", 0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        client = reglio.ServiceClient(f"http://127.0.0.1:{server.server_address[1]}", timeout=30)
+        assert client.health()["status"] == "ok"
+        assert client.render("cheque", [row()]).startswith(b"%PDF")
+        with pytest.raises(ValueError, match="Type de document inconnu"):
+            client.render("facture", [row()])
+        batch_id = client.submit_batch("cheque", [row(), row(1)])
+        assert client.wait_batch(batch_id, interval=0.05)["status"] == reglio.BATCH_DONE
+        assert client.batch_pdf(batch_id).startswith(b"%PDF")
+        with pytest.raises(RuntimeError, match="Lot inconnu"):
+            client.batch(999999)
+    finally:
+        server.shutdown()
+        server.server_close()
+        service.server = None
@@ -0,0 +1,77 @@
+import os
+import stat
+
+import pytest
+
+import reglio
+
+
+@pytest.fixture
+def lp(tmp_path, monkeypatch):
+    """A stub lp on PATH: logs its arguments (one call per line) and fails when LP_FAIL is set"""
+    log = tmp_path / "lp.log"
+    script = tmp_path / "bin" / "lp"
+    script.parent.mkdir()
+    script.write_text(f"""#!/bin/sh
+if [ -n "$LP_FAIL" ]; then echo "lp: imprimante introuvable" >&2; exit 1; fi
+for path in "$@"; do case "$path" in *.pdf) head -c 5 "$path" >> "{log}.head";; esac; done
+echo "$@" >> "{log}"
+echo "request id is stub-$(wc -l < "{log}" | tr -d ' ') (1 file(s))"
+""")
+    script.chmod(script.stat().st_mode | stat.S_IXUSR)
+    monkeypatch.setenv("PATH", f"{script.parent}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.delenv("REGLIO_LP", raising=False)
+    monkeypatch.setattr(reglio.PrintSpooler, "COALESCE_SECONDS", 0.05)
+    return log
+
+
+def calls(log):
+    return [line.split() for line in log.read_text().splitlines()] if log.exists() else []
+
+
+def test_jobs_with_same_options_share_one_lp_call(lp, tmp_path):
+    document = tmp_path / "cheque.pdf"
+    document.write_bytes(b"%PDF-1.4 cheque")
+    statuses = []
+    spooler = reglio.PrintSpooler(on_status=statuses.append)
+    jobs = [spooler.submit(b"%PDF-1.4 bytes", printer="HP", tray="Tray2", copies=2),
+            spooler.submit(str(document), printer="HP", tray="Tray2", copies=2),
+            spooler.submit(b"%PDF-1.4 other", pages="1-3, 5")]
+    spooler.wait()
+
+    (grouped, single) = sorted(calls(lp), key=len, reverse=True)
+    assert grouped[:6] == ["-d", "HP", "-o", "InputSlot=Tray2", "-n", "2"]
+    assert len(grouped) == 8 and grouped[7] == str(document)
+    assert single[:2] == ["-P", "1-3,5"]
+    assert (tmp_path / "lp.log.head").read_text() == "%PDF-" * 3
+    assert [spooler.status(job.id) for job in jobs] == [reglio.PRINT_SENT] * 3
+    assert jobs[0].request == jobs[1].request != jobs[2].request
+    assert jobs[0].request.startswith("stub-")
+    assert sorted(job.id for job in statuses) == [1, 2, 3]
+    assert all(job.document is None for job in jobs)
+
+
+def test_failed_lp_marks_jobs_failed(lp, monkeypatch):
+    monkeypatch.setenv("LP_FAIL", "1")
+    spooler = reglio.PrintSpooler()
+    job = spooler.submit(b"%PDF-1.4", printer="HP")
+    spooler.wait()
+    assert job.status == reglio.PRINT_FAILED
+    assert job.error == "lp: imprimante introuvable"
+    assert calls(lp) == []
+
+    monkeypatch.delenv("LP_FAIL")
+    retry = spooler.submit(b"%PDF-1.4", printer="HP")
+    spooler.wait()
+    assert retry.status == reglio.PRINT_SENT
+
+
+@pytest.mark.parametrize("options, message", [
+    ({"copies": 0}, "copies invalide"),
+    ({"pages": "1-3;5"}, "Pages invalides"),
+])
+def test_invalid_options_are_refused(lp, options, message):
+    spooler = reglio.PrintSpooler()
+    with pytest.raises(ValueError, match=message):
+        spooler.submit(b"%PDF-1.4", **options)
+    assert spooler.thread is None